@@ -1,8 +1,33 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from fixedint.base import FixedInt, MutableFixedInt
-from fixedint.aliases import *
+from fixedint.base import FixedInt, MutableFixedInt, Flags, set_class_cache, class_cache_info
+from fixedint import aliases
+
+__all__ = ['FixedInt', 'MutableFixedInt', 'Flags', 'set_class_cache', 'class_cache_info', 'FixedIntArray', 'PackedArray', 'kernel'] + aliases.__all__
+
+# Aliases and submodules which are only needed by some programs are loaded on
+# first access, to keep `import fixedint` fast.
+_lazy = {
+    'FixedIntArray': ('fixedint.arrays', 'FixedIntArray'),
+    'PackedArray': ('fixedint.packed', 'PackedArray'),
+    'kernel': ('fixedint.compiler', 'kernel'),
+}
+
+def __getattr__(name):
+    if name in _lazy:
+        import importlib
+        modname, attr = _lazy[name]
+        value = getattr(importlib.import_module(modname), attr)
+    elif name in aliases.__all__:
+        value = getattr(aliases, name)
+    else:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
 
 def test(verbosity=1, repeat=1):
     from fixedint import test_fixedint
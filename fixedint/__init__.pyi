@@ -1,9 +1,19 @@
-from typing import Optional, Type
+from typing import Callable, Optional, Type, TypeVar, overload
 import fixedint.base
+from fixedint.base import Flags as Flags, ClassCacheInfo as ClassCacheInfo
+from fixedint.base import set_class_cache as set_class_cache, class_cache_info as class_cache_info
 from fixedint.aliases import *
+from fixedint.arrays import FixedIntArray as FixedIntArray
+from fixedint.packed import PackedArray as PackedArray
 
 # workaround for being unable to specify multiple inheritance in a type annotation
 class _FixedInt(fixedint.base.FixedInt, int): ...  # type: ignore[misc]
 
-def FixedInt(width: int, signed: bool=True, mutable: Optional[bool] = None) -> Type[_FixedInt]: ...
-def MutableFixedInt(width: int, signed: bool=True) -> Type[fixedint.base.MutableFixedInt]: ...
+def FixedInt(width: int, signed: bool=True, mutable: Optional[bool] = None, lazy: bool=False) -> Type[_FixedInt]: ...
+def MutableFixedInt(width: int, signed: bool=True, lazy: bool=False) -> Type[fixedint.base.MutableFixedInt]: ...
+
+F = TypeVar("F", bound=Callable)
+@overload
+def kernel(func: F, strict: bool=False) -> F: ...
+@overload
+def kernel(func: None=None, strict: bool=False) -> Callable[[F], F]: ...
@@ -1,11 +1,28 @@
-from fixedint import FixedInt, MutableFixedInt
+''' Predefined [Mutable][U]Int{8,16,32,64} classes.
 
-__all__ = []
+The classes are created on first access through the module __getattr__, so
+importing fixedint does not pay for building all of them.
+'''
 
+from fixedint.base import FixedInt
+
+_aliases = {}
 for i in [8,16,32,64]:
     for s in [True, False]:
         for m in [True, False]:
-            cls = FixedInt(i, signed=s, mutable=m)
-            cls.__module__ = __name__
-            __all__ += [cls.__name__]
-            globals()[cls.__name__] = cls
+            _aliases[''.join(['Mutable'*m, 'U'*(not s), 'Int', str(i)])] = (i, s, m)
+
+__all__ = list(_aliases)
+
+def __getattr__(name):
+    try:
+        width, signed, mutable = _aliases[name]
+    except KeyError:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    cls = FixedInt(width, signed=signed, mutable=mutable)
+    cls.__module__ = __name__
+    globals()[name] = cls
+    return cls
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,423 @@
+# -*- coding: utf-8 -*-
+
+import sys
+from array import array
+from fixedint.base import FixedInt, _arith_convert
+from fixedint.base import _bit_table, _popcount_func, _bit_reverse_func, _bswap_func
+
+## Storage selection
+_typecodes = {}
+for _tc in 'bBhHiIlLqQ':
+    _typecodes.setdefault((array(_tc).itemsize, _tc.islower()), _tc)
+del _tc
+
+def _storage_typecode(width, signed):
+    ''' Return the smallest array typecode able to hold rectified values of
+    the given width and signedness, or None if no typecode is wide enough. '''
+    for size in (1, 2, 4, 8):
+        if width <= size * 8:
+            return _typecodes.get((size, signed))
+    return None
+
+def _wrap(dtype, vals):
+    ''' Wrap an iterable of already-rectified values in the storage for dtype. '''
+    tc = _storage_typecode(dtype.width, dtype.signed)
+    if tc is None:
+        return list(vals)
+    return array(tc, vals)
+
+def _copy(data):
+    ''' Copy array storage, detaching it from any external buffer. '''
+    if isinstance(data, memoryview):
+        return array(data.format, data.tobytes())
+    return data[:]
+
+## Elementwise kernels
+_kernel_cache = {}
+_kernel_templates = {
+    'aa': 'def _k(a, b, h, m):\n    return [((x %s y) + h & m) - h for x, y in zip(a, b)]',
+    'as': 'def _k(a, y, h, m):\n    return [((x %s y) + h & m) - h for x in a]',
+    'sa': 'def _k(a, y, h, m):\n    return [((y %s x) + h & m) - h for x in a]',
+    'u':  'def _k(a, y, h, m):\n    return [((%s x) + h & m) - h for x in a]',
+}
+
+def _kernel(kind, op):
+    ''' Return a compiled kernel applying op elementwise and rectifying each
+    result. Rectification uses ((v + h) & m) - h, where h is half the range of
+    a signed type (0 for unsigned types), which is the same as _rectify. '''
+    # The operator is compiled into a list comprehension instead of calling
+    # operator.X and _rectify per element; the per-element call overhead
+    # dominates otherwise.
+    key = (kind, op)
+    try:
+        return _kernel_cache[key]
+    except KeyError:
+        pass
+    ns = {}
+    exec(_kernel_templates[kind] % op, ns)
+    _kernel_cache[key] = k = ns['_k']
+    return k
+
+def _kernel_consts(dtype):
+    width = dtype.width
+    if dtype.signed:
+        return 1 << (width - 1), (1 << width) - 1
+    return 0, (1 << width) - 1
+
+
+class FixedIntArray(object):
+    ''' A compact, homogeneous array of fixed-width integers.
+
+    Values are stored in a contiguous array.array using the smallest machine type
+    able to hold the element type (widths over 64 bits fall back to a list).
+    Indexing returns instances of the element type; slicing returns a new array.
+
+    Arithmetic operators work elementwise against another FixedIntArray of the
+    same length or against a scalar, and follow the same promotion and
+    wraparound rules as FixedInt.
+    '''
+    __slots__ = ('_type', '_data')
+
+    def __init__(self, dtype, initializer=()):
+        if not (isinstance(dtype, type) and issubclass(dtype, FixedInt) and hasattr(dtype, '_rectify')):
+            raise TypeError("dtype must be a concrete FixedInt class")
+        self._type = dtype
+        tc = _storage_typecode(dtype.width, dtype.signed)
+        if isinstance(initializer, int) and not isinstance(initializer, FixedInt):
+            if initializer < 0:
+                raise ValueError("negative array length")
+            if tc is None:
+                self._data = [0] * initializer
+            else:
+                self._data = array(tc, bytes(initializer * array(tc).itemsize))
+        elif isinstance(initializer, FixedIntArray) and (initializer._type.width, initializer._type.signed) == (dtype.width, dtype.signed):
+            self._data = _copy(initializer._data)
+        else:
+            rect = dtype._rectify
+            self._data = _wrap(dtype, [rect(int(v)) for v in initializer])
+
+    @classmethod
+    def frombuffer(cls, dtype, buffer, offset=0, count=None):
+        ''' Create an array sharing memory with a buffer, without copying.
+
+        The buffer must hold values in native byte order, using exactly
+        dtype.width // 8 bytes per value; only types whose width is 8, 16, 32 or
+        64 bits can be shared this way. Writes to the array modify the buffer.
+        '''
+        tc = _storage_typecode(dtype.width, dtype.signed)
+        if tc is None or array(tc).itemsize * 8 != dtype.width:
+            raise ValueError("cannot share a buffer of %d-bit values" % dtype.width)
+        mv = memoryview(buffer).cast('B')
+        size = dtype.width // 8
+        if count is None:
+            count = (len(mv) - offset) // size
+        end = offset + count * size
+        if offset < 0 or count < 0 or end > len(mv):
+            raise ValueError("buffer too small for %d values at offset %d" % (count, offset))
+        return cls._fromdata(dtype, mv[offset:end].cast(tc))
+
+    @classmethod
+    def _fromdata(cls, dtype, data):
+        self = cls.__new__(cls)
+        self._type = dtype
+        self._data = data
+        return self
+
+    @property
+    def dtype(self):
+        ''' Element type of this array. '''
+        return self._type
+
+    @property
+    def width(self):
+        return self._type.width
+
+    @property
+    def signed(self):
+        return self._type.signed
+
+    @property
+    def itemsize(self):
+        ''' Size in bytes of one stored element, or None for list storage. '''
+        if isinstance(self._data, list):
+            return None
+        return self._data.itemsize
+
+    def __len__(self):
+        return len(self._data)
+
+    def __iter__(self):
+        return map(self._type, self._data)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return self._fromdata(self._type, _copy(self._data[item]))
+        return self._type(self._data[item])
+
+    def __setitem__(self, item, value):
+        rect = self._type._rectify
+        if isinstance(item, slice):
+            if isinstance(value, FixedIntArray) and value._type is self._type:
+                self._data[item] = value._data
+            else:
+                self._data[item] = _wrap(self._type, [rect(int(v)) for v in value])
+        else:
+            self._data[item] = rect(int(value))
+
+    def __eq__(self, other):
+        if not isinstance(other, FixedIntArray):
+            return NotImplemented
+        return self._type is other._type and self._data == other._data
+
+    def __ne__(self, other):
+        res = self.__eq__(other)
+        if res is NotImplemented:
+            return res
+        return not res
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '%s(%s, %r)' % (type(self).__name__, self._type.__name__, list(self._data))
+
+    def tolist(self):
+        ''' Return the values of this array as a list of plain ints. '''
+        return list(self._data)
+
+    def tobytes(self, byteorder=sys.byteorder):
+        ''' Encode the values of this array using (width + 7) // 8 bytes each. '''
+        out = bytearray(len(self) * ((self._type.width + 7) // 8))
+        _pack_into(self._type, out, 0, self, byteorder)
+        return bytes(out)
+
+    def __array__(self, dtype=None, copy=None):
+        from fixedint.interop import to_numpy
+        res = to_numpy(self, copy=bool(copy))
+        return res if dtype is None else res.astype(dtype, copy=False)
+
+    def __reduce__(self):
+        # The values are pickled as packed little-endian bytes, which is much
+        # more compact than the list of ints the storage would pickle as.
+        return _frombytes, (self._type, self.tobytes('little'))
+
+    def _check_resizable(self):
+        if isinstance(self._data, memoryview):
+            raise BufferError("cannot resize an array sharing an external buffer")
+
+    def append(self, value):
+        self._check_resizable()
+        self._data.append(self._type._rectify(int(value)))
+
+    def extend(self, values):
+        self._check_resizable()
+        if isinstance(values, FixedIntArray) and values._type is self._type:
+            self._data.extend(values._data)
+        else:
+            rect = self._type._rectify
+            self._data.extend(_wrap(self._type, [rect(int(v)) for v in values]))
+
+    def copy(self):
+        return self._fromdata(self._type, _copy(self._data))
+
+    def _binop(self, other, op, reflected):
+        if isinstance(other, FixedIntArray):
+            if len(other) != len(self):
+                raise ValueError("array length mismatch: %d != %d" % (len(self), len(other)))
+            rt = _arith_convert(self._type, other._type)
+            a, b = self._data, other._data
+            if reflected:
+                a, b = b, a
+            h, m = _kernel_consts(rt)
+            return _kernel('aa', op)(a, b, h, m), rt
+        if not isinstance(other, (int, FixedInt)):
+            return NotImplemented, None
+        rt = _arith_convert(self._type, type(other))
+        h, m = _kernel_consts(rt)
+        return _kernel('sa' if reflected else 'as', op)(self._data, int(other), h, m), rt
+
+    def _unop(self, op):
+        h, m = _kernel_consts(self._type)
+        return self._fromdata(self._type, _wrap(self._type, _kernel('u', op)(self._data, None, h, m)))
+
+    def __invert__(self):
+        return self._unop('~')
+
+    def __neg__(self):
+        return self._unop('-')
+
+    def __pos__(self):
+        return self.copy()
+
+    ## Bit manipulation
+    # These mirror the FixedInt methods of the same names, elementwise. Arrays
+    # whose storage exactly matches the width are processed as raw bytes.
+    def _exact_storage(self):
+        return self.itemsize is not None and self.itemsize * 8 == self._type.width
+
+    def _patterns(self):
+        ''' The values as unsigned width-bit patterns. '''
+        if self._type.signed:
+            m = (1 << self._type.width) - 1
+            return [v & m for v in self._data]
+        return self._data
+
+    def _frompatterns(self, vals):
+        dtype = self._type
+        if dtype.signed:
+            h = 1 << (dtype.width - 1)
+            vals = [(v ^ h) - h for v in vals]
+        return self._fromdata(dtype, _wrap(dtype, vals))
+
+    def _counts(self, vals):
+        width = self._type.width
+        for size in (8, 16, 32, 64):
+            if width < 1 << size:
+                break
+        ct = FixedInt(size, signed=False)
+        return self._fromdata(ct, _wrap(ct, vals))
+
+    def rotl(self, n):
+        ''' Rotate the bits of each value left by n positions. '''
+        w = self._type.width
+        m = (1 << w) - 1
+        n %= w
+        k = w - n
+        return self._frompatterns([(v << n | v >> k) & m for v in self._patterns()])
+
+    def rotr(self, n):
+        ''' Rotate the bits of each value right by n positions. '''
+        return self.rotl(-n)
+
+    def popcount(self):
+        ''' Number of one bits of each value, as an array of unsigned counts. '''
+        if self.itemsize == 1 and self._exact_storage():
+            return self._counts(self._data.tobytes().translate(_bit_table('popcount8')))
+        return self._counts(map(_popcount_func(self._type.width), self._patterns()))
+
+    def clz(self):
+        ''' Number of leading zero bits of each value, as an array of unsigned counts. '''
+        w = self._type.width
+        return self._counts([w - v.bit_length() for v in self._patterns()])
+
+    def ctz(self):
+        ''' Number of trailing zero bits of each value, as an array of unsigned counts. '''
+        w = self._type.width
+        return self._counts([(v & -v).bit_length() - 1 if v else w for v in self._patterns()])
+
+    def bswap(self):
+        ''' Reverse the byte order of each value. The width must be a multiple of 8. '''
+        if self._exact_storage():
+            data = _copy(self._data)
+            data.byteswap()
+            return self._fromdata(self._type, data)
+        return self._frompatterns(map(_bswap_func(self._type.width), self._patterns()))
+
+    def bit_reverse(self):
+        ''' Reverse the bit order of each value. '''
+        if self._exact_storage():
+            data = array(self._data.format if isinstance(self._data, memoryview) else self._data.typecode)
+            data.frombytes(self._data.tobytes().translate(_bit_table('reverse8')))
+            data.byteswap()
+            return self._fromdata(self._type, data)
+        return self._frompatterns(map(_bit_reverse_func(self._type.width), self._patterns()))
+
+
+## Arithmetic methods
+def _arith_factory(name, op, reflected):
+    def _f(self, other):
+        vals, rt = self._binop(other, op, reflected)
+        if vals is NotImplemented:
+            return vals
+        return self._fromdata(rt, _wrap(rt, vals))
+    _f.__name__ = name
+    return _f
+
+def _inplace_factory(name, op):
+    # In-place operators keep the element type of the left operand, like
+    # MutableFixedInt, and write into the existing storage.
+    def _f(self, other):
+        if isinstance(other, FixedIntArray):
+            if len(other) != len(self):
+                raise ValueError("array length mismatch: %d != %d" % (len(self), len(other)))
+            vals = _kernel('aa', op)(self._data, other._data, *_kernel_consts(self._type))
+        elif isinstance(other, (int, FixedInt)):
+            vals = _kernel('as', op)(self._data, int(other), *_kernel_consts(self._type))
+        else:
+            return NotImplemented
+        self._data[:] = _wrap(self._type, vals)
+        return self
+    _f.__name__ = name
+    return _f
+
+_array_binfunc = 'add,+ sub,- mul,* floordiv,// mod,% lshift,<< rshift,>> and,& or,| xor,^'.split()
+_array_rbinfunc = 'add,+ sub,- mul,* floordiv,// mod,% and,& or,| xor,^'.split()
+for f in _array_binfunc:
+    fn, op = f.split(',')
+    setattr(FixedIntArray, '__%s__' % fn, _arith_factory('__%s__' % fn, op, False))
+    setattr(FixedIntArray, '__i%s__' % fn, _inplace_factory('__i%s__' % fn, op))
+for f in _array_rbinfunc:
+    fn, op = f.split(',')
+    setattr(FixedIntArray, '__r%s__' % fn, _arith_factory('__r%s__' % fn, op, True))
+
+
+## Bulk encoding and decoding
+def _frombytes(dtype, data):
+    ''' Unpickle a FixedIntArray. '''
+    return _unpack_from(dtype, data, 0, None, 'little')
+
+def _unpack_from(dtype, buffer, offset, count, byteorder):
+    width = dtype.width
+    size = (width + 7) // 8
+    with memoryview(buffer) as outer, outer.cast('B') as mv:
+        if count is None:
+            count = (len(mv) - offset) // size
+        end = offset + count * size
+        if offset < 0 or count < 0 or end > len(mv):
+            raise ValueError("buffer too small for %d values at offset %d" % (count, offset))
+        with mv[offset:end] as chunk:
+            data = _decode(dtype, chunk, byteorder)
+    return FixedIntArray._fromdata(dtype, data)
+
+def _decode(dtype, chunk, byteorder):
+    width = dtype.width
+    size = (width + 7) // 8
+    tc = _storage_typecode(width, dtype.signed)
+    if tc is not None and array(tc).itemsize == size:
+        # Fast path: the packed layout matches an array typecode
+        data = array(tc)
+        data.frombytes(chunk)
+        if byteorder != sys.byteorder:
+            data.byteswap()
+        if width != size * 8:
+            rect = dtype._rectify
+            data = array(tc, [rect(v) for v in data])
+        return data
+    rect = dtype._rectify
+    from_bytes = int.from_bytes
+    return _wrap(dtype, [rect(from_bytes(chunk[i:i+size], byteorder))
+        for i in range(0, len(chunk), size)])
+
+def _pack_into(dtype, buffer, offset, values, byteorder):
+    width = dtype.width
+    size = (width + 7) // 8
+    tc = _storage_typecode(width, dtype.signed)
+    if isinstance(values, FixedIntArray) and (values.width, values.signed) == (width, dtype.signed):
+        data = values._data
+    else:
+        rect = dtype._rectify
+        data = _wrap(dtype, [rect(int(v)) for v in values])
+    with memoryview(buffer) as outer, outer.cast('B') as mv:
+        end = offset + len(data) * size
+        if offset < 0 or end > len(mv):
+            raise ValueError("buffer too small for %d values at offset %d" % (len(data), offset))
+        if tc is not None and array(tc).itemsize == size:
+            if byteorder != sys.byteorder:
+                data = _copy(data)
+                data.byteswap()
+            with memoryview(data) as raw:
+                mv[offset:end] = raw.cast('B')
+        else:
+            mask = (1 << (size * 8)) - 1
+            for v in data:
+                mv[offset:offset+size] = (v & mask).to_bytes(size, byteorder)
+                offset += size
@@ -0,0 +1,77 @@
+from typing import Iterable, Iterator, List, Optional, Type, TypeVar, Union, overload
+from fixedint.base import FixedInt
+
+ASelf = TypeVar("ASelf", bound="FixedIntArray")
+Operand = Union[int, FixedInt, "FixedIntArray"]
+
+class FixedIntArray:
+    def __init__(self, dtype: Type[FixedInt], initializer: Union[int, Iterable[Union[int, FixedInt]]] = ()): ...
+
+    @classmethod
+    def frombuffer(cls: Type[ASelf], dtype: Type[FixedInt], buffer, offset: int=0, count: Optional[int]=None) -> ASelf: ...
+
+    @property
+    def dtype(self) -> Type[FixedInt]: ...
+    @property
+    def width(self) -> int: ...
+    @property
+    def signed(self) -> bool: ...
+    @property
+    def itemsize(self) -> Optional[int]: ...
+
+    def __len__(self) -> int: ...
+    def __iter__(self) -> Iterator[FixedInt]: ...
+    @overload
+    def __getitem__(self, item: int) -> FixedInt: ...
+    @overload
+    def __getitem__(self: ASelf, item: slice) -> ASelf: ...
+    def __setitem__(self, item: Union[int, slice], value) -> None: ...
+    def tolist(self) -> List[int]: ...
+    def tobytes(self, byteorder: str='little') -> bytes: ...
+    def append(self, value: Union[int, FixedInt]) -> None: ...
+    def extend(self, values: Iterable[Union[int, FixedInt]]) -> None: ...
+    def copy(self: ASelf) -> ASelf: ...
+    def __array__(self, dtype=None, copy: Optional[bool]=None): ...
+
+    def __invert__(self: ASelf) -> ASelf: ...
+    def __neg__(self: ASelf) -> ASelf: ...
+    def __pos__(self: ASelf) -> ASelf: ...
+
+    def rotl(self: ASelf, n: int) -> ASelf: ...
+    def rotr(self: ASelf, n: int) -> ASelf: ...
+    def popcount(self) -> "FixedIntArray": ...
+    def clz(self) -> "FixedIntArray": ...
+    def ctz(self) -> "FixedIntArray": ...
+    def bswap(self: ASelf) -> ASelf: ...
+    def bit_reverse(self: ASelf) -> ASelf: ...
+
+    def __add__(self: ASelf, other: Operand) -> ASelf: ...
+    def __sub__(self: ASelf, other: Operand) -> ASelf: ...
+    def __mul__(self: ASelf, other: Operand) -> ASelf: ...
+    def __floordiv__(self: ASelf, other: Operand) -> ASelf: ...
+    def __mod__(self: ASelf, other: Operand) -> ASelf: ...
+    def __lshift__(self: ASelf, other: Operand) -> ASelf: ...
+    def __rshift__(self: ASelf, other: Operand) -> ASelf: ...
+    def __and__(self: ASelf, other: Operand) -> ASelf: ...
+    def __xor__(self: ASelf, other: Operand) -> ASelf: ...
+    def __or__(self: ASelf, other: Operand) -> ASelf: ...
+
+    def __radd__(self: ASelf, other: Operand) -> ASelf: ...
+    def __rsub__(self: ASelf, other: Operand) -> ASelf: ...
+    def __rmul__(self: ASelf, other: Operand) -> ASelf: ...
+    def __rfloordiv__(self: ASelf, other: Operand) -> ASelf: ...
+    def __rmod__(self: ASelf, other: Operand) -> ASelf: ...
+    def __rand__(self: ASelf, other: Operand) -> ASelf: ...
+    def __rxor__(self: ASelf, other: Operand) -> ASelf: ...
+    def __ror__(self: ASelf, other: Operand) -> ASelf: ...
+
+    def __iadd__(self: ASelf, other: Operand) -> ASelf: ...
+    def __isub__(self: ASelf, other: Operand) -> ASelf: ...
+    def __imul__(self: ASelf, other: Operand) -> ASelf: ...
+    def __ifloordiv__(self: ASelf, other: Operand) -> ASelf: ...
+    def __imod__(self: ASelf, other: Operand) -> ASelf: ...
+    def __ilshift__(self: ASelf, other: Operand) -> ASelf: ...
+    def __irshift__(self: ASelf, other: Operand) -> ASelf: ...
+    def __iand__(self: ASelf, other: Operand) -> ASelf: ...
+    def __ior__(self: ASelf, other: Operand) -> ASelf: ...
+    def __ixor__(self: ASelf, other: Operand) -> ASelf: ...
@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 
+import copyreg
 import sys
-from fixedint.compat import *
-from weakref import WeakValueDictionary
+from _thread import allocate_lock
+from collections import OrderedDict, namedtuple
+from functools import partial
+from weakref import WeakValueDictionary, ref as _ref
 
 class FixedProperty(object):
     def __init__(self, val, doc):
@@ -18,27 +21,33 @@ class FixedMetaProperty(object):
         self.name = name
         self.__doc__ = doc
     def __get__(self, obj, type=None):
-        if self.name not in obj.__dict__:
-            # this should only happen when trying to access FixedInt.prop, which help() does
-            raise AttributeError("Attribute %s not defined on base class" % self.name)
-        prop = obj.__dict__[self.name]
-        return prop.__get__(obj)
+        for klass in obj.__mro__:
+            if self.name in klass.__dict__:
+                return klass.__dict__[self.name].__get__(obj)
+        # this should only happen when trying to access FixedInt.prop, which help() does
+        raise AttributeError("Attribute %s not defined on base class" % self.name)
     def __set__(self, obj, value):
         raise AttributeError("property %s is read-only" % self.name)
 
-if not PY3K:
-    # While it'd be nice to put machine-sized integers into Python 2.x "int"s,
-    # it turns out that the int methods occasionally freak out when given longs.
-    # So, we use arbitrary-precision ints for all Pythons.
-    int = long
-
 _class_cache = WeakValueDictionary()
+# Classes referenced nowhere else, such as those created by slicing, would be
+# collected and rebuilt over and over, so the most recently used ones are also
+# kept alive here. Lookups try this tier first. See set_class_cache.
+_class_lru = OrderedDict()
+_class_lru_maxsize = 128
+_class_lru_evictions = 0
 
 _doc_width = "Bit width of this integer, including the sign bit."
 _doc_signed = "True if this integer is a twos-complement signed type."
 _doc_mutable = "True if this integer is mutable (modifiable in-place)."
 _doc_minval = "Minimum representable value of this integer type"
 _doc_maxval = "Maximum representable value of this integer type"
+_doc_lazy = "True if in-place results are only rectified when the value is read."
+
+# Powers of at most this many bits are computed exactly and then truncated,
+# which is faster than modular exponentiation for small results; larger ones
+# are computed modulo 2**width.
+_pow_exact_bits = 1024
 
 _subclass_token = object()
 class _FixedIntBaseMeta(type):
@@ -53,18 +62,24 @@ class _FixedIntBaseMeta(type):
                 raise Exception("Cannot subclass %s; use the %s constructor to produce new subclasses." % (basename, basename))
         raise Exception("Cannot subclass this class.")
 
-    def __call__(self, width, signed=True, mutable=None):
-        signed = bool(signed)
-        if mutable is None:
-            # Take mutable from constructor used (FixedInt or MutableFixedInt)
-            mutable = (self == MutableFixedInt)
-
-        cachekey = (width, signed, mutable)
+    def __call__(self, width, signed=True, mutable=None, lazy=False):
+        cachekey, signed, mutable = _class_key(self, width, signed, mutable, lazy)
         try:
-            return _class_cache[cachekey]
+            cls = _class_lru[cachekey]
+            _class_lru.move_to_end(cachekey)
+            return cls
         except KeyError:
-            pass
-            
+            cls = _class_cache.get(cachekey)
+            if cls is not None:
+                _remember_class(cachekey, cls)
+                return cls
+
+        if len(cachekey) == 4:
+            cls = _lazy_class(FixedInt(width, signed, mutable=True))
+            _class_cache[cachekey] = cls
+            _remember_class(cachekey, cls)
+            return cls
+
         if signed:
             min = -1<<(width-1)
             max = (1<<(width-1))-1
@@ -83,6 +98,7 @@ class _FixedIntBaseMeta(type):
         dict['mutable'] = FixedProperty(mutable, doc=_doc_mutable)
         dict['minval'] = FixedProperty(min, doc=_doc_minval)
         dict['maxval'] = FixedProperty(max, doc=_doc_maxval)
+        dict['lazy'] = FixedProperty(False, doc=_doc_lazy)
 
         if signed:
             _mask1 = (1<<(width-1)) - 1
@@ -95,22 +111,16 @@ class _FixedIntBaseMeta(type):
                 return val & _mask
         dict['_rectify'] = staticmethod(_rectify)
 
-        if not mutable:
-            intbase = bases[1]
-            def _newfunc(cls, val=0, base=None):
-                ''' Convert an integer into a fixed-width integer. '''
-                if base is None:
-                    val = int(val)
-                else:
-                    val = int(val, base)
-                return intbase.__new__(cls, _rectify(val))
-            _newfunc.__name__ = '__new__'
-            dict['__new__'] = _newfunc
+        # Without a __dict__, interned immutable values can't carry attributes
+        # from one use to the next.
+        dict['__slots__'] = ()
 
         name = ''.join(['Mutable'*mutable, 'U'*(not signed), 'Int', str(width)])
 
         cls = _FixedIntMeta(name, bases, dict)
+        _install_methods(cls, None if mutable else _value_cache(cls, None))
         _class_cache[cachekey] = cls
+        _remember_class(cachekey, cls)
         return cls
 
     width = FixedMetaProperty('width', doc=_doc_width)
@@ -118,11 +128,83 @@ class _FixedIntBaseMeta(type):
     mutable = FixedMetaProperty('mutable', doc=_doc_mutable)
     minval = FixedMetaProperty('minval', doc=_doc_minval)
     maxval = FixedMetaProperty('maxval', doc=_doc_maxval)
+    lazy = FixedMetaProperty('lazy', doc=_doc_lazy)
+
+def _class_key(meta, width, signed, mutable, lazy):
+    ''' Normalize the arguments of a class construction, returning (cachekey, signed, mutable). '''
+    signed = bool(signed)
+    if mutable is None:
+        # Take mutable from constructor used (FixedInt or MutableFixedInt).
+        # Lazy rectification only makes sense for mutable values.
+        mutable = (meta == MutableFixedInt) or bool(lazy)
+    elif lazy and not mutable:
+        raise ValueError("lazy rectification requires a mutable type")
+    if lazy and signed:
+        # Unsigned values are rectified with a single mask, which costs no more
+        # than checking the size of an unrectified value, so only signed
+        # classes have a lazy variant.
+        return (width, signed, mutable, True), signed, mutable
+    return (width, signed, mutable), signed, mutable
+
+def _remember_class(key, cls):
+    ''' Add cls to the strong-reference tier of the class cache. '''
+    global _class_lru_evictions
+    if _class_lru_maxsize:
+        _class_lru[key] = cls
+        if len(_class_lru) > _class_lru_maxsize:
+            _class_lru.popitem(last=False)
+            _class_lru_evictions += 1
+
+ClassCacheInfo = namedtuple('ClassCacheInfo', 'evictions maxsize currsize')
+
+def set_class_cache(maxsize=128):
+    ''' Set how many recently used FixedInt classes are kept alive.
+
+    Classes are cached for as long as they are referenced, so that every
+    FixedInt(width, signed) call returns the same class. Classes without other
+    references, such as the results of FixedInt(width) inside a function or
+    of slicing, are also kept in an LRU cache of maxsize classes, so that they
+    are not garbage-collected and created again. maxsize=0 turns this off.
+    '''
+    global _class_lru_maxsize, _class_lru_evictions
+    if maxsize < 0:
+        raise ValueError("maxsize must not be negative")
+    _class_lru_maxsize = maxsize
+    while len(_class_lru) > maxsize:
+        _class_lru.popitem(last=False)
+        _class_lru_evictions += 1
+
+def class_cache_info():
+    ''' Return the state of the LRU cache of classes, as a
+    ClassCacheInfo(evictions, maxsize, currsize).
+
+    evictions counts the classes dropped from the cache to make room for
+    others; each may be garbage-collected, and created again when next used.
+    currsize is the number of classes kept alive by the cache. Hits, misses
+    and rebuilds are counted by fixedint.instrument. See set_class_cache.
+    '''
+    return ClassCacheInfo(_class_lru_evictions, _class_lru_maxsize, len(_class_lru))
 
 class _FixedIntMeta(_FixedIntBaseMeta):
     __new__ = type.__new__
     __call__ = type.__call__
 
+def _class_from_key(key):
+    ''' Recreate a FixedInt class from the key produced by _reduce_class. '''
+    return FixedInt(key >> 3, bool(key & 4), bool(key & 2), bool(key & 1))
+
+def _reduce_class(cls):
+    # Classes are created on demand and can't be pickled by name, so they are
+    # pickled as one int encoding (width, signed, mutable, lazy) instead.
+    # Internal derived classes, such as register views, reduce to their
+    # ordinary class. Other subclasses, such as user classes adding a mixin,
+    # are pickled by reference.
+    if '_internal_subclass' not in cls.__dict__ and FixedInt(cls.width, cls.signed, cls.mutable, cls.lazy) is not cls:
+        return cls.__qualname__
+    return _class_from_key, (cls.width << 3 | cls.signed << 2 | cls.mutable << 1 | cls.lazy,)
+
+copyreg.pickle(_FixedIntMeta, _reduce_class)
+
 
 def int_method(f):
     if isinstance(f, str):
@@ -134,7 +216,7 @@ def int_method(f):
         f.__doc__ = getattr(int, f.__name__).__doc__
         return f
 
-class FixedInt:
+class FixedInt(metaclass=_FixedIntBaseMeta):
     __slots__ = ()
     _subclass_enable = _subclass_token
 
@@ -142,23 +224,22 @@ class FixedInt:
     # _rectify defined in metaclass
     # __new__ defined in metaclass
 
-    if not PY3K:
-        @int_method
-        def __hex__(self):
-            return '%#x' % int(self)
-        def __oct__(self):
-            return '%#o' % int(self)
-
     @int_method
     def __pow__(self, other, modulo=None):
-        # Jython can't handle int.__pow__(x, y, None)
-        if modulo is None:
-            return type(self)(int.__pow__(int(self), int(other)))
-        return type(self)(int.__pow__(int(self), int(other), modulo))
+        val = int(self)
+        other = int(other)
+        if modulo is not None:
+            return type(self)(pow(val, other, int(modulo)))
+        if other > 0 and val.bit_length() * other > _pow_exact_bits:
+            # Only the low width bits are kept, so there is no need to compute
+            # the exact power.
+            return type(self)(pow(val, other, 1 << self.width))
+        return type(self)(int.__pow__(val, other))
 
     @int_method
     def __rpow__(self, other):
-        return type(other)(int.__rpow__(int(self), int(other)))
+        # The left operand is not a FixedInt, so the result is a plain int.
+        return int(int.__pow__(int(other), int(self)))
 
     @int_method
     def __repr__(self):
@@ -232,21 +313,10 @@ class FixedInt:
             length = (self.width + 7) // 8
         try:
             return int(self).to_bytes(length, byteorder=byteorder, signed=self.signed)
-        except (OverflowError, AttributeError):
-            pass
-
-        val = int(self) & ((1 << (length * 8)) - 1)
-        out = []
-        while length > 0:
-            out.append(val & 0xff)
-            val >>= 8
-            length -= 1
-        if byteorder == 'big':
-            out = reversed(out)
-        if PY3K:
-            return bytes(out)
-        else:
-            return ''.join(map(chr, out))
+        except OverflowError:
+            # too short for the value: keep the low-order bytes
+            val = int(self) & ((1 << (length * 8)) - 1)
+            return val.to_bytes(length, byteorder=byteorder)
 
     @classmethod
     def from_bytes(cls, bytes, byteorder=sys.byteorder, signed=None):
@@ -259,38 +329,64 @@ class FixedInt:
             raise ValueError("can't set signed with a concrete FixedInt")
 
         blen = len(bytes)
-        try:
-            val = int.from_bytes(bytes, byteorder=byteorder, signed=signed)
-        except AttributeError:
-            val = 0
-            if byteorder == 'big':
-                bytes = reversed(bytes)
-            if PY3K:
-                for i,c in enumerate(bytes):
-                    val |= c << (8 * i)
-            else:
-                for i,c in enumerate(bytes):
-                    val |= ord(c) << (8 * i)
+        val = int.from_bytes(bytes, byteorder=byteorder, signed=signed)
 
         if cls in (FixedInt, MutableFixedInt):
             return cls(blen*8, signed=signed)(val)
         else:
             return cls(val)
 
-    if PY3K:
-        @int_method
-        def __round__(self, n=0):
-            return int(self)
+    @classmethod
+    def unpack_from(cls, buffer, offset=0, count=None, byteorder=sys.byteorder):
+        ''' Decode consecutive values of this type from a buffer.
+
+        Each value occupies (width + 7) // 8 bytes. If count is None, values are
+        decoded up to the end of the buffer. Returns a FixedIntArray.
+        '''
+        from fixedint.arrays import _unpack_from
+        return _unpack_from(cls, buffer, offset, count, byteorder)
+
+    @classmethod
+    def pack_into(cls, buffer, offset, values, byteorder=sys.byteorder):
+        ''' Encode values as consecutive integers of this type into a writable buffer.
+
+        Each value occupies (width + 7) // 8 bytes, as in unpack_from.
+        '''
+        from fixedint.arrays import _pack_into
+        _pack_into(cls, buffer, offset, values, byteorder)
+
+    @int_method
+    def __round__(self, n=0):
+        return int(self)
+
+    def __reduce__(self):
+        # Only the class and the value are pickled; see _reduce_class.
+        return type(self), (int(self),)
+
+    @classmethod
+    def set_value_cache(cls, maxsize=None):
+        ''' Choose how the values of this immutable class are interned.
+
+        Interned values are created once, and then shared by every constructor
+        call and operation producing the same value. By default, classes of up
+        to 16 bits intern all values (in a table filled as values are used) and
+        wider classes intern nothing. maxsize=0 turns interning off, and a
+        positive maxsize keeps an LRU cache of that many values instead.
+        '''
+        if cls.mutable or '_rectify' not in cls.__dict__:
+            raise TypeError("only immutable FixedInt classes can intern values")
+        _install_methods(cls, _value_cache(cls, maxsize))
 
     # Inherited methods which are fine as-is:
-    # complex, int, long, float, index
+    # complex, int, float, index
     # truediv, rtruediv, divmod, rdivmod, rlshift, rrshift
     # format
 
-FixedInt = add_metaclass(_FixedIntBaseMeta)(FixedInt)
-
 
 class MutableFixedInt(FixedInt):
+    # Mutable classes produced by the metaclass declare empty __slots__ too, so
+    # instances carry no __dict__.
+    __slots__ = ('_val', '__weakref__')
     _subclass_enable = _subclass_token
 
     def __init__(self, val=0, base=None):
@@ -302,16 +398,19 @@ class MutableFixedInt(FixedInt):
 
         self._val = self._rectify(val)
 
-    if PY3K:
-        @int_method
-        def __format__(self, format_spec):
-            return format(self._val, format_spec)
+    @int_method
+    def __format__(self, format_spec):
+        return format(self._val, format_spec)
 
     def __ipow__(self, other, modulo=None):
-        if modulo is None:
-            self._val = self._rectify(int.__pow__(int(self), int(other)))
+        val = int(self)
+        other = int(other)
+        if modulo is not None:
+            self._val = self._rectify(pow(val, other, int(modulo)))
+        elif other > 0 and val.bit_length() * other > _pow_exact_bits:
+            self._val = self._rectify(pow(val, other, 1 << self.width))
         else:
-            self._val = self._rectify(int.__pow__(int(self), int(other), modulo))
+            self._val = self._rectify(int.__pow__(val, other))
         return self
 
     def __setitem__(self, item, value):
@@ -382,11 +481,19 @@ def _arith_convert(t1, t2):
     else:
         return st
 
+def _int_operand(t):
+    ''' Return True if values of type t are arithmetic operands, taken as
+    their int() value. Other types, such as FixedIntArray, get NotImplemented
+    so that they can handle the reflected operation. '''
+    return issubclass(t, (int, FixedInt)) or hasattr(t, '__index__') or hasattr(t, '__int__')
+
 def _arith_binfunc_factory(name):
     ''' Factory function producing methods for arithmetic operators '''
     intfunc = getattr(int, name)
     @int_method(name)
     def _f(self, other):
+        if not _int_operand(type(other)):
+            return NotImplemented
         nt = _arith_convert(type(self), type(other))
         return nt(intfunc(int(self), int(other)))
     return _f
@@ -395,8 +502,6 @@ def _arith_binfunc_factory(name):
 # pow, rpow, rlshift, and rrshift are special since the LHS and RHS are very different
 _arith_binfunc = 'add sub mul floordiv mod lshift rshift and xor or'.split()
 _arith_binfunc += 'radd rsub rmul rfloordiv rmod rand rxor ror'.split()
-if not PY3K:
-    _arith_binfunc += 'div rdiv'.split()
 
 for f in _arith_binfunc:
     s = '__%s__' % f
@@ -412,15 +517,7 @@ def _nonarith_unary_factory_mutable(name):
         return intfunc(self._val)
     return _f
 
-_mutable_unary = 'int float'.split()
-if sys.version_info[:2] >= (2,5):
-    _mutable_unary += ['index']
-if sys.version_info[:2] >= (2,6):
-    _mutable_unary += ['trunc']
-if PY3K:
-    _mutable_unary += 'bool'.split()
-else:
-    _mutable_unary += 'nonzero long'.split()
+_mutable_unary = 'int float index trunc bool'.split()
 
 for f in _mutable_unary:
     s = '__%s__' % f
@@ -435,38 +532,630 @@ def _nonarith_binfunc_factory_mutable(name):
         return intfunc(self._val, int(other))
     return _f
 
-_mutable_binfunc = 'truediv rtruediv divmod rdivmod rlshift rrshift'.split()
-if hasattr(int, '__cmp__'):
-    _mutable_binfunc += ['cmp']
-else:
-    _mutable_binfunc += 'lt le eq ne gt ge'.split()
+_mutable_binfunc = 'truediv rtruediv divmod rdivmod rlshift rrshift lt le eq ne gt ge'.split()
 for f in _mutable_binfunc:
     s = '__%s__' % f
     setattr(MutableFixedInt, s, _nonarith_binfunc_factory_mutable(s))
 
 
 ## In-place operators
-def _inplace_factory_mutable(iname, name, op):
-    ''' Factory function producing methods for augmented assignments on Mutable instances. '''
+def _inplace_methods_mutable(funcs):
+    ''' Produce methods for augmented assignments on Mutable instances. '''
     # This uses compiled operators instead of an int.__X__ function call for speed.
     # Measured improvement is about 15% speed increase.
-    exec("""
-def _f(self, other):
+    src = []
+    for f in funcs:
+        fn, op = f.split(',')
+        src.append("""
+def __i%s__(self, other):
     self._val = self._rectify(self._val %s int(other))
     return self
-globals()['_f'] = _f""" % op)
-    _f.__name__ = iname
+""" % (fn, op))
+    ns = {}
+    exec(''.join(src), ns)
+
+    methods = {}
     doc = list.__iadd__.__doc__
-    if doc:
-        _f.__doc__ = doc.replace('__iadd__', name).replace('+=', op+'=')
-    return _f
+    for f in funcs:
+        fn, op = f.split(',')
+        _f = methods['__i%s__' % fn] = ns['__i%s__' % fn]
+        if doc:
+            _f.__doc__ = doc.replace('__iadd__', '__%s__' % fn).replace('+=', op+'=')
+    return methods
 
 # pow is special because it takes three arguments.
-_inplace_func = 'add,+ sub,- mul,* floordiv,// mod,% lshift,<< rshift,<< and,& or,| xor,^'.split()
-if not PY3K:
-    _inplace_func += ['div,/']
-for f in _inplace_func:
-    fn, op = f.split(',')
-    si = '__i%s__' % fn
-    so = '__%s__' % fn
-    setattr(MutableFixedInt, si, _inplace_factory_mutable(si, so, op))
+_inplace_func = 'add,+ sub,- mul,* floordiv,// mod,% lshift,<< rshift,>> and,& or,| xor,^'.split()
+for si, f in _inplace_methods_mutable(_inplace_func).items():
+    setattr(MutableFixedInt, si, f)
+
+
+## Per-class arithmetic methods
+def _arith_method_source(mutable, signed, boxed):
+    ''' Generate the source of a factory producing specialized arithmetic methods.
+
+    The generated methods have fast paths for plain int operands and operands of
+    the same class, and look up the result type of mixed operations in a
+    per-class promotion table instead of calling _arith_convert every time.
+    If boxed is true, results are produced by the class's value cache _box.
+    Operands rejected by _int_operand give NotImplemented, so that types such
+    as FixedIntArray can handle the reflected operation.
+    '''
+    if mutable:
+        selfval = 'self._val'
+        otherval = 'other._val'
+    else:
+        selfval = 'int(self)'
+        otherval = 'int(other)'
+    if signed:
+        rect = '((%s) + _h & _m) - _h'
+    else:
+        rect = '(%s) & _m'
+    if mutable:
+        ret = 'r = _onew(cls); r._val = ' + rect + '; return r'
+    else:
+        ret = 'return ' + _result(boxed) % rect
+
+    lines = ['def _factory(cls, _m, _h, _promotions, _forget, _box):']
+    names = []
+    for fn, op in _arith_binfunc_ops:
+        for reflected in (False, True):
+            if reflected:
+                if fn in ('lshift', 'rshift'):
+                    continue
+                fn = 'r' + fn
+                expr = lambda a, b: '%s %s %s' % (b, op, a)
+            else:
+                expr = lambda a, b: '%s %s %s' % (a, op, b)
+            name = '__%s__' % fn
+            names.append(name)
+            lines += [
+                '    def %s(self, other):' % name,
+                '        t = type(self)',
+                '        ot = type(other)',
+                '        if t is cls:',
+                '            if ot is int:',
+                '                ' + ret % expr(selfval, 'other'),
+                '            if ot is cls:',
+                '                ' + ret % expr(selfval, otherval),
+                '            try:',
+                '                keep = _promotions[_ref(ot)]',
+                '            except KeyError:',
+                '                keep = _promotions[_ref(ot, _forget)] = _promotion(cls, ot)',
+                '            if keep:',
+                '                ' + ret % expr(selfval, 'int(other)'),
+                '            if keep is None:',
+                '                return NotImplemented',
+                '            return ot(%s)' % expr(selfval, 'int(other)'),
+                '        if not _int_operand(ot):',
+                '            return NotImplemented',
+                '        return _arith_convert(t, ot)(%s)' % expr(selfval, 'int(other)'),
+            ]
+    if mutable:
+        # In-place operators read and write the _val slot directly and
+        # rectify inline rather than through self._rectify.
+        for fn, op in _arith_binfunc_ops:
+            name = '__i%s__' % fn
+            names.append(name)
+            lines += [
+                '    def %s(self, other):' % name,
+                '        if type(other) is not int:',
+                '            other = int(other)',
+                '        self._val = ' + rect % ('self._val %s other' % op),
+                '        return self',
+            ]
+    lines.append('    return {%s}' % ', '.join("'%s': %s" % (n, n) for n in names))
+    return '\n'.join(lines)
+
+def _promotion(cls, ot):
+    ''' Return True if arithmetic of cls with operands of type ot produces cls,
+    False if it produces ot, and None if ot is not an arithmetic operand. '''
+    if not _int_operand(ot):
+        return None
+    return _arith_convert(cls, ot) is cls
+
+_arith_binfunc_ops = [tuple(f.split(',')) for f in
+    'add,+ sub,- mul,* floordiv,// mod,% lshift,<< rshift,>> and,& xor,^ or,|'.split()]
+
+_arith_method_factories = {}
+
+def _arith_methods(cls, box=None):
+    ''' Produce the specialized arithmetic methods for a new FixedInt class. '''
+    key = (cls.mutable, cls.signed, box is not None)
+    try:
+        factory = _arith_method_factories[key]
+    except KeyError:
+        ns = {}
+        exec(_arith_method_source(*key), globals(), ns)
+        factory = _arith_method_factories[key] = ns['_factory']
+
+    width = cls.width
+    mask = (1 << width) - 1
+    half = 1 << (width - 1) if cls.signed else 0
+    # The promotion table holds _promotion(cls, ot) for each operand type ot
+    # seen. It is keyed by weak references, so that it doesn't keep the operand
+    # types alive.
+    promotions = {}
+    def _forget(r):
+        promotions.pop(r, None)
+    methods = factory(cls, mask, half, promotions, _forget, box)
+    for name, f in methods.items():
+        if name in MutableFixedInt.__dict__ and name.startswith('__i'):
+            f.__doc__ = MutableFixedInt.__dict__[name].__doc__
+        else:
+            f.__doc__ = getattr(int, name).__doc__
+    return methods
+
+## Bit manipulation methods
+def _bit_method_source(mutable, signed, boxed):
+    ''' Generate the source of a factory producing bit manipulation methods.
+
+    The methods work on the width-bit two's complement pattern of the value,
+    and reinterpret the resulting pattern as a value of the class.
+    '''
+    val = 'self._val' if mutable else 'int(self)'
+    if signed:
+        val = '(%s & _m)' % val
+        res = '(%s ^ _h) - _h'
+    else:
+        res = '%s'
+    if mutable:
+        ret = 'r = _onew(cls); r._val = ' + res + '; return r'
+    else:
+        ret = 'return ' + _result(boxed) % res
+    lines = [
+        'def _factory(cls, _w, _m, _h, _popcount, _bit_reverse, _bswap, _box):',
+        '    def rotl(self, n):',
+        '        v = ' + val,
+        '        n %= _w',
+        '        ' + ret % '(v << n | v >> (_w - n)) & _m',
+        '    def rotr(self, n):',
+        '        v = ' + val,
+        '        n %= _w',
+        '        ' + ret % '(v >> n | v << (_w - n)) & _m',
+        '    def popcount(self):',
+        '        return _popcount(%s)' % val,
+        '    def clz(self):',
+        '        return _w - %s.bit_length()' % val,
+        '    def ctz(self):',
+        '        v = ' + val,
+        '        return (v & -v).bit_length() - 1 if v else _w',
+        '    def bswap(self):',
+        '        ' + ret % ('_bswap(%s)' % val),
+        '    def bit_reverse(self):',
+        '        ' + ret % ('_bit_reverse(%s)' % val),
+        '    return {%s}' % ', '.join("'%s': %s" % (n, n) for n in _bit_method_docs),
+    ]
+    return '\n'.join(lines)
+
+_bit_method_docs = {
+    'rotl': ''' Rotate the bits left by n positions (modulo the width). ''',
+    'rotr': ''' Rotate the bits right by n positions (modulo the width). ''',
+    'popcount': ''' Number of one bits in the two's complement representation, as an int. ''',
+    'clz': ''' Number of leading zero bits, as an int; equal to width for zero. ''',
+    'ctz': ''' Number of trailing zero bits, as an int; equal to width for zero. ''',
+    'bswap': ''' Reverse the order of the bytes. The width must be a multiple of 8. ''',
+    'bit_reverse': ''' Reverse the order of the bits. ''',
+}
+
+_bit_tables = {}
+
+def _bit_table(name):
+    ''' Return one of the bit manipulation lookup tables, building it on first use. '''
+    try:
+        return _bit_tables[name]
+    except KeyError:
+        pass
+    if name == 'popcount8':
+        table = bytes(bin(i).count('1') for i in range(256))
+    elif name == 'reverse8':
+        table = bytes(int('{:08b}'.format(i)[::-1], 2) for i in range(256))
+    elif name == 'popcount16':
+        p = _bit_table('popcount8')
+        table = bytes(p[i & 0xff] + p[i >> 8] for i in range(1 << 16))
+    elif name == 'reverse16':
+        from array import array
+        r = _bit_table('reverse8')
+        table = array('H', [r[i & 0xff] << 8 | r[i >> 8] for i in range(1 << 16)])
+    else:
+        raise KeyError(name)
+    _bit_tables[name] = table
+    return table
+
+def _popcount_func(width):
+    if hasattr(int, 'bit_count'):
+        return int.bit_count
+    if width <= 8:
+        return _bit_table('popcount8').__getitem__
+    if width <= 16:
+        return _bit_table('popcount16').__getitem__
+    def _popcount(v):
+        return bin(v).count('1')
+    return _popcount
+
+def _bit_reverse_func(width):
+    # Small widths use a lookup table; the tables are built on first use, since
+    # most programs never reverse bits.
+    if width <= 16:
+        size = 8 if width <= 8 else 16
+        shift = size - width
+        tables = []
+        def _bit_reverse(v):
+            if not tables:
+                tables.append(_bit_table('reverse%d' % size))
+            return tables[0][v] >> shift
+        return _bit_reverse
+    nbytes = (width + 7) // 8
+    shift = nbytes * 8 - width
+    from_bytes = int.from_bytes
+    def _bit_reverse(v):
+        return from_bytes(v.to_bytes(nbytes, 'little').translate(_bit_table('reverse8')), 'big') >> shift
+    return _bit_reverse
+
+def _bswap_func(width):
+    if width % 8:
+        def _bswap(v):
+            raise ValueError("cannot byte-swap a %d-bit integer" % width)
+    elif width == 8:
+        def _bswap(v):
+            return v
+    else:
+        nbytes = width // 8
+        from_bytes = int.from_bytes
+        def _bswap(v):
+            return from_bytes(v.to_bytes(nbytes, 'little'), 'big')
+    return _bswap
+
+_bit_method_factories = {}
+
+def _bit_methods(cls, box=None):
+    ''' Produce the bit manipulation methods for a new FixedInt class. '''
+    key = (cls.mutable, cls.signed, box is not None)
+    try:
+        factory = _bit_method_factories[key]
+    except KeyError:
+        ns = {}
+        exec(_bit_method_source(*key), globals(), ns)
+        factory = _bit_method_factories[key] = ns['_factory']
+
+    width = cls.width
+    methods = factory(cls, width, (1 << width) - 1, 1 << (width - 1),
+        _popcount_func(width), _bit_reverse_func(width), _bswap_func(width), box)
+    for name, f in methods.items():
+        f.__doc__ = _bit_method_docs[name]
+    return methods
+
+## Arithmetic with flags
+Flags = namedtuple('Flags', 'carry overflow zero sign')
+Flags.__doc__ = ''' Condition flags of an arithmetic operation.
+
+carry: the unsigned result did not fit the width (a borrow, for subtraction),
+  or for shifts, the last bit shifted out.
+overflow: the signed (two's complement) result did not fit the width.
+zero: the wrapped result is zero.
+sign: the top bit of the wrapped result is set.
+'''
+
+# Each operation computes the width-bit pattern r of the result, and the carry
+# and overflow flags c and o, from the operands' patterns ua and ub (and their
+# two's complement values sa and sb).
+_flag_ops = [
+    ('add', 'a, b, carry_in=0', [
+        'ub = int(b) & _m',
+        's = ua + ub + (1 if carry_in else 0)',
+        'r = s & _m',
+        'c = s > _m',
+        'o = ((ua ^ r) & (ub ^ r) & _h) != 0',
+    ]),
+    ('sub', 'a, b, borrow_in=0', [
+        'ub = int(b) & _m',
+        's = ua - ub - (1 if borrow_in else 0)',
+        'r = s & _m',
+        'c = s < 0',
+        'o = ((ua ^ ub) & (ua ^ r) & _h) != 0',
+    ]),
+    ('neg', 'a', [
+        'r = -ua & _m',
+        'c = ua != 0',
+        'o = ua == _h',
+    ]),
+    ('mul', 'a, b', [
+        'ub = int(b) & _m',
+        'r = ua * ub & _m',
+        'c = ua * ub > _m',
+        'p = ((ua ^ _h) - _h) * ((ub ^ _h) - _h)',
+        'o = not -_h <= p < _h',
+    ]),
+    ('shl', 'a, n', [
+        'n = int(n)',
+        'if n < 0:',
+        '    raise ValueError("negative shift count")',
+        'if n > _w:',
+        '    n = _w + 1',
+        's = ua << n',
+        'r = s & _m',
+        'c = (s >> _w & 1) == 1',
+        'p = ((ua ^ _h) - _h) << n',
+        'o = not -_h <= p < _h',
+    ]),
+    ('shr', 'a, n', [
+        'n = int(n)',
+        'if n < 0:',
+        '    raise ValueError("negative shift count")',
+        'if n > _w:',
+        '    n = _w + 1',
+        'v = %(a)s',
+        'r = (v >> n) & _m',
+        'c = n > 0 and (v >> (n - 1) & 1) == 1',
+        'o = False',
+    ]),
+]
+
+_flag_docs = {
+    'add': ''' Return (a + b + carry_in, Flags) for two values of this class's width. ''',
+    'sub': ''' Return (a - b - borrow_in, Flags); the carry flag is set on a borrow. ''',
+    'neg': ''' Return (-a, Flags), with the flags of the subtraction 0 - a. ''',
+    'mul': ''' Return (a * b, Flags). carry and overflow are set if the exact unsigned or
+        signed product does not fit the width. ''',
+    'shl': ''' Return (a << n, Flags). carry is the last bit shifted out, and overflow is
+        set if the signed result differs from the exact signed value. ''',
+    'shr': ''' Return (a >> n, Flags), shifting in sign bits for signed classes and zeros
+        for unsigned classes. carry is the last bit shifted out; overflow is never set. ''',
+}
+
+def _flag_method_source(mutable, signed, boxed):
+    ''' Generate the source of a factory producing the *_with_flags methods.
+
+    For each operation, a classmethod op_with_flags(a, ...) returns the wrapped
+    result and its Flags. Mutable classes also get iop_with_flags(self, ...),
+    which stores the result in self and returns only the Flags.
+    '''
+    val = '(r ^ _h) - _h' if signed else 'r'
+    sval = '(ua ^ _h) - _h' if signed else 'ua'
+    flags = '_tnew(Flags, (c, o, r == 0, (r & _h) != 0))'
+    lines = ['def _factory(_w, _m, _h, _box):']
+    names = []
+    for op, args, body in _flag_ops:
+        body = ['    ' + line % {'a': sval} for line in body]
+        name = op + '_with_flags'
+        names.append(name)
+        lines += ['    @classmethod', '    def %s(cls, %s):' % (name, args), '        ua = int(a) & _m']
+        lines += ['    ' + line for line in body]
+        if mutable:
+            lines += ['        x = _onew(cls)', '        x._val = ' + val, '        return x, ' + flags]
+        else:
+            lines += ['        return %s, %s' % (_result(boxed) % val, flags)]
+        if mutable:
+            name = 'i' + name
+            names.append(name)
+            lines += ['    def %s(self%s):' % (name, args[1:]), '        ua = self._val & _m']
+            lines += ['    ' + line for line in body]
+            lines += ['        self._val = ' + val, '        return ' + flags]
+    lines.append('    return {%s}' % ', '.join("'%s': %s" % (n, n) for n in names))
+    return '\n'.join(lines)
+
+_flag_method_factories = {}
+
+def _flag_methods(cls, box=None):
+    ''' Produce the *_with_flags methods for a new FixedInt class. '''
+    key = (cls.mutable, cls.signed, box is not None)
+    try:
+        factory = _flag_method_factories[key]
+    except KeyError:
+        ns = {}
+        exec(_flag_method_source(*key), globals(), ns)
+        factory = _flag_method_factories[key] = ns['_factory']
+
+    width = cls.width
+    methods = factory(width, (1 << width) - 1, 1 << (width - 1), box)
+    for name, f in methods.items():
+        if isinstance(f, classmethod):
+            f.__func__.__doc__ = _flag_docs[name.split('_')[0]]
+        else:
+            f.__doc__ = ''' Like %s, but store the result in self and return only the Flags. ''' % name[1:]
+    return methods
+
+## Atomic operations
+# Instances have no room for a lock of their own, so atomic operations take one
+# of a fixed set of locks, picked by the identity of the instance. Unrelated
+# instances rarely share a lock, and operations on one instance are serialized.
+_atomic_locks = tuple(allocate_lock() for _ in range(64))
+_atomic_ops = [('add', '+'), ('sub', '-'), ('and', '&'), ('or', '|'), ('xor', '^')]
+
+def _atomic_method_source(signed):
+    ''' Generate the source of a factory producing the atomic methods of a
+    mutable class. The previous value is returned as an ordinary instance of
+    cls, even for views (see fixedint.registers). '''
+    rect = '((%s) + _h & _m) - _h' if signed else '(%s) & _m'
+    lock = '    with _atomic_locks[id(self) >> 4 & 63]:'
+    conv = ['    if type(other) is not int:', '        other = int(other)']
+    ret = ['    x = _onew(cls)', '    x._val = old', '    return x']
+    lines = []
+    for fn, op in _atomic_ops:
+        lines += ['def fetch_%s(self, other):' % fn] + conv + [lock,
+                  '        old = self._val', '        self._val = ' + rect % ('old %s other' % op)] + ret
+    lines += ['def exchange(self, other):'] + conv + ['    other = ' + rect % 'other', lock,
+              '        old = self._val', '        self._val = other'] + ret
+    lines += ['def compare_exchange(self, expected, desired):',
+              '    expected = ' + rect % 'int(expected)', '    desired = ' + rect % 'int(desired)', lock,
+              '        if self._val != expected:', '            return False',
+              '        self._val = desired', '    return True']
+    names = ['fetch_%s' % fn for fn, op in _atomic_ops] + ['exchange', 'compare_exchange']
+    body = ['    ' + line for line in lines]
+    return '\n'.join(['def _factory(cls, _m, _h):'] + body +
+                     ['    return {%s}' % ', '.join("'%s': %s" % (n, n) for n in names)])
+
+_atomic_method_factories = {}
+_atomic_docs = dict([('fetch_%s' % fn, ''' Atomically set self to self %s other, and return the previous value. ''' % op)
+                     for fn, op in _atomic_ops])
+_atomic_docs['exchange'] = ''' Atomically set self to other, and return the previous value. '''
+_atomic_docs['compare_exchange'] = ''' Atomically set self to desired if it equals expected (converted
+        to this class), and return whether self was changed. '''
+
+def _atomic_methods(cls, box=None):
+    ''' Produce the atomic methods for a new mutable FixedInt class. '''
+    if not cls.mutable:
+        return {}
+    key = cls.signed
+    try:
+        factory = _atomic_method_factories[key]
+    except KeyError:
+        ns = {}
+        exec(_atomic_method_source(key), globals(), ns)
+        factory = _atomic_method_factories[key] = ns['_factory']
+    width = cls.width
+    methods = factory(cls, (1 << width) - 1, 1 << (width - 1))
+    for name, f in methods.items():
+        f.__doc__ = _atomic_docs[name]
+    return methods
+
+## Interned values
+def _result(boxed):
+    ''' Expression template creating an immutable instance from a rectified int. '''
+    return '_box(%s)' if boxed else '_new(cls, %s)'
+
+class _ValueTable(dict):
+    ''' Interned values of a class, created on first use. '''
+    __slots__ = ('cls',)
+
+    def __missing__(self, val):
+        res = self[val] = _new(self.cls, val)
+        return res
+
+# Classes up to this width intern all values by default. The values are
+# created on first use, which keeps class creation cheap.
+_table_width = 16
+
+def _value_cache(cls, maxsize):
+    ''' Return the function mapping rectified ints to interned instances of cls,
+    or None if cls should not intern values. See FixedInt.set_value_cache. '''
+    if maxsize is None:
+        if cls.width > _table_width:
+            return None
+        table = _ValueTable()
+        table.cls = cls
+        return table.__getitem__
+    if maxsize == 0:
+        return None
+    if maxsize < 0:
+        raise ValueError("maxsize must not be negative")
+    from functools import lru_cache
+    return lru_cache(maxsize)(partial(_new, cls))
+
+def _new_method(cls, box):
+    _rectify = cls._rectify
+    if box is None:
+        def __new__(cls, val=0, base=None):
+            ''' Convert an integer into a fixed-width integer. '''
+            if base is None:
+                val = int(val)
+            else:
+                val = int(val, base)
+            return _new(cls, _rectify(val))
+    else:
+        owner = cls
+        def __new__(cls, val=0, base=None):
+            ''' Convert an integer into a fixed-width integer. '''
+            if base is None:
+                val = int(val)
+            else:
+                val = int(val, base)
+            # Interned values are instances of the owning class, so
+            # subclasses get fresh instances of their own.
+            if cls is owner:
+                return box(_rectify(val))
+            return _new(cls, _rectify(val))
+    return staticmethod(__new__)
+
+def _install_methods(cls, box):
+    ''' Set up the per-class methods of a new class, or replace them after its
+    value cache changed. box is the class's value cache (see _value_cache). '''
+    if not cls.mutable:
+        cls.__new__ = _new_method(cls, box)
+        # _box creates an instance from a rectified int, for compiled code
+        # elsewhere (bitstruct, kernels, ...).
+        cls._box = staticmethod(box or partial(_new, cls))
+    for methods in (_arith_methods, _bit_methods, _flag_methods, _atomic_methods):
+        for fname, f in methods(cls, box).items():
+            setattr(cls, fname, f)
+
+_new = int.__new__
+_onew = object.__new__
+_tnew = tuple.__new__
+
+
+## Lazily rectified mutable classes
+def _lazy_method_source():
+    ''' Generate the source of a factory producing the methods of a lazy class.
+
+    Lazy instances keep the unrectified result of in-place ring operations in
+    the _raw slot, and _val becomes a property which rectifies on read. Since
+    all other methods read _val, the results are the same as for the ordinary
+    mutable class. The raw value is also rectified whenever it leaves the range
+    (_lo, _hi), so that it can't grow without bound.
+    '''
+    rect = '((%s) + _h & _m) - _h'
+    lines = [
+        'def _factory(_m, _h, _lo, _hi):',
+        '    def _get(self):',
+        '        v = ' + rect % 'self._raw',
+        '        self._raw = v',
+        '        return v',
+        '    def _set(self, v):',
+        '        self._raw = v',
+    ]
+    names = []
+    for fn, op in _arith_binfunc_ops:
+        if fn not in _lazy_ops:
+            continue
+        name = '__i%s__' % fn
+        names.append(name)
+        lines += [
+            '    def %s(self, other):' % name,
+            '        if type(other) is not int:',
+            '            other = int(other)',
+            '        v = self._raw %s other' % op,
+            '        if _lo < v < _hi:',
+            '            self._raw = v',
+            '        else:',
+            '            self._raw = ' + rect % 'v',
+            '        return self',
+        ]
+    lines.append('    return property(_get, _set), {%s}' % ', '.join("'%s': %s" % (n, n) for n in names))
+    return '\n'.join(lines)
+
+# Operations whose result modulo 2**width only depends on the operands modulo 2**width
+_lazy_ops = 'add sub mul lshift and xor or'.split()
+_lazy_method_factory = []
+
+def _lazy_class(base):
+    ''' Create the lazily rectified variant of a signed mutable FixedInt class. '''
+    if not _lazy_method_factory:
+        ns = {}
+        exec(_lazy_method_source(), globals(), ns)
+        _lazy_method_factory.append(ns['_factory'])
+    factory = _lazy_method_factory[0]
+
+    width = base.width
+    # Keep raw values within a couple of machine words of the real value.
+    limit = 1 << max(2 * width, 64)
+    prop, methods = factory((1 << width) - 1, 1 << (width - 1), -limit, limit)
+
+    dict = {
+        '__slots__': ('_raw',),
+        '_val': prop,
+        'lazy': FixedProperty(True, doc=_doc_lazy),
+    }
+    for name, f in methods.items():
+        f.__doc__ = base.__dict__[name].__doc__
+        dict[name] = f
+    cls = _FixedIntMeta('Lazy' + base.__name__, (base,), dict)
+    for fname, f in _arith_methods(cls).items():
+        if fname not in methods:
+            setattr(cls, fname, f)
+    for fname, f in _bit_methods(cls).items():
+        setattr(cls, fname, f)
+    for fname, f in _flag_methods(cls).items():
+        setattr(cls, fname, f)
+    for fname, f in _atomic_methods(cls).items():
+        setattr(cls, fname, f)
+    return cls
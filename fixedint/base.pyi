@@ -1,14 +1,31 @@
-from typing import Optional, Type, TypeVar, Union
+from typing import Iterable, NamedTuple, Optional, Tuple, Type, TypeVar, Union, TYPE_CHECKING
 from numbers import Integral
 
+if TYPE_CHECKING:
+    from fixedint.arrays import FixedIntArray
+
 FSelf = TypeVar("FSelf", bound="FixedInt")
 Other = Union[Integral, "FixedInt"]
 
+class Flags(NamedTuple):
+    carry: bool
+    overflow: bool
+    zero: bool
+    sign: bool
+
+class ClassCacheInfo(NamedTuple):
+    evictions: int
+    maxsize: int
+    currsize: int
+
+def set_class_cache(maxsize: int=128) -> None: ...
+def class_cache_info() -> ClassCacheInfo: ...
+
 class FixedInt:
     def __init__(self: FSelf, val: Union[int, str] = 0): ...
 
     def __pow__(self: FSelf, other: Other, modulo: Optional[Other]=None) -> FSelf: ...
-    def __rpow__(self: FSelf, other: Other) -> FSelf: ...
+    def __rpow__(self: FSelf, other: Other) -> int: ...
     def __repr__(self: FSelf) -> str: ...
     def __str__(self: FSelf) -> str: ...
     def __getitem__(self: FSelf, item) -> FSelf: ...
@@ -16,7 +33,34 @@ class FixedInt:
     @classmethod
     def from_bytes(cls: Type[FSelf], bytes, byteorder: str='little', signed: Optional[bool]=None) -> FSelf: ...
     def to_bytes(self: FSelf, length: Optional[int]=None, byteorder: str='little') -> bytes: ...
+    @classmethod
+    def unpack_from(cls, buffer, offset: int=0, count: Optional[int]=None, byteorder: str='little') -> "FixedIntArray": ...
+    @classmethod
+    def pack_into(cls, buffer, offset: int, values: Iterable[Other], byteorder: str='little') -> None: ...
     def __round__(self: FSelf, n: int=0) -> int: ...
+    @classmethod
+    def set_value_cache(cls, maxsize: Optional[int]=None) -> None: ...
+
+    def rotl(self: FSelf, n: int) -> FSelf: ...
+    def rotr(self: FSelf, n: int) -> FSelf: ...
+    def popcount(self) -> int: ...
+    def clz(self) -> int: ...
+    def ctz(self) -> int: ...
+    def bswap(self: FSelf) -> FSelf: ...
+    def bit_reverse(self: FSelf) -> FSelf: ...
+
+    @classmethod
+    def add_with_flags(cls: Type[FSelf], a: Other, b: Other, carry_in: bool=False) -> Tuple[FSelf, Flags]: ...
+    @classmethod
+    def sub_with_flags(cls: Type[FSelf], a: Other, b: Other, borrow_in: bool=False) -> Tuple[FSelf, Flags]: ...
+    @classmethod
+    def neg_with_flags(cls: Type[FSelf], a: Other) -> Tuple[FSelf, Flags]: ...
+    @classmethod
+    def mul_with_flags(cls: Type[FSelf], a: Other, b: Other) -> Tuple[FSelf, Flags]: ...
+    @classmethod
+    def shl_with_flags(cls: Type[FSelf], a: Other, n: int) -> Tuple[FSelf, Flags]: ...
+    @classmethod
+    def shr_with_flags(cls: Type[FSelf], a: Other, n: int) -> Tuple[FSelf, Flags]: ...
 
     def __neg__(self: FSelf) -> FSelf: ...
     def __pos__(self: FSelf) -> FSelf: ...
@@ -47,6 +91,7 @@ class FixedInt:
 
     width: int
     mutable: bool
+    lazy: bool
     signed: bool
     maxval: int
     minval: int
@@ -58,6 +103,21 @@ class MutableFixedInt(FixedInt):
     def __ipow__(self: MSelf, other: Other, modulo: Optional[Other]=None) -> MSelf: ...
     def __setitem__(self: MSelf, item, value: Other) -> bool: ...
 
+    def iadd_with_flags(self, b: Other, carry_in: bool=False) -> Flags: ...
+    def isub_with_flags(self, b: Other, borrow_in: bool=False) -> Flags: ...
+    def ineg_with_flags(self) -> Flags: ...
+    def imul_with_flags(self, b: Other) -> Flags: ...
+    def ishl_with_flags(self, n: int) -> Flags: ...
+    def ishr_with_flags(self, n: int) -> Flags: ...
+
+    def fetch_add(self: MSelf, other: Other) -> MSelf: ...
+    def fetch_sub(self: MSelf, other: Other) -> MSelf: ...
+    def fetch_and(self: MSelf, other: Other) -> MSelf: ...
+    def fetch_or(self: MSelf, other: Other) -> MSelf: ...
+    def fetch_xor(self: MSelf, other: Other) -> MSelf: ...
+    def exchange(self: MSelf, other: Other) -> MSelf: ...
+    def compare_exchange(self, expected: Other, desired: Other) -> bool: ...
+
     def __iadd__(self: MSelf, other: Other) -> MSelf: ...
     def __isub__(self: MSelf, other: Other) -> MSelf: ...
     def __imul__(self: MSelf, other: Other) -> MSelf: ...
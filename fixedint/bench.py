@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+''' Performance benchmarks for fixedint.
+
+Run with ``python -m fixedint.bench``. Results are printed as JSON, mapping each
+benchmark name to the best time per operation in nanoseconds. Benchmarks named
+``<group>/int`` run the same operation on plain ints as a baseline.
+
+Use ``--output FILE`` to save a run and ``--compare FILE`` to compare against a
+saved run; the exit status is 1 if any benchmark got slower by more than the
+``--threshold`` fraction.
+'''
+
+import fnmatch
+import json
+import platform
+import sys
+import timeit
+
+from fixedint.aliases import UInt32
+
+_binops = [
+    ('add', '+'), ('sub', '-'), ('mul', '*'), ('floordiv', '//'), ('mod', '%'),
+    ('lshift', '<<'), ('rshift', '>>'), ('and', '&'), ('xor', '^'), ('or', '|'),
+]
+_unops = [('neg', '-'), ('pos', '+'), ('abs', 'abs'), ('invert', '~')]
+
+_widths = [8, 32, 64, 100]
+
+_setup = 'from fixedint import FixedInt, MutableFixedInt'
+
+def _typename(width, signed, mutable=False):
+    return ''.join(['Mutable'*mutable, 'U'*(not signed), 'Int', str(width)])
+
+def _typesetup(width, signed, mutable=False):
+    return '%s; C = FixedInt(%d, signed=%r, mutable=%r)' % (_setup, width, signed, mutable)
+
+def _fnv1a(data: bytes):
+    h = UInt32(0x811c9dc5)
+    for b in data:
+        h = (h ^ b) * 0x01000193
+    return h
+
+def _fnv1a_int(data):
+    h = 0x811c9dc5
+    for b in data:
+        h = (h ^ b) * 0x01000193 & 0xffffffff
+    return h
+
+def collect(pattern=None):
+    ''' Return the list of benchmarks as (name, setup, stmt) tuples.
+
+    If pattern is given, only benchmarks whose name matches the glob pattern are
+    returned. Baselines are always kept for the groups that match.
+    '''
+    benchmarks = []
+    def add(group, variant, setup, stmt):
+        benchmarks.append(('%s/%s' % (group, variant), setup, stmt))
+
+    types = [(w, s) for w in _widths for s in (True, False)]
+
+    # construction
+    add('new', 'int', '', 'int(12345)')
+    for w, s in types:
+        for m in (False, True):
+            add('new', _typename(w, s, m), _typesetup(w, s, m), 'C(12345)')
+
+    # binary and unary operators
+    for fn, op in _binops:
+        for group, stmt in [(fn, 'x %s y' % op), ('r' + fn, '5 %s x' % op)]:
+            if group in ('rlshift', 'rrshift'):
+                continue
+            add(group, 'int', 'x = 123456; y = 5', stmt)
+            for w, s in types:
+                for m in (False, True):
+                    add(group, _typename(w, s, m), _typesetup(w, s, m) + '; x = C(123456); y = C(5)', stmt)
+        # the baseline does not accumulate, since plain ints would grow without bound
+        add('i' + fn, 'int', 'x = 123456', 'y = x %s 5' % op)
+        for w, s in types:
+            add('i' + fn, _typename(w, s, True), _typesetup(w, s, True) + '; x = C(123456)', 'x %s= 5' % op)
+            if s:
+                add('i' + fn, 'Lazy' + _typename(w, s, True),
+                    _setup + '; C = MutableFixedInt(%d, lazy=True); x = C(123456)' % w, 'x %s= 5' % op)
+    for fn, op in _unops:
+        stmt = '%s(x)' % op if op.isalpha() else '%sx' % op
+        add(fn, 'int', 'x = 123456', stmt)
+        for w, s in types:
+            for m in (False, True):
+                add(fn, _typename(w, s, m), _typesetup(w, s, m) + '; x = C(123456)', stmt)
+
+    # exponentiation
+    add('pow', 'int', 'x = 3', 'pow(x, 1000003, 1 << 64)')
+    for m in (False, True):
+        add('pow', _typename(64, False, m), _typesetup(64, False, m) + '; x = C(3)', 'x ** 1000003')
+
+    # slicing
+    add('getbit', 'int', 'x = 123456', '(x >> 3) & 1')
+    add('getslice', 'int', 'x = 123456', '(x >> 3) & 0xf')
+    add('setslice', 'int', 'x = 123456', 'x = (x & ~0x78) | ((5 & 0xf) << 3)')
+    for w, s in types:
+        for m in (False, True):
+            setup = _typesetup(w, s, m) + '; x = C(123456)'
+            add('getbit', _typename(w, s, m), setup, 'x[3]')
+            add('getslice', _typename(w, s, m), setup, 'x[3:7]')
+            if m:
+                add('setslice', _typename(w, s, m), setup, 'x[3:7] = 5')
+
+    # byte conversion
+    for w, s in types:
+        size = (w + 7) // 8
+        setup = _typesetup(w, s) + '; x = C(123456); b = x.to_bytes()'
+        add('to_bytes', 'int', 'x = 123456', 'x.to_bytes(%d, "little", signed=%r)' % (size, s))
+        add('from_bytes', 'int', 'b = bytes(%d)' % size, 'int.from_bytes(b, "little", signed=%r)' % s)
+        add('to_bytes', _typename(w, s), setup, 'x.to_bytes()')
+        add('from_bytes', _typename(w, s), setup, 'C.from_bytes(b)')
+
+    # class creation
+    for w, s in types:
+        name = _typename(w, s)
+        add('class_cached', name, _setup + '; C = FixedInt(%d, signed=%r)' % (w, s),
+            'FixedInt(%d, signed=%r)' % (w, s))
+        add('class_create', name, _setup + '; from fixedint.base import _class_cache, _class_lru',
+            '_class_cache.pop((%d, %r, False), None); _class_lru.pop((%d, %r, False), None); '
+            'FixedInt(%d, signed=%r)' % (w, s, w, s, w, s))
+
+    # flag-producing arithmetic
+    add('add_with_flags', 'int', 'a = 0xfffffff0; b = 0x20',
+        'r = a + b; c = r > 0xffffffff; r &= 0xffffffff; '
+        'o = (a ^ r) & (b ^ r) & 0x80000000 != 0; z = r == 0; s = r >> 31 == 1')
+    add('add_with_flags', 'UInt32', _typesetup(32, False), 'C.add_with_flags(0xfffffff0, 0x20)')
+    add('add_with_flags', 'MutableUInt32', _typesetup(32, False, True) + '; x = C(0xfffffff0)',
+        'x.iadd_with_flags(0x20)')
+
+    # bit-packed arrays
+    setup = (_setup + '; from fixedint import FixedIntArray, PackedArray; '
+        'C = FixedInt(12, signed=False); l = list(range(1024))')
+    add('packed_get', 'int', 'l = list(range(1024))', 'l[500]')
+    add('packed_get', 'FixedIntArray', setup + '; a = FixedIntArray(C, l)', 'a[500]')
+    add('packed_get', 'PackedArray', setup + '; a = PackedArray(C, l)', 'a[500]')
+    add('packed_tolist', 'int', 'l = list(range(1024))', 'l[:]')
+    add('packed_tolist', 'FixedIntArray', setup + '; a = FixedIntArray(C, l)', 'a.tolist()')
+    add('packed_tolist', 'PackedArray', setup + '; a = PackedArray(C, l)', 'a.tolist()')
+
+    # write tracing
+    setup = _setup + '; from fixedint import trace; C = MutableFixedInt(32, signed=False); x = C(5)'
+    add('traced_iadd', 'int', 'x = 5', 'y = x + 1')
+    add('traced_iadd', 'untraced', setup, 'x += 1')
+    add('traced_iadd', 'traced', setup + '; trace.trace(x, trace.TraceBuffer())', 'x += 1')
+
+    # deferred evaluation of derived columns
+    setup = (_setup + '; from fixedint import FixedIntArray, expr; '
+        'a = FixedIntArray(FixedInt(16), range(4096)); b = FixedIntArray(FixedInt(8, False), range(4096))')
+    add('derived_columns', 'int', 'a = list(range(4096)); b = list(range(4096))',
+        's = [x + y for x, y in zip(a, b)]; [v * 3 for v in s]; [(v ^ v >> 2) & 0xff for v in s]')
+    add('derived_columns', 'eager', setup, 's = a + b; s * 3; (s ^ (s >> 2)) & 0xff')
+    add('derived_columns', 'deferred', setup + '; s = expr.defer(a) + b; e = [s * 3, (s ^ (s >> 2)) & 0xff]',
+        'expr.evaluate(*e)')
+
+    # compiled kernels
+    data = 'data = bytes(range(256)) * 4'
+    add('fnv1a', 'int', 'from fixedint.bench import _fnv1a_int; ' + data, '_fnv1a_int(data)')
+    add('fnv1a', 'UInt32', 'from fixedint.bench import _fnv1a; ' + data, '_fnv1a(data)')
+    add('fnv1a', 'kernel', 'from fixedint.bench import _fnv1a; from fixedint import kernel; '
+        'f = kernel(_fnv1a, strict=True); ' + data, 'f(data)')
+
+    # uniquify, keeping the first definition of each int baseline
+    seen = set()
+    unique = []
+    for b in benchmarks:
+        if b[0] not in seen:
+            seen.add(b[0])
+            unique.append(b)
+    benchmarks = unique
+
+    if pattern is not None:
+        selected = [b for b in benchmarks if fnmatch.fnmatch(b[0], pattern)]
+        groups = set(name.split('/')[0] for name, _, _ in selected)
+        benchmarks = [b for b in benchmarks
+            if b in selected or b[0].endswith('/int') and b[0].split('/')[0] in groups]
+    return benchmarks
+
+def run(benchmarks, repeat=5, min_time=0.05, progress=None):
+    ''' Time each benchmark, returning a dict mapping names to ns per operation. '''
+    results = {}
+    for name, setup, stmt in benchmarks:
+        timer = timeit.Timer(stmt, setup)
+        number = 1
+        while True:
+            t = timer.timeit(number)
+            if t >= min_time:
+                break
+            number *= 10 if t < min_time / 10 else 2
+        best = min([t] + timer.repeat(repeat - 1, number))
+        results[name] = best / number * 1e9
+        if progress is not None:
+            progress(name, results[name])
+    return results
+
+def _normalized(results):
+    ''' Express each result relative to the int baseline of its group. '''
+    out = {}
+    for name, t in results.items():
+        base = results.get(name.split('/')[0] + '/int')
+        if base and not name.endswith('/int'):
+            out[name] = t / base
+    return out
+
+def compare(results, baseline, threshold=0.1, normalize=False):
+    ''' Compare results against a baseline.
+
+    Returns a list of (name, old, new, ratio) tuples for every benchmark present in
+    both runs, and a list of the names whose ratio exceeds 1 + threshold.
+
+    With normalize=True, times are first divided by the int baseline of their
+    group, which makes runs from differently loaded or different machines more
+    comparable.
+    '''
+    if normalize:
+        results = _normalized(results)
+        baseline = _normalized(baseline)
+    rows = []
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        old = baseline[name]
+        new = results[name]
+        ratio = new / old if old else float('inf')
+        rows.append((name, old, new, ratio))
+        if ratio > 1 + threshold:
+            regressions.append(name)
+    return rows, regressions
+
+_import_benchmarks = [
+    ('import/fixedint', 'import fixedint'),
+    ('import/fixedint.UInt32', 'import fixedint; fixedint.UInt32'),
+    ('import/fixedint.aliases.*', 'from fixedint.aliases import *'),
+]
+
+def bench_import(repeat=20, stmt='import fixedint'):
+    ''' Time stmt (by default `import fixedint`) in fresh interpreters, returning the best time in ms. '''
+    import subprocess
+    code = 'import time; t = time.perf_counter(); %s; print(time.perf_counter() - t)' % stmt
+    best = None
+    for _ in range(repeat):
+        out = subprocess.check_output([sys.executable, '-c', code])
+        t = float(out) * 1e3
+        if best is None or t < best:
+            best = t
+    return best
+
+_contention_threads = [1, 2, 4, 8]
+
+def bench_contention(nthreads, variant='fetch_add', ops=20000):
+    ''' Time ops increments per thread of one shared MutableUInt64 from nthreads
+    threads, returning the wall-clock time per increment in ns.
+
+    variant is 'fetch_add' (the atomic method) or 'lock' (x += 1 under a single
+    threading.Lock, the usual alternative).
+    '''
+    import threading
+    from fixedint.aliases import MutableUInt64
+    x = MutableUInt64(0)
+    lock = threading.Lock()
+    barrier = threading.Barrier(nthreads + 1)
+    def worker():
+        barrier.wait()
+        if variant == 'fetch_add':
+            add = x.fetch_add
+            for _ in range(ops):
+                add(1)
+        else:
+            for _ in range(ops):
+                with lock:
+                    x.__iadd__(1)
+        barrier.wait()
+    threads = [threading.Thread(target=worker) for _ in range(nthreads)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    t0 = timeit.default_timer()
+    barrier.wait()
+    t1 = timeit.default_timer()
+    for t in threads:
+        t.join()
+    assert x == nthreads * ops
+    return (t1 - t0) / (nthreads * ops) * 1e9
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog='python -m fixedint.bench', description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('-k', '--filter', help='only run benchmarks matching this glob pattern, e.g. "add/*"')
+    parser.add_argument('-o', '--output', help='save the results as JSON to this file')
+    parser.add_argument('-c', '--compare', help='compare against results saved in this file')
+    parser.add_argument('-t', '--threshold', type=float, default=0.1,
+        help='fail if a benchmark is slower than the baseline by more than this fraction (default 0.1)')
+    parser.add_argument('-n', '--normalize', action='store_true',
+        help='compare times relative to the plain int baseline of each benchmark group')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='timing repetitions per benchmark (default 5)')
+    parser.add_argument('--min-time', type=float, default=0.05, help='minimum seconds per repetition (default 0.05)')
+    parser.add_argument('--list', action='store_true', help='list benchmark names and exit')
+    parser.add_argument('-q', '--quiet', action='store_true', help='do not report progress on stderr')
+    args = parser.parse_args(argv)
+
+    benchmarks = collect(args.filter)
+    if args.list:
+        for name, _, _ in benchmarks:
+            print(name)
+        return 0
+
+    progress = None
+    if not args.quiet:
+        def progress(name, t):
+            sys.stderr.write('%-32s %10.1f ns\n' % (name, t))
+    results = run(benchmarks, args.repeat, args.min_time, progress)
+    for name, stmt in _import_benchmarks:
+        if not args.filter or fnmatch.fnmatch(name, args.filter):
+            results[name] = bench_import(stmt=stmt) * 1e6
+    for variant in ('fetch_add', 'lock'):
+        for n in _contention_threads:
+            name = 'contention/%s/%d' % (variant, n)
+            if not args.filter or fnmatch.fnmatch(name, args.filter):
+                results[name] = min(bench_contention(n, variant) for _ in range(args.repeat))
+
+    report = {
+        'python': platform.python_implementation() + ' ' + platform.python_version(),
+        'unit': 'ns',
+        'results': results,
+    }
+    text = json.dumps(report, indent=1, sort_keys=True)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        rows, regressions = compare(results, baseline, args.threshold, args.normalize)
+        unit = 'x int' if args.normalize else 'ns'
+        for name, old, new, ratio in rows:
+            flag = '  REGRESSION' if name in regressions else ''
+            sys.stderr.write('%-32s %10.1f -> %10.1f %s  x%.2f%s\n' % (name, old, new, unit, ratio, flag))
+        if regressions:
+            sys.stderr.write('%d benchmark(s) regressed by more than %d%%\n' % (len(regressions), args.threshold * 100))
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
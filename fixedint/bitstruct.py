@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+from collections import namedtuple
+from fixedint.base import FixedInt
+
+class BitStruct(object):
+    ''' A fixed-size record layout made of bitfields.
+
+    Fields are given as (name, start, stop), optionally followed by a FixedInt
+    type and a byte order. Bit positions count from the least-significant bit
+    of the integer formed by the record's bytes in the struct's byte order, and
+    stop may be written as a pure-imaginary length, as in FixedInt slicing:
+
+        Header = BitStruct('Header', [
+            ('flags', 0, 4j),
+            ('kind', 4, 8),
+            ('length', 8, 16j),
+            ('offset', 24, 40, Int16),
+        ], byteorder='big')
+        hdr = Header.decode(data)
+        print(hdr.kind, hdr.length)
+
+    The default field type is an unsigned FixedInt of the field's width. A field
+    whose width is a multiple of 8 may specify its own byte order, in which case
+    its bytes are swapped relative to the record's byte order.
+
+    The layout is compiled once into decode and encode functions with constant
+    shifts and masks. Decoded records are namedtuples of FixedInt values.
+    '''
+
+    def __init__(self, name, fields, byteorder='big', size=None):
+        self.name = name
+        self.byteorder = byteorder
+        self.fields = []
+        end = 0
+        for field in fields:
+            fname, start, stop = field[:3]
+            if isinstance(stop, complex):
+                if stop.real:
+                    raise ValueError("invalid stop for field %s: must be integer or pure-imaginary complex number" % fname)
+                stop = int(stop.imag) + start
+            if not 0 <= start < stop:
+                raise ValueError("invalid bit range %d:%d for field %s" % (start, stop, fname))
+            ftype = field[3] if len(field) > 3 and field[3] is not None else FixedInt(stop - start, signed=False)
+            forder = field[4] if len(field) > 4 else byteorder
+            if forder != byteorder and (stop - start) % 8:
+                raise ValueError("field %s must be a whole number of bytes to set its byte order" % fname)
+            self.fields.append((fname, start, stop, ftype, forder))
+            end = max(end, stop)
+
+        if size is None:
+            size = (end + 7) // 8
+        elif size * 8 < end:
+            raise ValueError("fields extend past the end of a %d-byte record" % size)
+        self.size = size
+        self.record = namedtuple(name, [f[0] for f in self.fields])
+        self._compile()
+
+    def __repr__(self):
+        return '<%s %s: %d bytes, %d fields>' % (type(self).__name__, self.name, self.size, len(self.fields))
+
+    def _compile(self):
+        ns = {
+            '_from_bytes': int.from_bytes,
+            '_Record': self.record,
+            '_memoryview': memoryview,
+        }
+        decoders = []
+        args = []
+        encoders = []
+        for i, (fname, start, stop, ftype, forder) in enumerate(self.fields):
+            width = stop - start
+            mask = (1 << width) - 1
+            bits = '(v >> %d & %#x)' % (start, mask)
+            arg = '_a%d' % i
+            val = '(int(%s) & %#x)' % (arg, mask)
+            if forder != self.byteorder:
+                nbytes = width // 8
+                bits = "_from_bytes(%s.to_bytes(%d, 'little'), 'big')" % (bits, nbytes)
+                val = "_from_bytes(%s.to_bytes(%d, 'little'), 'big')" % (val, nbytes)
+            ns['_T%d' % i] = ftype
+            if ftype.width == width and '_box' in ftype.__dict__:
+                # The masked bits are already a valid value of the field type.
+                if ftype.signed:
+                    half = 1 << (width - 1)
+                    bits = '(%s ^ %#x) - %#x' % (bits, half, half)
+                ns['_B%d' % i] = ftype._box
+                decoders.append('_B%d(%s)' % (i, bits))
+            else:
+                decoders.append('_T%d(%s)' % (i, bits))
+            args.append(arg)
+            encoders.append('%s << %d' % (val, start))
+
+        src = '''
+def decode(buffer, offset=0):
+    b = buffer[offset:offset+{size}]
+    if len(b) != {size} or offset < 0:
+        raise ValueError("buffer too small for a record at offset %d" % offset)
+    v = _from_bytes(b, {order!r})
+    return _Record({decoded})
+
+def decode_all(buffer, offset=0, count=None):
+    mv = _memoryview(buffer).cast('B')
+    if count is None:
+        count = (len(mv) - offset) // {size}
+    end = offset + count * {size}
+    if offset < 0 or count < 0 or end > len(mv):
+        raise ValueError("buffer too small for %d records at offset %d" % (count, offset))
+    out = []
+    append = out.append
+    for o in range(offset, end, {size}):
+        v = _from_bytes(mv[o:o+{size}], {order!r})
+        append(_Record({decoded}))
+    return out
+
+def pack_into(buffer, offset, {args}):
+    v = {encoded}
+    buffer[offset:offset+{size}] = v.to_bytes({size}, {order!r})
+
+def pack({args}):
+    v = {encoded}
+    return v.to_bytes({size}, {order!r})
+'''.format(size=self.size, order=self.byteorder, decoded=', '.join(decoders),
+           args=', '.join(args), encoded=' | '.join(encoders) or '0')
+        exec(src, ns)
+        self.decode = ns['decode']
+        self.decode_all = ns['decode_all']
+        self.pack_into = ns['pack_into']
+        self.pack = ns['pack']
+        self.decode.__doc__ = ''' Decode one record at the given offset of a buffer.
+
+        Raises ValueError if the buffer ends before the end of the record. '''
+        self.decode_all.__doc__ = ''' Decode consecutive records from a buffer into a list.
+
+        If count is None, records are decoded up to the end of the buffer. '''
+        self.pack_into.__doc__ = ''' Encode field values into a writable buffer at the given offset.
+
+        Bits not covered by any field are written as zero. '''
+        self.pack.__doc__ = ''' Encode field values into a bytes object. '''
+
+    def encode(self, record=None, **kwargs):
+        ''' Encode a record, or field values given as keyword arguments, to bytes. '''
+        if record is not None:
+            return self.pack(*record)
+        return self.pack(*[kwargs[f[0]] for f in self.fields])
+
+    def encode_all(self, records):
+        ''' Encode a sequence of records into one bytes object. '''
+        records = list(records)
+        out = bytearray(len(records) * self.size)
+        pack_into = self.pack_into
+        offset = 0
+        for record in records:
+            pack_into(out, offset, *record)
+            offset += self.size
+        return bytes(out)
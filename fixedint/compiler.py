@@ -0,0 +1,696 @@
+# -*- coding: utf-8 -*-
+''' Compile functions on FixedInt values into functions on plain ints.
+
+The kernel decorator reads the source of a function whose parameters and local
+variables are annotated with immutable FixedInt types, and generates an
+equivalent function in which those values are plain ints. Ring operations
+(+, -, *, &, |, ^, ~, <<, and unary - and +) are evaluated without masking, and
+a value is only rectified when it must be exact: when it is stored in a
+variable, converted to a different type, or used by an operation whose result
+depends on more than the low bits of its operands (//, %, >>, comparisons,
+indexing). Values that leave the kernel, by being returned, passed to a function
+or stored in a container, are converted back into FixedInt instances.
+
+    @kernel
+    def fnv1a(data: bytes) -> UInt32:
+        h: UInt32 = UInt32(0x811c9dc5)
+        for b in data:
+            h = (h ^ b) * 0x01000193
+        return h
+
+The compiled function computes exactly what the original does. Annotations are
+not conversions: they declare the type a variable has, and the compiler rejects
+assignments of values of another type (write h = UInt32(...) to convert).
+Parameters annotated with a FixedInt type, int, bytes or bytearray, and
+unannotated parameters combined with FixedInt values, are checked when the
+kernel is called; if an argument does not have the expected type (exactly, as
+subclasses may behave differently), the original function is called instead.
+Other values combined with FixedInt values must have a type known to the
+compiler, e.g. by converting them with int(). Type names are resolved once,
+when the function is decorated.
+
+Functions which use constructs the compiler does not handle (closures, nested
+functions, comprehensions, generators, try and with statements, mutable FixedInt
+types, ...) are returned unchanged, unless strict=True is given, in which case
+a TypeError explains why the function could not be compiled.
+'''
+
+import ast
+import builtins
+import functools
+import sys
+
+from fixedint.base import FixedInt, MutableFixedInt, _arith_convert
+
+_prefix = '_fixedint_'
+
+_ring_ops = (ast.Add, ast.Sub, ast.Mult, ast.BitAnd, ast.BitOr, ast.BitXor, ast.LShift)
+_exact_ops = (ast.FloorDiv, ast.Mod, ast.RShift)
+_int_ops = _ring_ops + _exact_ops
+
+_stmt_types = (ast.Assign, ast.AugAssign, ast.AnnAssign, ast.Expr, ast.Return,
+    ast.If, ast.While, ast.For, ast.Break, ast.Continue, ast.Pass, ast.Raise,
+    ast.Assert, ast.Import, ast.ImportFrom)
+_unsupported_exprs = tuple(getattr(ast, n) for n in
+    'Lambda GeneratorExp ListComp SetComp DictComp Await Yield YieldFrom NamedExpr'.split()
+    if hasattr(ast, n))
+
+# Marker for variables whose type has not been inferred yet.
+_unset = object()
+
+class _Unsupported(Exception):
+    pass
+
+def _literal(node):
+    ''' Return the value of an int literal node, or None. '''
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd, ast.Invert)):
+        value = _literal(node.operand)
+        if value is None:
+            return None
+        if isinstance(node.op, ast.USub):
+            return -value
+        if isinstance(node.op, ast.Invert):
+            return ~value
+        return value
+    if isinstance(node, ast.Constant):
+        value = node.value
+    elif sys.version_info < (3, 8) and isinstance(node, ast.Num):
+        value = node.n
+    else:
+        return None
+    if type(value) is int:
+        return value
+    return None
+
+def _fixed_type(obj):
+    ''' Return obj if it is a concrete FixedInt type supported by the compiler. '''
+    if not isinstance(obj, type) or not issubclass(obj, FixedInt) or obj in (FixedInt, MutableFixedInt):
+        return None
+    if obj.mutable:
+        raise _Unsupported("mutable type %s" % obj.__name__)
+    return obj
+
+
+class _Compiler(object):
+    def __init__(self, func, fdef):
+        self.func = func
+        self.fdef = fdef
+        self.globals = func.__globals__
+        self.helpers = {}       # helper name -> value
+        self.helper_names = {}  # id(value) -> helper name
+
+        self.locals = set()
+        self.fixed = {}         # annotated variables -> type
+        self.types = {}         # inferred variable types
+        self.byte_params = set()
+        self.params = []
+        self.guards = {}        # parameter -> types it is checked against on entry
+        self.inferring = False
+        self._check()
+
+    ## Analysis
+    def _check(self):
+        for node in ast.walk(self.fdef):
+            if node is self.fdef:
+                continue
+            if isinstance(node, ast.stmt) and not isinstance(node, _stmt_types):
+                raise _Unsupported("%s statement" % type(node).__name__)
+            if isinstance(node, _unsupported_exprs):
+                raise _Unsupported("%s expression" % type(node).__name__)
+            if isinstance(node, ast.Name) and node.id.startswith(_prefix):
+                raise _Unsupported("reserved name %s" % node.id)
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+                self.locals.add(node.id)
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                for alias in node.names:
+                    self.locals.add((alias.asname or alias.name).split('.')[0])
+
+        args = self.fdef.args
+        params = list(getattr(args, 'posonlyargs', [])) + args.args + args.kwonlyargs
+        for arg in params:
+            self.locals.add(arg.arg)
+            self.params.append(arg.arg)
+            ann = self._annotation(arg.annotation)
+            if _fixed_type(ann):
+                self.fixed[arg.arg] = ann
+                self.guards[arg.arg] = (ann,)
+            elif ann is int:
+                self.types[arg.arg] = int
+                self.guards[arg.arg] = (int,)
+            else:
+                self.types[arg.arg] = None
+                if ann in (bytes, bytearray):
+                    self.byte_params.add(arg.arg)
+                    self.guards[arg.arg] = (bytes, bytearray)
+        for arg in (args.vararg, args.kwarg):
+            if arg is not None:
+                self.locals.add(arg.arg)
+                self.types[arg.arg] = None
+
+        for node in ast.walk(self.fdef):
+            if isinstance(node, ast.AnnAssign) and isinstance(node.target, ast.Name):
+                ann = self._annotation(node.annotation)
+                if _fixed_type(ann):
+                    name = node.target.id
+                    if self.fixed.get(name, ann) is not ann:
+                        raise _Unsupported("%s is annotated with two types" % name)
+                    self.fixed[name] = ann
+
+    def _annotation(self, node):
+        if node is None:
+            return None
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            node = ast.parse(node.value, mode='eval').body
+        try:
+            value = eval(compile(ast.Expression(body=node), '<annotation>', 'eval'), self.globals)
+        except Exception:
+            return None
+        return value
+
+    def _resolve(self, node):
+        ''' Resolve a global or builtin name at decoration time. '''
+        if not isinstance(node, ast.Name) or node.id in self.locals:
+            return None
+        if node.id in self.globals:
+            return self.globals[node.id]
+        return getattr(builtins, node.id, None)
+
+    def infer(self):
+        ''' Infer the types of unannotated local variables. '''
+        self.inferring = True
+        for _ in range(len(self.locals) + 2):
+            self.changed = False
+            self._infer_block(self.fdef.body)
+            if not self.changed:
+                break
+        for name in self.locals:
+            if self.types.get(name, _unset) is _unset:
+                self.types[name] = None
+        self.inferring = False
+
+    def _infer_block(self, body):
+        for stmt in body:
+            if isinstance(stmt, (ast.Assign, ast.AnnAssign)):
+                targets = stmt.targets if isinstance(stmt, ast.Assign) else [stmt.target]
+                if stmt.value is not None:
+                    ty = self.value(stmt.value)[1]
+                    for target in targets:
+                        self._bind(target, ty)
+            elif isinstance(stmt, ast.AugAssign):
+                if isinstance(stmt.target, ast.Name):
+                    load = ast.Name(id=stmt.target.id, ctx=ast.Load())
+                    self._bind(stmt.target, self.value(ast.BinOp(left=load, op=stmt.op, right=stmt.value))[1])
+            elif isinstance(stmt, ast.For):
+                self._bind(stmt.target, self._iter_type(stmt.iter))
+            elif isinstance(stmt, ast.Import) or isinstance(stmt, ast.ImportFrom):
+                for alias in stmt.names:
+                    self._join((alias.asname or alias.name).split('.')[0], None)
+            for field in ('body', 'orelse'):
+                self._infer_block(getattr(stmt, field, []))
+
+    def _bind(self, target, ty):
+        if isinstance(target, ast.Name):
+            self._join(target.id, ty)
+        else:
+            for node in ast.walk(target):
+                if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+                    if node.id in self.fixed:
+                        raise _Unsupported("unpacking into %s" % node.id)
+                    self._join(node.id, None)
+
+    def _join(self, name, ty):
+        if name in self.fixed or ty is _unset:
+            return
+        cur = self.types.get(name, _unset)
+        if cur is _unset:
+            self.types[name] = ty
+        elif cur is ty:
+            return
+        elif cur in (int, None) and ty in (int, None):
+            self.types[name] = None
+        else:
+            raise _Unsupported("%s is assigned both %s and %s values; annotate it"
+                % (name, _typename(cur), _typename(ty)))
+        self.changed = True
+
+    def _iter_type(self, node):
+        if isinstance(node, ast.Call) and self._resolve(node.func) is range:
+            return int
+        if isinstance(node, ast.Name) and node.id in self.byte_params and node.id not in self._assigned_params():
+            return int
+        return None
+
+    def _assigned_params(self):
+        try:
+            return self._reassigned
+        except AttributeError:
+            pass
+        self._reassigned = set(n.id for n in ast.walk(self.fdef)
+            if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Store))
+        return self._reassigned
+
+    def vartype(self, name):
+        if name in self.fixed:
+            return self.fixed[name]
+        return self.types.get(name, _unset)
+
+    ## Code generation helpers
+    def helper(self, value):
+        try:
+            return ast.Name(id=self.helper_names[id(value)], ctx=ast.Load())
+        except KeyError:
+            pass
+        name = '%s%d' % (_prefix, len(self.helpers))
+        self.helpers[name] = value
+        self.helper_names[id(value)] = name
+        return ast.Name(id=name, ctx=ast.Load())
+
+    def rect(self, node, cls):
+        ''' Reduce an int expression to the range of cls. '''
+        mask = (1 << cls.width) - 1
+        value = _literal(node)
+        if value is not None:
+            return ast.Constant(value=cls._rectify(value))
+        if cls.signed:
+            half = 1 << (cls.width - 1)
+            node = ast.BinOp(left=node, op=ast.Add(), right=ast.Constant(value=half))
+            node = ast.BinOp(left=node, op=ast.BitAnd(), right=ast.Constant(value=mask))
+            return ast.BinOp(left=node, op=ast.Sub(), right=ast.Constant(value=half))
+        return ast.BinOp(left=node, op=ast.BitAnd(), right=ast.Constant(value=mask))
+
+    def exact(self, value):
+        node, ty, exact = value
+        if isinstance(ty, type) and ty is not int and not exact:
+            return self.rect(node, ty)
+        return node
+
+    def box(self, value):
+        node, ty, exact = value
+        if isinstance(ty, type) and ty is not int:
+            node = self.exact(value)
+            if '_box' in ty.__dict__:
+                return ast.Call(func=self.helper(ty._box), args=[node], keywords=[])
+            return ast.Call(func=self.helper(ty), args=[node], keywords=[])
+        return node
+
+    def cast(self, value, cls):
+        ''' Convert a value to cls, as cls(value) would. '''
+        node, ty, exact = value
+        if ty is cls:
+            return self.exact(value)
+        if isinstance(ty, type) and ty is not int:
+            if ty.width >= cls.width:
+                return self.rect(node, cls)
+            return self.rect(self.exact(value), cls)
+        if ty is not int:
+            node = ast.Call(func=self.helper(int), args=[node], keywords=[])
+        return self.rect(node, cls)
+
+    def operand(self, value, cls, ring, left):
+        ''' Convert an operand of an operation with result type cls. '''
+        node, ty, exact = value
+        if ty is int:
+            return node
+        if ty is None:
+            if isinstance(node, ast.Name) and node.id in self.params and node.id not in self._assigned_params():
+                # checked to be a plain int on entry
+                self.guards.setdefault(node.id, (int,))
+                return node
+            raise _Unsupported("operand of unknown type combined with %s at line %d; "
+                "convert it with int() or a FixedInt type" % (cls.__name__, node.lineno))
+        if ring and ty.width == cls.width:
+            return node
+        return self.exact(value)
+
+    @staticmethod
+    def exact_in(value, cls):
+        ''' Whether an operand is already exact when used as a cls value. '''
+        node, ty, exact = value
+        if ty is int:
+            literal = _literal(node)
+            return literal is not None and cls.minval <= literal <= cls.maxval
+        if ty is None:
+            return False
+        if ty is cls:
+            return exact
+        return ty.width < cls.width and (cls.signed or not ty.signed)
+
+    ## Expressions
+    def value(self, node):
+        ''' Compile an expression, returning (node, type, exact).
+
+        type is a FixedInt type, int for values known to be plain ints, None for
+        arbitrary values, or _unset while inferring types. Values of a FixedInt
+        type are represented by ints which are only congruent to the true value
+        modulo 2**width unless exact is true.
+        '''
+        method = getattr(self, 'value_' + type(node).__name__, None)
+        if method is not None:
+            return method(node)
+        return self.generic(node), None, False
+
+    def generic(self, node):
+        ''' Compile the children of a node in a context which needs real objects. '''
+        fields = {}
+        for field, old in ast.iter_fields(node):
+            if isinstance(old, ast.expr):
+                fields[field] = self.boxed(old)
+            elif isinstance(old, list):
+                fields[field] = [self.boxed(x) if isinstance(x, ast.expr) else
+                    self.generic(x) if isinstance(x, ast.AST) else x for x in old]
+            elif isinstance(old, ast.AST) and not isinstance(old, (ast.expr_context, ast.operator, ast.cmpop, ast.unaryop, ast.boolop)):
+                fields[field] = self.generic(old)
+            else:
+                fields[field] = old
+        return ast.copy_location(type(node)(**fields), node)
+
+    def boxed(self, node):
+        return self.box(self.value(node))
+
+    def intval(self, node):
+        ''' Compile an expression used only through its integer value. '''
+        return self.exact(self.value(node))
+
+    def test(self, node):
+        ''' Compile an expression used only for its truth value. '''
+        if isinstance(node, ast.BoolOp):
+            return ast.copy_location(ast.BoolOp(op=node.op, values=[self.test(v) for v in node.values]), node)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            return ast.copy_location(ast.UnaryOp(op=node.op, operand=self.test(node.operand)), node)
+        return self.intval(node)
+
+    def value_Constant(self, node):
+        return node, (int if _literal(node) is not None else None), True
+    value_Num = value_Constant
+
+    def value_Name(self, node):
+        if node.id in self.locals:
+            ty = self.vartype(node.id)
+            if ty is _unset and not self.inferring:
+                ty = None
+            return node, ty, True
+        return node, None, False
+
+    def value_BinOp(self, node):
+        left = self.value(node.left)
+        right = self.value(node.right)
+        lt, rt = left[1], right[1]
+        if lt is _unset or rt is _unset:
+            return node, _unset, False
+        ltyped = lt not in (int, None)
+        rtyped = rt not in (int, None)
+        if not ltyped and not rtyped:
+            ty = int if lt is int and rt is int and isinstance(node.op, _int_ops) else None
+            return ast.copy_location(ast.BinOp(left=left[0], op=node.op, right=right[0]), node), ty, False
+        if isinstance(node.op, ast.Div):
+            new = ast.BinOp(left=self.exact(left), op=node.op, right=self.exact(right))
+            return ast.copy_location(new, node), None, False
+        if not isinstance(node.op, _int_ops):
+            new = ast.BinOp(left=self.box(left), op=node.op, right=self.box(right))
+            return ast.copy_location(new, node), None, False
+
+        if ltyped and rtyped:
+            cls = _arith_convert(lt, rt)
+        else:
+            cls = lt if ltyped else rt
+        op = node.op
+        ring = isinstance(op, _ring_ops)
+        new = ast.BinOp(left=self.operand(left, cls, ring, True), op=op,
+            right=self.operand(right, cls, ring and not isinstance(op, ast.LShift), False))
+        if isinstance(op, ast.BitAnd) and not cls.signed:
+            exact = self.exact_in(left, cls) or self.exact_in(right, cls)
+        elif isinstance(op, (ast.BitAnd, ast.BitOr, ast.BitXor)):
+            exact = self.exact_in(left, cls) and self.exact_in(right, cls)
+        elif isinstance(op, ast.RShift):
+            # the left operand was made exact in its own type
+            exact = self.exact_in((left[0], lt, True) if ltyped else left, cls)
+        else:
+            exact = False
+        return ast.copy_location(new, node), cls, exact
+
+    def value_UnaryOp(self, node):
+        if isinstance(node.op, ast.Not):
+            return ast.copy_location(ast.UnaryOp(op=node.op, operand=self.test(node.operand)), node), None, False
+        operand = self.value(node.operand)
+        new = ast.copy_location(ast.UnaryOp(op=node.op, operand=operand[0]), node)
+        ty = operand[1]
+        if ty is _unset:
+            return node, _unset, False
+        if ty is None:
+            return new, None, False
+        if ty is int:
+            return new, int, False
+        if isinstance(node.op, ast.UAdd):
+            return new, ty, operand[2]
+        exact = isinstance(node.op, ast.Invert) and ty.signed and operand[2]
+        return new, ty, exact
+
+    def value_BoolOp(self, node):
+        return ast.copy_location(ast.BoolOp(op=node.op, values=[self.boxed(v) for v in node.values]), node), None, False
+
+    def value_Compare(self, node):
+        for op in node.ops:
+            if isinstance(op, (ast.Is, ast.IsNot)):
+                for operand in [node.left] + node.comparators:
+                    if self.value(operand)[1] not in (int, None):
+                        raise _Unsupported("identity comparison of FixedInt values")
+        new = ast.Compare(left=self.intval(node.left), ops=node.ops,
+            comparators=[self.intval(c) for c in node.comparators])
+        return ast.copy_location(new, node), None, False
+
+    def value_IfExp(self, node):
+        body = self.value(node.body)
+        orelse = self.value(node.orelse)
+        if body[1] is orelse[1] and body[1] not in (int, None):
+            new = ast.IfExp(test=self.test(node.test), body=body[0], orelse=orelse[0])
+            return ast.copy_location(new, node), body[1], body[2] and orelse[2]
+        if _unset in (body[1], orelse[1]):
+            return node, _unset, False
+        new = ast.IfExp(test=self.test(node.test), body=self.box(body), orelse=self.box(orelse))
+        return ast.copy_location(new, node), None, False
+
+    def value_Subscript(self, node):
+        value = self.boxed(node.value)
+        new = ast.Subscript(value=value, slice=self.index(node.slice), ctx=node.ctx)
+        ty = None
+        if isinstance(node.value, ast.Name) and node.value.id in self.byte_params \
+                and node.value.id not in self._assigned_params() and not isinstance(node.slice, ast.Slice):
+            ty = int
+        return ast.copy_location(new, node), ty, False
+
+    def index(self, node):
+        if isinstance(node, ast.Slice):
+            fields = dict((f, None if getattr(node, f) is None else self.intval(getattr(node, f)))
+                for f in ('lower', 'upper', 'step'))
+            return ast.copy_location(ast.Slice(**fields), node)
+        if isinstance(node, ast.Tuple):
+            return ast.copy_location(ast.Tuple(elts=[self.index(e) for e in node.elts], ctx=node.ctx), node)
+        if type(node).__name__ == 'Index':
+            return ast.copy_location(type(node)(value=self.index(node.value)), node)
+        if type(node).__name__ == 'ExtSlice':
+            return ast.copy_location(type(node)(dims=[self.index(d) for d in node.dims]), node)
+        return self.intval(node)
+
+    def value_Call(self, node):
+        target = self._resolve(node.func)
+        if len(node.args) == 1 and not node.keywords and not isinstance(node.args[0], ast.Starred):
+            cls = _fixed_type(target)
+            if cls is not None:
+                arg = self.value(node.args[0])
+                if arg[1] is _unset:
+                    return node, cls, False
+                return self.cast(arg, cls), cls, True
+            if target is int:
+                arg = self.value(node.args[0])
+                if arg[1] not in (int, None, _unset):
+                    return self.exact(arg), int, False
+                return self.generic(node), int, False
+            if target is len:
+                return self.generic(node), int, False
+        return self.generic(node), None, False
+
+    ## Statements
+    def block(self, body):
+        out = []
+        for stmt in body:
+            out.extend(self.stmt(stmt))
+        return out or [ast.Pass()]
+
+    def stmt(self, node):
+        method = getattr(self, 'stmt_' + type(node).__name__, None)
+        if method is not None:
+            new = method(node)
+        else:
+            new = self.generic(node)
+        if isinstance(new, ast.AST):
+            new = [new]
+        for stmt in new:
+            ast.copy_location(stmt, node)
+        return new
+
+    def store(self, name, value):
+        ''' Generate the assignment of a compiled value to a local variable. '''
+        ty = self.vartype(name)
+        if ty not in (int, None):
+            if value[1] is not ty:
+                raise _Unsupported("%s is annotated as %s but assigned a value of type %s; convert it with %s()"
+                    % (name, ty.__name__, _typename(value[1]), ty.__name__))
+            node = self.exact(value)
+        else:
+            node = self.box(value)
+        return ast.Assign(targets=[ast.Name(id=name, ctx=ast.Store())], value=node)
+
+    def target(self, node):
+        if isinstance(node, ast.Subscript):
+            return self.value_Subscript(node)[0]
+        if isinstance(node, ast.Name) and self.vartype(node.id) not in (int, None):
+            raise _Unsupported("multiple assignment to %s" % node.id)
+        return self.generic(node)
+
+    def stmt_Assign(self, node):
+        if len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            return self.store(node.targets[0].id, self.value(node.value))
+        targets = [self.target(t) for t in node.targets]
+        return ast.Assign(targets=targets, value=self.boxed(node.value))
+
+    def stmt_AnnAssign(self, node):
+        if not isinstance(node.target, ast.Name):
+            return self.generic(node)
+        if node.value is None:
+            return ast.Pass()
+        return self.store(node.target.id, self.value(node.value))
+
+    def stmt_AugAssign(self, node):
+        if isinstance(node.target, ast.Name):
+            load = ast.copy_location(ast.Name(id=node.target.id, ctx=ast.Load()), node.target)
+            binop = ast.copy_location(ast.BinOp(left=load, op=node.op, right=node.value), node)
+            return self.store(node.target.id, self.value(binop))
+        return ast.AugAssign(target=self.target(node.target), op=node.op, value=self.boxed(node.value))
+
+    def stmt_Expr(self, node):
+        return ast.Expr(value=self.value(node.value)[0])
+
+    def stmt_If(self, node):
+        return ast.If(test=self.test(node.test), body=self.block(node.body),
+            orelse=self.block(node.orelse) if node.orelse else [])
+
+    def stmt_While(self, node):
+        return ast.While(test=self.test(node.test), body=self.block(node.body),
+            orelse=self.block(node.orelse) if node.orelse else [])
+
+    def stmt_For(self, node):
+        if isinstance(node.target, ast.Name) and self.vartype(node.target.id) not in (int, None):
+            raise _Unsupported("loop variable %s has a FixedInt type" % node.target.id)
+        new = ast.For(target=self.target(node.target), iter=self.boxed(node.iter),
+            body=self.block(node.body), orelse=self.block(node.orelse) if node.orelse else [])
+        if hasattr(node, 'type_comment'):
+            new.type_comment = None
+        return new
+
+    def stmt_Assert(self, node):
+        return ast.Assert(test=self.test(node.test), msg=None if node.msg is None else self.boxed(node.msg))
+
+    def compile(self):
+        self.infer()
+        fdef = self.fdef
+        code = self.block(fdef.body)
+        body = []
+        # check the types of parameters on entry, calling the original
+        # function if they differ, and unbox FixedInt arguments
+        checks = []
+        for name in self.params:
+            if name not in self.guards:
+                continue
+            if name in self.fixed:
+                load = ast.Name(id=name, ctx=ast.Load())
+                body.append(ast.Assign(targets=[ast.Name(id=name, ctx=ast.Store())],
+                    value=ast.Call(func=self.helper(int), args=[load], keywords=[])))
+            cls = ast.Attribute(value=ast.Name(id=name, ctx=ast.Load()), attr='__class__', ctx=ast.Load())
+            types = self.guards[name]
+            if len(types) == 1:
+                checks.append(ast.Compare(left=cls, ops=[ast.IsNot()], comparators=[self.helper(types[0])]))
+            else:
+                checks.append(ast.Compare(left=cls, ops=[ast.NotIn()],
+                    comparators=[ast.Tuple(elts=[self.helper(t) for t in types], ctx=ast.Load())]))
+        if checks:
+            args = fdef.args
+            call = ast.Call(func=self.helper(self.func),
+                args=[ast.Name(id=a.arg, ctx=ast.Load()) for a in list(getattr(args, 'posonlyargs', [])) + args.args],
+                keywords=[ast.keyword(arg=a.arg, value=ast.Name(id=a.arg, ctx=ast.Load())) for a in args.kwonlyargs])
+            if args.vararg is not None:
+                call.args.append(ast.Starred(value=ast.Name(id=args.vararg.arg, ctx=ast.Load()), ctx=ast.Load()))
+            if args.kwarg is not None:
+                call.keywords.append(ast.keyword(arg=None, value=ast.Name(id=args.kwarg.arg, ctx=ast.Load())))
+            test = checks[0] if len(checks) == 1 else ast.BoolOp(op=ast.Or(), values=checks)
+            body.insert(0, ast.If(test=test, body=[ast.Return(value=call)], orelse=[]))
+        for stmt in body:
+            ast.copy_location(stmt, fdef)
+
+        fields = dict(ast.iter_fields(fdef))
+        fields['body'] = body + code
+        fields['decorator_list'] = []
+        fields['returns'] = None
+        newdef = ast.copy_location(type(fdef)(**fields), fdef)
+        return newdef
+
+def _typename(ty):
+    if ty is None:
+        return 'untyped'
+    return ty.__name__
+
+def _compile(func):
+    import inspect
+    import textwrap
+    import types
+
+    if not isinstance(func, types.FunctionType):
+        raise _Unsupported("%r is not a Python function" % (func,))
+    if func.__code__.co_freevars:
+        raise _Unsupported("closures are not supported")
+    if hasattr(func, '__wrapped__'):
+        raise _Unsupported("the function is wrapped by another decorator")
+    try:
+        source = textwrap.dedent(inspect.getsource(func))
+        filename = inspect.getsourcefile(func) or func.__code__.co_filename
+    except (OSError, IOError, TypeError):
+        raise _Unsupported("source code is not available")
+
+    tree = ast.parse(source)
+    ast.increment_lineno(tree, func.__code__.co_firstlineno - 1)
+    fdef = tree.body[0]
+    if not isinstance(fdef, ast.FunctionDef) or fdef.name != func.__name__:
+        raise _Unsupported("could not find the function definition")
+
+    compiler = _Compiler(func, fdef)
+    newdef = compiler.compile()
+
+    # Helpers are passed to a factory function so that the kernel can refer
+    # to them as closure variables, while using the globals of the original.
+    factory = ast.parse('def %sfactory(%s): pass' % (_prefix, ', '.join(compiler.helpers))).body[0]
+    factory.body = [newdef, ast.Return(value=ast.Name(id=fdef.name, ctx=ast.Load()))]
+    ast.copy_location(factory, fdef)
+    module = ast.Module(body=[factory], type_ignores=[])
+    ast.fix_missing_locations(module)
+    code = compile(module, filename, 'exec')
+    factory_code = [c for c in code.co_consts if isinstance(c, types.CodeType)][0]
+    make = types.FunctionType(factory_code, func.__globals__)
+    new = make(*compiler.helpers.values())
+    new.__defaults__ = func.__defaults__
+    new.__kwdefaults__ = func.__kwdefaults__
+    return functools.update_wrapper(new, func)
+
+def kernel(func=None, strict=False):
+    ''' Decorator compiling a function on FixedInt values to one on plain ints.
+
+    Use as @kernel or @kernel(strict=True). The compiled function has the
+    original function as its __wrapped__ attribute. If the function cannot be
+    compiled, it is returned unchanged, or TypeError is raised if strict is true.
+    '''
+    if func is None:
+        return lambda f: kernel(f, strict)
+    try:
+        return _compile(func)
+    except _Unsupported as e:
+        if strict:
+            raise TypeError("cannot compile %s as a kernel: %s" % (getattr(func, '__name__', func), e))
+        return func
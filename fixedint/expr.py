@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+''' Deferred evaluation of arithmetic on FixedIntArrays and FixedInts.
+
+Arithmetic on FixedIntArrays computes a full intermediate array for every
+operator. Wrapping the operands with defer() instead builds an expression
+graph, which evaluate() computes in a single pass over the inputs:
+
+    from fixedint import expr
+    a, b = expr.defer(xs), expr.defer(ys)     # FixedIntArrays
+    s = a + b
+    total, mixed = expr.evaluate(s * 3, (s ^ (s >> 2)) & 0xff)
+
+The result types follow the same promotion rules as FixedInt and FixedIntArray
+arithmetic, and the results are the same as evaluating the expressions
+eagerly. Subexpressions appearing several times (such as s above, or two
+separately built copies of a + b) are computed once per element. The inputs are
+processed block_size elements at a time, so that besides the results, only one
+block's worth of intermediate values is alive at any time.
+'''
+
+from fixedint.base import FixedInt, _arith_convert
+from fixedint.arrays import FixedIntArray, _wrap
+
+__all__ = ['Expr', 'defer', 'evaluate']
+
+_binops = [('add', '+'), ('sub', '-'), ('mul', '*'), ('floordiv', '//'), ('mod', '%'),
+           ('lshift', '<<'), ('rshift', '>>'), ('and', '&'), ('or', '|'), ('xor', '^')]
+_unops = [('neg', '-'), ('invert', '~'), ('pos', '+')]
+# Results of these operations on operands of the result type are already in range.
+_closed_ops = ('&', '|', '^', '>>', '+u')
+# The results of these operations modulo 2**width only depend on the operands
+# modulo 2**width, so plain int operands can be converted to the result type.
+_ring_ops = ('+', '-', '*', '&', '|', '^')
+
+
+class Expr(object):
+    ''' A node of an expression graph.
+
+    op is 'array' or 'scalar' for leaves (value holds the FixedIntArray or the
+    int value), and otherwise an operator applied to the nodes args. dtype is
+    the FixedInt type of the result, and length the number of elements (None
+    for scalar expressions).
+    '''
+    __slots__ = ('op', 'args', 'dtype', 'length', 'value')
+
+    def __init__(self, op, args, dtype, length, value=None):
+        self.op = op
+        self.args = args
+        self.dtype = dtype
+        self.length = length
+        self.value = value
+
+    def __repr__(self):
+        if self.op == 'array':
+            return 'defer(<%s[%d]>)' % (self.dtype.__name__, self.length)
+        if self.op == 'scalar':
+            if self.dtype is None:
+                return '%d' % self.value
+            return '%s(%d)' % (self.dtype.__name__, self.value)
+        if len(self.args) == 1:
+            return '(%s%r)' % (self.op, self.args[0])
+        return '(%r %s %r)' % (self.args[0], self.op, self.args[1])
+
+    def __len__(self):
+        if self.length is None:
+            raise TypeError("scalar expression has no len()")
+        return self.length
+
+    def _binop(self, other, op, reflected):
+        if not isinstance(other, Expr):
+            if isinstance(other, (FixedIntArray, FixedInt, int)):
+                other = defer(other)
+            else:
+                return NotImplemented
+        a, b = (other, self) if reflected else (self, other)
+        if a.length is not None and b.length is not None and a.length != b.length:
+            raise ValueError("array length mismatch: %d != %d" % (a.length, b.length))
+        # Plain int operands take the type of the other operand, as in
+        # FixedInt arithmetic.
+        if a.op == 'scalar' and a.dtype is None:
+            rt = b.dtype
+        elif b.op == 'scalar' and b.dtype is None:
+            rt = a.dtype
+        else:
+            rt = _arith_convert(a.dtype, b.dtype)
+        if rt is None:
+            raise TypeError("cannot infer the type of an expression of plain ints")
+        return Expr(op, (a, b), rt, a.length if a.length is not None else b.length)
+
+    def evaluate(self, block_size=65536):
+        ''' Compute this expression; see evaluate(). '''
+        return evaluate(self, block_size=block_size)[0]
+
+def _binop_factory(op, reflected):
+    def _f(self, other):
+        return self._binop(other, op, reflected)
+    return _f
+
+def _unop_factory(op):
+    def _f(self):
+        return Expr(op + 'u', (self,), self.dtype, self.length)
+    return _f
+
+for _fn, _op in _binops:
+    setattr(Expr, '__%s__' % _fn, _binop_factory(_op, False))
+    setattr(Expr, '__r%s__' % _fn, _binop_factory(_op, True))
+for _fn, _op in _unops:
+    setattr(Expr, '__%s__' % _fn, _unop_factory(_op))
+
+def defer(value):
+    ''' Wrap a FixedIntArray, a FixedInt or a plain int in an expression. '''
+    if isinstance(value, Expr):
+        return value
+    if isinstance(value, FixedIntArray):
+        return Expr('array', (), value.dtype, len(value), value)
+    if isinstance(value, FixedInt):
+        # Mutable values are copied, so that later changes have no effect.
+        return Expr('scalar', (), type(value) if not value.mutable else
+                    FixedInt(value.width, value.signed), None, int(value))
+    if isinstance(value, int):
+        return Expr('scalar', (), None, None, value)
+    raise TypeError("cannot defer %s" % type(value).__name__)
+
+
+## Compilation
+_kernel_cache = {}
+
+def _rect(dtype, expr):
+    m = (1 << dtype.width) - 1
+    if dtype.signed:
+        h = 1 << (dtype.width - 1)
+        return '((%s) + %d & %d) - %d' % (expr, h, m, h)
+    return '(%s) & %d' % (expr, m)
+
+class _Compiler(object):
+    ''' Translates a set of expressions into the body of a loop over elements,
+    with one local per distinct subexpression. '''
+
+    def __init__(self):
+        self.arrays = []        # input arrays, in parameter order
+        self.scalars = []       # scalar inputs
+        self.names = {}         # structural key -> local name
+        self.seen = {}          # id(node) -> local name
+        self.lines = []
+        self.temps = []         # nodes created while compiling, kept alive for seen
+
+    def visit(self, node):
+        name = self.seen.get(id(node))
+        if name is not None:
+            return name
+        # Local names stand for distinct subexpressions, so a node is
+        # identified by its operator, type and the names of its operands.
+        if node.op == 'array':
+            key = ('array', id(node.value))
+        elif node.op == 'scalar':
+            key = ('scalar', node.dtype, node.value)
+        else:
+            operands = list(node.args)
+            if node.op in _ring_ops:
+                for i, a in enumerate(operands):
+                    if a.op == 'scalar' and a.dtype is None:
+                        operands[i] = Expr('scalar', (), node.dtype, None, a.value)
+                        self.temps.append(operands[i])
+            args = [self.visit(a) for a in operands]
+            key = (node.op, node.dtype) + tuple(args)
+        name = self.names.get(key)
+        if name is None:
+            if node.op == 'array':
+                name = 'v%d' % len(self.arrays)
+                self.arrays.append(node.value)
+            elif node.op == 'scalar':
+                name = 'c%d' % len(self.scalars)
+                value = node.value
+                if node.dtype is not None:
+                    value = node.dtype(value)
+                self.scalars.append(int(value))
+            else:
+                if len(args) == 1:
+                    expr = '%s%s' % (node.op[0], args[0])
+                else:
+                    expr = '%s %s %s' % (args[0], node.op, args[1])
+                closed = node.op in _closed_ops and all(a.dtype is node.dtype for a in operands)
+                if node.op == '>>' and operands[0].dtype is node.dtype and operands[1].dtype is None:
+                    closed = True
+                if not closed:
+                    expr = _rect(node.dtype, expr)
+                name = 't%d' % len(self.lines)
+                self.lines.append('%s = %s' % (name, expr))
+            self.names[key] = name
+        self.seen[id(node)] = name
+        return name
+
+def _compile(exprs):
+    ''' Return (kernel, arrays, scalars) computing exprs. kernel(*arrays,
+    *scalars) returns one list per expression. '''
+    comp = _Compiler()
+    results = [comp.visit(e) for e in exprs]
+    params = ['x%d' % i for i in range(len(comp.arrays))] + ['c%d' % i for i in range(len(comp.scalars))]
+    src = ['def _k(%s):' % ', '.join(params)]
+    for i in range(len(exprs)):
+        src.append('    o%d = []; a%d = o%d.append' % (i, i, i))
+    if comp.arrays:
+        n = len(comp.arrays)
+        if n == 1:
+            src.append('    for v0 in x0:')
+        else:
+            src.append('    for %s in zip(%s):' % (', '.join('v%d' % i for i in range(n)),
+                                                   ', '.join('x%d' % i for i in range(n))))
+    else:
+        src.append('    for _ in (0,):')
+    src += ['        ' + line for line in comp.lines]
+    src += ['        a%d(%s)' % (i, r) for i, r in enumerate(results)]
+    src.append('    return %s,' % ', '.join('o%d' % i for i in range(len(exprs))))
+    src = '\n'.join(src)
+    try:
+        kernel = _kernel_cache[src]
+    except KeyError:
+        ns = {}
+        exec(src, ns)
+        if len(_kernel_cache) >= 256:
+            _kernel_cache.clear()
+        kernel = _kernel_cache[src] = ns['_k']
+    return kernel, comp.arrays, comp.scalars
+
+def evaluate(*exprs, **kwargs):
+    ''' Compute expressions together in a single blocked pass over their inputs.
+
+    Returns a list with, for each expression, a FixedIntArray, or an instance
+    of the result type for expressions without array operands. All array
+    operands must have the same length. The keyword argument block_size (default
+    65536) is the number of elements computed at a time.
+    '''
+    block_size = kwargs.pop('block_size', 65536)
+    if kwargs:
+        raise TypeError("unexpected keyword argument %r" % next(iter(kwargs)))
+    if block_size <= 0:
+        raise ValueError("block_size must be positive")
+    exprs = [defer(e) for e in exprs]
+    for e in exprs:
+        if e.dtype is None:
+            raise TypeError("cannot infer the type of an expression of plain ints")
+    lengths = set(e.length for e in exprs if e.length is not None)
+    if len(lengths) > 1:
+        raise ValueError("expressions of different lengths: %s" % sorted(lengths))
+    kernel, arrays, scalars = _compile(exprs)
+    if not lengths:
+        return [e.dtype(vals[0]) for e, vals in zip(exprs, kernel(*scalars))]
+    n = lengths.pop()
+    data = [a._data for a in arrays]
+    outs = [_wrap(e.dtype, ()) for e in exprs]
+    for start in range(0, n, block_size):
+        blocks = [d[start:start + block_size] for d in data]
+        for out, vals in zip(outs, kernel(*(blocks + scalars))):
+            out.extend(vals)
+    return [FixedIntArray._fromdata(e.dtype, out) for e, out in zip(exprs, outs)]
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+''' Opt-in instrumentation for fixedint.
+
+While enabled, every operator call on FixedInt classes is counted per class and
+per operator, together with how often the result had to be truncated (i.e. the
+wraparound actually changed the value). Class cache hits, misses, rebuilds of
+previously collected classes and the time spent creating classes are recorded
+as well.
+
+Instrumentation works by temporarily replacing methods on the FixedInt classes,
+so it has no cost at all while disabled:
+
+    from fixedint import instrument
+    with instrument.instrumented() as report:
+        run_emulator()
+    print(report['ops']['UInt32']['__add__'])  # {'calls': ..., 'truncations': ...}
+'''
+
+import time
+import weakref
+from contextlib import contextmanager
+from fixedint import base
+from fixedint.base import FixedInt, MutableFixedInt, _FixedIntBaseMeta
+
+_enabled = False
+# Classes with replaced methods. The originals are saved on the class itself, so
+# that instrumentation does not keep otherwise unused classes alive.
+_patched = weakref.WeakSet()
+_saved_attr = '_fixedint_instrument_saved'
+_missing = object()
+
+_ops = {}            # class name -> op name -> [calls, truncations]
+_cache = {}
+_created_keys = set()
+
+def _reset_cache_stats():
+    _cache.clear()
+    _cache.update({'hits': 0, 'misses': 0, 'rebuilds': 0, 'create_time': 0.0, 'created': {}})
+_reset_cache_stats()
+
+def _record(cls, op, truncated):
+    try:
+        ops = _ops[cls.__name__]
+    except KeyError:
+        ops = _ops[cls.__name__] = {}
+    try:
+        counts = ops[op]
+    except KeyError:
+        counts = ops[op] = [0, 0]
+    counts[0] += 1
+    if truncated:
+        counts[1] += 1
+
+def _patch(owner, name, value):
+    saved = owner.__dict__.get(_saved_attr)
+    if saved is None:
+        saved = {}
+        setattr(owner, _saved_attr, saved)
+        _patched.add(owner)
+    # saved maps names to (original, wrapper). When patching a method again,
+    # keep the original unless the method was replaced since it was wrapped.
+    current = owner.__dict__.get(name, _missing)
+    entry = saved.get(name)
+    orig = entry[0] if entry is not None and entry[1] is current else current
+    saved[name] = (orig, value)
+    setattr(owner, name, value)
+
+def _is_patched(owner, name):
+    entry = owner.__dict__.get(_saved_attr, {}).get(name)
+    return entry is not None and owner.__dict__.get(name, _missing) is entry[1]
+
+def _unpatch(owner):
+    saved = owner.__dict__[_saved_attr]
+    delattr(owner, _saved_attr)
+    for name, (orig, wrapper) in saved.items():
+        if owner.__dict__.get(name, _missing) is not wrapper:
+            # Replaced since it was wrapped (e.g. by set_value_cache);
+            # restoring the original would undo that change.
+            continue
+        if orig is _missing:
+            delattr(owner, name)
+        else:
+            setattr(owner, name, orig)
+
+## Wrappers
+def _wrap_binary(name, orig):
+    intfunc = getattr(int, name)
+    def _f(self, other):
+        res = orig(self, other)
+        if res is not NotImplemented:
+            _record(type(self), name, intfunc(int(self), int(other)) != int(res))
+        return res
+    _f.__name__ = name
+    _f.__doc__ = orig.__doc__
+    return _f
+
+def _wrap_unary(name, orig):
+    intfunc = getattr(int, name)
+    def _f(self):
+        res = orig(self)
+        _record(type(self), name, intfunc(int(self)) != int(res))
+        return res
+    _f.__name__ = name
+    _f.__doc__ = orig.__doc__
+    return _f
+
+def _wrap_inplace(name, orig):
+    intfunc = getattr(int, name.replace('__i', '__', 1))
+    def _f(self, other):
+        before = int(self)
+        res = orig(self, other)
+        _record(type(self), name, intfunc(before, int(other)) != int(self))
+        return res
+    _f.__name__ = name
+    _f.__doc__ = orig.__doc__
+    return _f
+
+def _pow_truncated(cls, a, b, modulo, res):
+    if b < 0:
+        return False
+    if modulo is not None:
+        return pow(a, b, int(modulo)) != res
+    if abs(a) > 1 and b * (abs(a).bit_length() - 1) > cls.width:
+        # The exact power is at least 2**width, so it was certainly truncated.
+        return True
+    return pow(a, b) != res
+
+def _wrap_pow(name, orig):
+    inplace = name == '__ipow__'
+    def _f(self, other, modulo=None):
+        a = int(self)
+        res = orig(self, other, modulo)
+        val = int(self) if inplace else int(res)
+        _record(type(self), name, _pow_truncated(type(self), a, int(other), modulo, val))
+        return res
+    _f.__name__ = name
+    _f.__doc__ = orig.__doc__
+    return _f
+
+def _wrap_new(orig):
+    def __new__(cls, val=0, base=None):
+        res = orig(cls, val, base)
+        raw = int(val) if base is None else int(val, base)
+        _record(cls, '__new__', raw != int(res))
+        return res
+    __new__.__doc__ = orig.__doc__
+    return __new__
+
+def _wrap_init(orig):
+    def __init__(self, val=0, base=None):
+        orig(self, val, base)
+        raw = int(val) if base is None else int(val, base)
+        _record(type(self), '__init__', raw != int(self))
+    __init__.__doc__ = orig.__doc__
+    return __init__
+
+_binary_names = ['__%s__' % f for f in base._arith_binfunc]
+_unary_names = ['__%s__' % f for f in base._arith_unary]
+_inplace_names = ['__i%s__' % f.split(',')[0] for f in base._inplace_func]
+
+def _instrument_class(cls):
+    # Methods which are already instrumented are skipped, so that this can be
+    # called again after some of the methods were replaced.
+    for name in _binary_names:
+        if name in cls.__dict__ and not _is_patched(cls, name):
+            _patch(cls, name, _wrap_binary(name, cls.__dict__[name]))
+    if cls.mutable:
+        for name in _inplace_names:
+            if name in cls.__dict__ and not _is_patched(cls, name):
+                _patch(cls, name, _wrap_inplace(name, cls.__dict__[name]))
+    elif not _is_patched(cls, '__new__'):
+        orig = cls.__dict__['__new__']
+        _patch(cls, '__new__', staticmethod(_wrap_new(orig.__func__)))
+
+def _wrap_set_value_cache(orig):
+    func = orig.__func__
+    def set_value_cache(cls, maxsize=None):
+        func(cls, maxsize)
+        # The class has new methods, which need to be instrumented again.
+        _instrument_class(cls)
+    set_value_cache.__doc__ = func.__doc__
+    return classmethod(set_value_cache)
+
+def _wrap_class_call(orig):
+    def __call__(self, width, signed=True, mutable=None, lazy=False):
+        key = base._class_key(self, width, signed, mutable, lazy)[0]
+        if key in base._class_cache:
+            _cache['hits'] += 1
+            return orig(self, width, signed, mutable, lazy)
+        start = time.perf_counter()
+        cls = orig(self, width, signed, mutable, lazy)
+        elapsed = time.perf_counter() - start
+        _cache['misses'] += 1
+        _cache['create_time'] += elapsed
+        _cache['created'][cls.__name__] = _cache['created'].get(cls.__name__, 0) + 1
+        if key in _created_keys:
+            _cache['rebuilds'] += 1
+        _created_keys.add(key)
+        if _enabled:
+            _instrument_class(cls)
+        return cls
+    __call__.__doc__ = orig.__doc__
+    return __call__
+
+## Public API
+def enable():
+    ''' Start recording. Has no effect if instrumentation is already enabled. '''
+    global _enabled
+    if _enabled:
+        return
+    _enabled = True
+    _patch(_FixedIntBaseMeta, '__call__', _wrap_class_call(_FixedIntBaseMeta.__dict__['__call__']))
+    # Methods shared by all classes live on the base classes.
+    for name in _unary_names + ['__pow__']:
+        orig = FixedInt.__dict__[name]
+        _patch(FixedInt, name, _wrap_pow(name, orig) if name == '__pow__' else _wrap_unary(name, orig))
+    for name in _unary_names:
+        _patch(MutableFixedInt, name, _wrap_unary(name, MutableFixedInt.__dict__[name]))
+    _patch(MutableFixedInt, '__ipow__', _wrap_pow('__ipow__', MutableFixedInt.__dict__['__ipow__']))
+    _patch(MutableFixedInt, '__init__', _wrap_init(MutableFixedInt.__dict__['__init__']))
+    _patch(FixedInt, 'set_value_cache', _wrap_set_value_cache(FixedInt.__dict__['set_value_cache']))
+    for key, cls in list(base._class_cache.items()):
+        _created_keys.add(key)
+        _instrument_class(cls)
+
+def disable():
+    ''' Stop recording and restore the original methods. Counters are kept. '''
+    global _enabled
+    if not _enabled:
+        return
+    _enabled = False
+    for owner in list(_patched):
+        _unpatch(owner)
+    _patched.clear()
+
+def is_enabled():
+    return _enabled
+
+def reset():
+    ''' Clear all counters. '''
+    _ops.clear()
+    _reset_cache_stats()
+
+def snapshot():
+    ''' Return a copy of the current counters.
+
+    The result is a dict with two entries:
+      'ops': maps class name -> operator name -> {'calls': n, 'truncations': n}.
+        Constructors are recorded as '__new__' (immutable) or '__init__' (mutable).
+      'class_cache': {'hits', 'misses', 'rebuilds', 'create_time', 'created'},
+        where rebuilds counts classes that were created again after being
+        garbage-collected, create_time is in seconds and 'created' maps class
+        names to the number of times they were created.
+    '''
+    ops = {}
+    for clsname, counts in _ops.items():
+        ops[clsname] = dict((op, {'calls': c[0], 'truncations': c[1]}) for op, c in counts.items())
+    cache = dict(_cache)
+    cache['created'] = dict(_cache['created'])
+    return {'ops': ops, 'class_cache': cache}
+
+@contextmanager
+def instrumented(reset_counters=True):
+    ''' Enable instrumentation for the duration of a with block.
+
+    Yields a dict which is filled with the snapshot() of the block when it exits.
+    '''
+    if reset_counters:
+        reset()
+    was_enabled = _enabled
+    report = {}
+    enable()
+    try:
+        yield report
+    finally:
+        if not was_enabled:
+            disable()
+        report.update(snapshot())
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+''' Conversions between FixedInt types and arrays and NumPy, ctypes and buffers.
+
+Each FixedInt class of up to 64 bits corresponds to the smallest machine
+integer type able to hold its values: UInt8 to numpy.uint8 and ctypes.c_uint8,
+Int12 to numpy.int16 and ctypes.c_int16, and so on. Values of odd widths are
+stored masked (or sign-extended) in the larger type, as in FixedIntArray.
+
+Conversions of FixedIntArrays share memory with the other object wherever the
+storage matches, instead of converting the values one by one:
+
+    from fixedint import interop
+    a = FixedIntArray(UInt32, range(10))
+    n = interop.to_numpy(a)             # a numpy.ndarray of uint32 on a's memory
+    b = interop.from_numpy(n[2:5])      # a FixedIntArray on n's memory
+
+NumPy is optional, and only imported by the functions that need it.
+'''
+
+import ctypes
+from array import array
+from fixedint.base import FixedInt
+from fixedint.arrays import FixedIntArray, _storage_typecode
+
+__all__ = ['numpy_dtype', 'ctypes_type', 'fixedint_type', 'to_numpy', 'from_numpy',
+           'to_ctypes', 'from_ctypes', 'as_memoryview']
+
+_ctypes_types = {
+    (1, True): ctypes.c_int8, (1, False): ctypes.c_uint8,
+    (2, True): ctypes.c_int16, (2, False): ctypes.c_uint16,
+    (4, True): ctypes.c_int32, (4, False): ctypes.c_uint32,
+    (8, True): ctypes.c_int64, (8, False): ctypes.c_uint64,
+}
+
+def _storage(cls):
+    ''' Return the array typecode holding values of cls, or raise TypeError. '''
+    tc = _storage_typecode(cls.width, cls.signed)
+    if tc is None:
+        raise TypeError("%d-bit integers have no machine integer type" % cls.width)
+    return tc
+
+def numpy_dtype(cls):
+    ''' Return the NumPy dtype storing values of the FixedInt class cls. '''
+    import numpy
+    return numpy.dtype(_storage(cls))
+
+def ctypes_type(cls):
+    ''' Return the ctypes integer type storing values of the FixedInt class cls. '''
+    return _ctypes_types[array(_storage(cls)).itemsize, cls.signed]
+
+def fixedint_type(t):
+    ''' Return the FixedInt class corresponding to a NumPy dtype (or anything
+    numpy.dtype accepts, such as 'uint16') or a ctypes integer type. '''
+    if isinstance(t, type) and issubclass(t, ctypes._SimpleCData):
+        code = t._type_
+        if code not in 'bBhHiIlLqQ':
+            raise TypeError("%s is not an integer type" % t.__name__)
+        return FixedInt(ctypes.sizeof(t) * 8, signed=code.islower())
+    import numpy
+    dtype = numpy.dtype(t)
+    if dtype.kind not in 'iu':
+        raise TypeError("%s is not an integer dtype" % dtype)
+    return FixedInt(dtype.itemsize * 8, signed=dtype.kind == 'i')
+
+def _check_shared(a):
+    if isinstance(a._data, list):
+        raise TypeError("%d-bit arrays have no machine integer storage" % a.width)
+
+def as_memoryview(a):
+    ''' Return a memoryview of the storage of a FixedIntArray, without copying. '''
+    _check_shared(a)
+    return memoryview(a._data)
+
+def to_numpy(a, copy=False):
+    ''' Convert a FixedIntArray to a one-dimensional numpy.ndarray.
+
+    Unless copy is true, the result shares memory with a. While it exists, a
+    cannot change size.
+    '''
+    import numpy
+    _check_shared(a)
+    res = numpy.frombuffer(a._data, dtype=numpy_dtype(a.dtype))
+    if copy:
+        return res.copy()
+    return res
+
+def _wrap_numpy(numpy, values, cls):
+    ''' Reduce integer values modulo 2**width into the range of cls. '''
+    width = cls.width
+    values = values.astype(numpy.int64 if width < 64 else numpy.uint64)
+    values &= (1 << width) - 1
+    if cls.signed and width < 64:
+        half = 1 << (width - 1)
+        values ^= half
+        values -= half
+    return values
+
+def from_numpy(values, cls=None, copy=False):
+    ''' Convert a one-dimensional integer numpy.ndarray to a FixedIntArray.
+
+    cls defaults to the FixedInt class matching the array's dtype. If the
+    array already has the storage type of cls, is contiguous and in native byte
+    order, and (for odd widths) holds only valid values, the result shares
+    memory with it unless copy is true. Otherwise the values are converted with
+    wraparound, as for FixedIntArray(cls, values).
+    '''
+    import numpy
+    values = numpy.asarray(values)
+    if values.ndim != 1:
+        raise ValueError("expected a one-dimensional array")
+    if values.dtype.kind not in 'iu':
+        raise TypeError("%s is not an integer dtype" % values.dtype)
+    if cls is None:
+        cls = fixedint_type(values.dtype)
+    tc = _storage(cls)
+    dtype = numpy.dtype(tc)
+    shared = values.dtype == dtype and values.flags.c_contiguous and not copy
+    if shared and cls.width != dtype.itemsize * 8 and len(values):
+        shared = int(values.min()) >= cls.minval and int(values.max()) <= cls.maxval
+    if not shared:
+        # Casting between integer dtypes wraps modulo 2**itemsize; odd widths
+        # need to be reduced further.
+        if cls.width != dtype.itemsize * 8:
+            values = _wrap_numpy(numpy, values, cls)
+        values = numpy.ascontiguousarray(values.astype(dtype))
+    data = memoryview(values).cast('B').cast(tc)
+    return FixedIntArray._fromdata(cls, data)
+
+def to_ctypes(a):
+    ''' Return a ctypes array sharing memory with a FixedIntArray. '''
+    _check_shared(a)
+    return (ctypes_type(a.dtype) * len(a)).from_buffer(a._data)
+
+def from_ctypes(obj, cls=None):
+    ''' Return a FixedIntArray sharing memory with a ctypes integer array.
+
+    cls defaults to the FixedInt class matching the element type, and must
+    have that element type as its storage type.
+    '''
+    etype = obj._type_
+    if cls is None:
+        cls = fixedint_type(etype)
+    tc = _storage(cls)
+    if ctypes.sizeof(etype) != array(tc).itemsize or cls.signed != etype._type_.islower():
+        raise TypeError("%s is not stored as %s" % (cls.__name__, etype.__name__))
+    if cls.width != ctypes.sizeof(etype) * 8:
+        for v in obj:
+            if not cls.minval <= v <= cls.maxval:
+                raise ValueError("value %d out of range for %s" % (v, cls.__name__))
+    return FixedIntArray._fromdata(cls, memoryview(obj).cast('B').cast(tc))
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+''' A sparse, paged byte-addressable memory with typed loads and stores.
+
+Memory models the address space of an emulated machine. Pages are allocated
+on the first write to them, so a 64-bit address space costs only the pages
+actually used; unwritten memory reads as zero:
+
+    from fixedint.memory import Memory
+    mem = Memory(byteorder='little')
+    mem.store(0x1000, UInt32(0xdeadbeef))
+    mem.load(0x1002, UInt16)                # UInt16(0xdead)
+    mem.write(0x2ffe, b'\\x01\\x02\\x03\\x04')  # spans two pages
+
+Loads and stores of any width may cross page boundaries. The pages used most
+recently are kept in a small direct-mapped cache in front of the page table,
+so runs of accesses to nearby addresses skip the page table lookup.
+'''
+
+import struct
+import sys
+from fixedint.base import FixedInt
+from fixedint.arrays import FixedIntArray, _decode, _pack_into
+
+__all__ = ['Memory']
+
+_struct_codes = {8: 'b', 16: 'h', 32: 'i', 64: 'q'}
+_codecs = {}
+
+def _codec(cls, byteorder):
+    ''' Return (size, load, store) functions for values of cls in byteorder.
+
+    load(page, offset) returns an instance of cls and store(page, offset, value)
+    writes an integer value, both for values lying within the page.
+    '''
+    key = (cls, byteorder)
+    try:
+        return _codecs[key]
+    except KeyError:
+        pass
+    width = cls.width
+    size = (width + 7) // 8
+    make = cls._box if '_box' in cls.__dict__ else cls
+    rect = cls._rectify
+    if width in _struct_codes:
+        code = _struct_codes[width]
+        if not cls.signed:
+            code = code.upper()
+        st = struct.Struct(('<' if byteorder == 'little' else '>') + code)
+        unpack_from = st.unpack_from
+        pack_into = st.pack_into
+        def load(page, offset):
+            return make(unpack_from(page, offset)[0])
+        def store(page, offset, value):
+            pack_into(page, offset, rect(value))
+    else:
+        from_bytes = int.from_bytes
+        mask = (1 << (size * 8)) - 1
+        def load(page, offset):
+            return make(rect(from_bytes(page[offset:offset+size], byteorder)))
+        def store(page, offset, value):
+            page[offset:offset+size] = (rect(value) & mask).to_bytes(size, byteorder)
+    res = _codecs[key] = (size, load, store)
+    return res
+
+
+class Memory(object):
+    ''' A sparse address space of size bytes, made of page_size-byte pages.
+
+    page_size must be a power of two. byteorder is the default byte order of
+    typed loads and stores. cache_size (a power of two) is the number of
+    recently used pages cached in front of the page table.
+
+    Addresses outside the address space raise IndexError.
+    '''
+
+    def __init__(self, page_size=4096, byteorder=sys.byteorder, cache_size=8, size=1 << 64):
+        if page_size <= 0 or page_size & (page_size - 1):
+            raise ValueError("page_size must be a power of two")
+        if cache_size <= 0 or cache_size & (cache_size - 1):
+            raise ValueError("cache_size must be a power of two")
+        if byteorder not in ('little', 'big'):
+            raise ValueError("byteorder must be 'little' or 'big'")
+        self.page_size = page_size
+        self.byteorder = byteorder
+        self.size = size
+        self._shift = page_size.bit_length() - 1
+        self._offmask = page_size - 1
+        self._pages = {}
+        self._zero = bytes(page_size)
+        # Direct-mapped cache of (page number, page) pairs. Pages that have
+        # not been written are cached as the shared zero page.
+        self._cachemask = cache_size - 1
+        self._cache = [(-1, None)] * cache_size
+
+    def __repr__(self):
+        return '<%s: %d of %d pages allocated>' % (type(self).__name__, len(self._pages), -(-self.size // self.page_size))
+
+    @property
+    def allocated(self):
+        ''' Number of bytes of allocated pages. '''
+        return len(self._pages) * self.page_size
+
+    def pages(self):
+        ''' Return the sorted base addresses of the allocated pages. '''
+        return [n << self._shift for n in sorted(self._pages)]
+
+    def clear(self):
+        ''' Free all pages, making the whole address space read as zero. '''
+        self._pages.clear()
+        self._cache = [(-1, None)] * len(self._cache)
+
+    def _check(self, addr, size):
+        if addr < 0 or addr + size > self.size:
+            raise IndexError("address range 0x%x-0x%x outside of memory" % (addr, addr + size))
+
+    def _page(self, n):
+        ''' Return page n for reading. '''
+        entry = self._cache[n & self._cachemask]
+        if entry[0] == n:
+            return entry[1]
+        page = self._pages.get(n, self._zero)
+        self._cache[n & self._cachemask] = (n, page)
+        return page
+
+    def _wpage(self, n):
+        ''' Return page n for writing, allocating it if needed. '''
+        entry = self._cache[n & self._cachemask]
+        if entry[0] == n and entry[1] is not self._zero:
+            return entry[1]
+        page = self._pages.get(n)
+        if page is None:
+            page = self._pages[n] = bytearray(self.page_size)
+        self._cache[n & self._cachemask] = (n, page)
+        return page
+
+    ## Typed access
+    def load(self, addr, cls, byteorder=None):
+        ''' Load a value of the FixedInt class cls from addr.
+
+        The value occupies (cls.width + 7) // 8 bytes; for odd widths, the
+        excess high bits are discarded as by cls.from_bytes.
+        '''
+        size, load, _ = _codec(cls, byteorder or self.byteorder)
+        addr = int(addr)
+        if addr < 0 or addr + size > self.size:
+            self._check(addr, size)
+        off = addr & self._offmask
+        if off + size <= self.page_size:
+            n = addr >> self._shift
+            entry = self._cache[n & self._cachemask]
+            if entry[0] == n:
+                return load(entry[1], off)
+            return load(self._page(n), off)
+        return load(self.read(addr, size), 0)
+
+    def store(self, addr, value, byteorder=None, cls=None):
+        ''' Store a FixedInt value at addr, in (value.width + 7) // 8 bytes.
+
+        A plain int may be stored by passing its FixedInt class as cls; it is
+        converted with wraparound. '''
+        if cls is None:
+            cls = type(value)
+            if not isinstance(value, FixedInt):
+                raise TypeError("cannot store %s without a FixedInt class" % cls.__name__)
+        size, _, store = _codec(cls, byteorder or self.byteorder)
+        addr = int(addr)
+        if addr < 0 or addr + size > self.size:
+            self._check(addr, size)
+        off = addr & self._offmask
+        if off + size <= self.page_size:
+            n = addr >> self._shift
+            entry = self._cache[n & self._cachemask]
+            if entry[0] == n and entry[1] is not self._zero:
+                store(entry[1], off, int(value))
+            else:
+                store(self._wpage(n), off, int(value))
+        else:
+            buf = bytearray(size)
+            store(buf, 0, int(value))
+            self.write(addr, buf)
+
+    def load_array(self, addr, cls, count, byteorder=None):
+        ''' Load count consecutive values of cls from addr as a FixedIntArray. '''
+        size = (cls.width + 7) // 8
+        data = self.read(addr, count * size)
+        return FixedIntArray._fromdata(cls, _decode(cls, memoryview(data), byteorder or self.byteorder))
+
+    def store_array(self, addr, values, cls=None, byteorder=None):
+        ''' Store consecutive values at addr. values is a FixedIntArray, or an
+        iterable of integers converted to cls. '''
+        if cls is None:
+            if not isinstance(values, FixedIntArray):
+                raise TypeError("cls is required unless values is a FixedIntArray")
+            cls = values.dtype
+        elif not isinstance(values, (list, tuple, FixedIntArray)):
+            values = list(values)
+        buf = bytearray(len(values) * ((cls.width + 7) // 8))
+        _pack_into(cls, buf, 0, values, byteorder or self.byteorder)
+        self.write(addr, buf)
+
+    ## Bulk access
+    def readinto(self, addr, buffer):
+        ''' Fill a writable buffer (e.g. a memoryview) with the bytes at addr. '''
+        with memoryview(buffer) as outer, outer.cast('B') as mv:
+            addr = int(addr)
+            n = len(mv)
+            self._check(addr, n)
+            shift = self._shift
+            pos = 0
+            while pos < n:
+                off = (addr + pos) & self._offmask
+                chunk = min(n - pos, self.page_size - off)
+                page = self._pages.get((addr + pos) >> shift)
+                if page is None:
+                    mv[pos:pos+chunk] = self._zero[:chunk]
+                else:
+                    mv[pos:pos+chunk] = page[off:off+chunk]
+                pos += chunk
+        return n
+
+    def read(self, addr, size):
+        ''' Return size bytes starting at addr, as a bytearray. '''
+        buf = bytearray(size)
+        self.readinto(addr, buf)
+        return buf
+
+    def write(self, addr, data):
+        ''' Write a bytes-like object (e.g. a memoryview) at addr. '''
+        with memoryview(data) as outer, outer.cast('B') as mv:
+            addr = int(addr)
+            n = len(mv)
+            self._check(addr, n)
+            pos = 0
+            while pos < n:
+                off = (addr + pos) & self._offmask
+                chunk = min(n - pos, self.page_size - off)
+                self._wpage((addr + pos) >> self._shift)[off:off+chunk] = mv[pos:pos+chunk]
+                pos += chunk
+        return n
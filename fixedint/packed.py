@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+''' Densely bit-packed arrays of fixed-width integers. '''
+
+from fixedint.base import FixedInt
+from fixedint.arrays import FixedIntArray, _wrap
+
+__all__ = ['PackedArray']
+
+_from_bytes = int.from_bytes
+# Number of 8-value runs converted together by tolist() and encode().
+_BLOCK = 4
+
+def _element_factory(dtype):
+    ''' Return a function making a dtype instance from an unsigned bit pattern. '''
+    if '_box' not in dtype.__dict__:
+        return dtype
+    box = dtype._box
+    if not dtype.signed:
+        return box
+    h = 1 << (dtype.width - 1)
+    return lambda v: box((v ^ h) - h)
+
+
+class PackedArray(object):
+    ''' An array storing each value in exactly dtype.width bits.
+
+    Value i occupies bits i*width to (i+1)*width - 1 of the packed buffer,
+    counting from the least-significant bit of the first byte. Indexing
+    returns instances of dtype; a FixedInt(12) array of a million values takes
+    1.5 MB instead of the 2 MB of a FixedIntArray.
+
+    Slices are views sharing the buffer of the original array. decode() and
+    encode() convert whole ranges at once, which is much faster than
+    indexing value by value:
+
+        a = PackedArray(FixedInt(12, signed=False), samples)
+        a[3] += 1
+        window = a[1000:2000]            # a view
+        values = window.decode()         # a FixedIntArray
+    '''
+    __slots__ = ('_type', '_make', '_buf', '_start', '_step', '_len')
+
+    def __init__(self, dtype, initializer=0):
+        if not (isinstance(dtype, type) and issubclass(dtype, FixedInt) and hasattr(dtype, '_rectify')):
+            raise TypeError("dtype must be a concrete FixedInt class")
+        if isinstance(initializer, int) and not isinstance(initializer, FixedInt):
+            if initializer < 0:
+                raise ValueError("negative array length")
+            values = None
+            count = initializer
+        else:
+            values = initializer if isinstance(initializer, (list, tuple, FixedIntArray)) else list(initializer)
+            count = len(values)
+        self._type = dtype
+        self._make = _element_factory(dtype)
+        self._buf = bytearray((count * dtype.width + 7) // 8)
+        self._start = 0
+        self._step = 1
+        self._len = count
+        if values is not None:
+            self.encode(values)
+
+    @classmethod
+    def frombytes(cls, dtype, data, count=None):
+        ''' Create an array from packed bytes, as returned by tobytes(). The
+        data is copied. If count is None, it is len(data) * 8 // width. '''
+        if count is None:
+            count = len(data) * 8 // dtype.width
+        nbytes = (count * dtype.width + 7) // 8
+        if count < 0 or nbytes > len(data):
+            raise ValueError("buffer too small for %d values" % count)
+        self = cls(dtype)
+        self._buf = bytearray(data[:nbytes])
+        self._len = count
+        # Clear the padding bits, so that tobytes() output is canonical.
+        if count * dtype.width % 8:
+            self._buf[-1] &= (1 << (count * dtype.width % 8)) - 1
+        return self
+
+    def _view(self, start, step, count):
+        view = object.__new__(type(self))
+        view._type = self._type
+        view._make = self._make
+        view._buf = self._buf
+        view._start = start
+        view._step = step
+        view._len = count
+        return view
+
+    @property
+    def dtype(self):
+        ''' Element type of this array. '''
+        return self._type
+
+    @property
+    def width(self):
+        return self._type.width
+
+    @property
+    def nbytes(self):
+        ''' Size of the packed buffer (which may be shared with other views). '''
+        return len(self._buf)
+
+    def __len__(self):
+        return self._len
+
+    def _get(self, bit):
+        width = self._type.width
+        pos = bit >> 3
+        shift = bit & 7
+        return _from_bytes(self._buf[pos:pos + ((shift + width + 7) >> 3)], 'little') >> shift & ((1 << width) - 1)
+
+    def _set(self, bit, val):
+        width = self._type.width
+        pos = bit >> 3
+        shift = bit & 7
+        end = pos + ((shift + width + 7) >> 3)
+        buf = self._buf
+        mask = ((1 << width) - 1) << shift
+        word = _from_bytes(buf[pos:end], 'little')
+        word = word & ~mask | (val << shift) & mask
+        buf[pos:end] = word.to_bytes(end - pos, 'little')
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(self._len)
+            return self._view(self._start + start * self._step, self._step * step, len(range(start, stop, step)))
+        if item < 0:
+            item += self._len
+        if not 0 <= item < self._len:
+            raise IndexError("PackedArray index out of range")
+        dtype = self._type
+        width = dtype.width
+        bit = (self._start + item * self._step) * width
+        pos = bit >> 3
+        shift = bit & 7
+        return self._make(_from_bytes(self._buf[pos:pos + ((shift + width + 7) >> 3)], 'little') >> shift & ((1 << width) - 1))
+
+    def __setitem__(self, item, value):
+        if isinstance(item, slice):
+            view = self[item]
+            if not isinstance(value, (list, tuple, FixedIntArray, PackedArray)):
+                value = list(value)
+            if len(value) != len(view):
+                raise ValueError("cannot assign %d values to a slice of length %d" % (len(value), len(view)))
+            view.encode(value)
+            return
+        if item < 0:
+            item += self._len
+        if not 0 <= item < self._len:
+            raise IndexError("PackedArray assignment index out of range")
+        width = self._type.width
+        bit = (self._start + item * self._step) * width
+        pos = bit >> 3
+        shift = bit & 7
+        end = pos + ((shift + width + 7) >> 3)
+        buf = self._buf
+        mask = ((1 << width) - 1) << shift
+        word = _from_bytes(buf[pos:end], 'little') & ~mask | (int(value) << shift) & mask
+        buf[pos:end] = word.to_bytes(end - pos, 'little')
+
+    def __iter__(self):
+        return iter(self.decode())
+
+    def __eq__(self, other):
+        if isinstance(other, (PackedArray, FixedIntArray)):
+            return self.dtype == other.dtype and self.tolist() == other.tolist()
+        return NotImplemented
+
+    def __ne__(self, other):
+        res = self.__eq__(other)
+        if res is NotImplemented:
+            return res
+        return not res
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '%s(%s, %r)' % (type(self).__name__, self._type.__name__, self.tolist())
+
+    def _patterns(self):
+        ''' Return the values of this array as a list of unsigned bit patterns. '''
+        width = self._type.width
+        n = self._len
+        if self._step != 1:
+            return [self._get((self._start + i * self._step) * width) for i in range(n)]
+        # Each run of 8 values starting at a multiple of 8 occupies exactly
+        # width bytes. Runs are decoded up to _BLOCK at a time from one int.
+        start = self._start
+        stop = start + n
+        head = min(-start % 8, n)
+        out = [self._get(i * width) for i in range(start, start + head)]
+        g0 = (start + head) // 8
+        g1 = stop // 8
+        if g1 > g0:
+            mask = (1 << width) - 1
+            buf = self._buf
+            end = g1 * width
+            step = _BLOCK * width
+            shifts = range(0, 8 * step, width)
+            for pos in range(g0 * width, end, step):
+                if pos + step > end:
+                    shifts = range(0, 8 * (end - pos), width)
+                v = _from_bytes(buf[pos:pos + step], 'little')
+                out += [v >> s & mask for s in shifts]
+        out += [self._get(i * width) for i in range(max(g1 * 8, start + head), stop)]
+        return out
+
+    def tolist(self):
+        ''' Return the values as a list of ints. '''
+        vals = self._patterns()
+        dtype = self._type
+        if dtype.signed:
+            h = 1 << (dtype.width - 1)
+            vals = [(v ^ h) - h for v in vals]
+        return vals
+
+    def decode(self):
+        ''' Return the values as a FixedIntArray. '''
+        return FixedIntArray._fromdata(self._type, _wrap(self._type, self.tolist()))
+
+    def encode(self, values, offset=0):
+        ''' Store values (an iterable of integers, converted to dtype with
+        wraparound) at consecutive positions starting at offset. '''
+        if isinstance(values, PackedArray):
+            values = values._patterns()
+        elif not isinstance(values, (list, tuple, FixedIntArray)):
+            values = list(values)
+        n = len(values)
+        if offset < 0 or offset + n > self._len:
+            raise ValueError("cannot store %d values at offset %d of an array of length %d" % (n, offset, self._len))
+        width = self._type.width
+        mask = (1 << width) - 1
+        if isinstance(values, FixedIntArray):
+            values = values._data
+        if self._step != 1:
+            for i, v in enumerate(values):
+                self._set((self._start + (offset + i) * self._step) * width, int(v) & mask)
+            return
+        start = self._start + offset
+        stop = start + n
+        head = min(-start % 8, n)
+        for i in range(head):
+            self._set((start + i) * width, int(values[i]) & mask)
+        g0 = (start + head) // 8
+        g1 = stop // 8
+        if g1 > g0:
+            buf = self._buf
+            end = g1 * width
+            step = _BLOCK * width
+            shifts = range(0, 8 * step, width)
+            i = head
+            for pos in range(g0 * width, end, step):
+                nbytes = min(step, end - pos)
+                v = 0
+                for s, x in zip(shifts, values[i:i + nbytes * 8 // width]):
+                    v |= (int(x) & mask) << s
+                buf[pos:pos + nbytes] = v.to_bytes(nbytes, 'little')
+                i += nbytes * 8 // width
+        for j in range(max(g1 * 8, start + head), stop):
+            self._set(j * width, int(values[j - start]) & mask)
+
+    def tobytes(self):
+        ''' Return the values packed as bytes, as stored by a new array. '''
+        if self._start == 0 and self._step == 1 and self._len * self._type.width == len(self._buf) * 8:
+            return bytes(self._buf)
+        copy = PackedArray(self._type, self._len)
+        copy.encode(self._patterns())
+        return bytes(copy._buf)
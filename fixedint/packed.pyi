@@ -0,0 +1,30 @@
+from typing import Iterable, Iterator, List, Optional, Type, TypeVar, Union, overload
+from fixedint.base import FixedInt
+from fixedint.arrays import FixedIntArray
+
+PSelf = TypeVar("PSelf", bound="PackedArray")
+
+class PackedArray:
+    def __init__(self, dtype: Type[FixedInt], initializer: Union[int, Iterable[Union[int, FixedInt]]] = 0): ...
+
+    @classmethod
+    def frombytes(cls: Type[PSelf], dtype: Type[FixedInt], data: bytes, count: Optional[int]=None) -> PSelf: ...
+
+    @property
+    def dtype(self) -> Type[FixedInt]: ...
+    @property
+    def width(self) -> int: ...
+    @property
+    def nbytes(self) -> int: ...
+
+    def __len__(self) -> int: ...
+    def __iter__(self) -> Iterator[FixedInt]: ...
+    @overload
+    def __getitem__(self, item: int) -> FixedInt: ...
+    @overload
+    def __getitem__(self: PSelf, item: slice) -> PSelf: ...
+    def __setitem__(self, item: Union[int, slice], value) -> None: ...
+    def tolist(self) -> List[int]: ...
+    def decode(self) -> FixedIntArray: ...
+    def encode(self, values: Iterable[Union[int, FixedInt]], offset: int=0) -> None: ...
+    def tobytes(self) -> bytes: ...
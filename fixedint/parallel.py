@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+''' Process-parallel computation over FixedIntArrays in shared memory.
+
+A SharedArray is a FixedIntArray whose values live in a
+multiprocessing.shared_memory block. The functions of this module split it
+into chunks, and worker processes attach to the block by name and work on
+their chunk in place, so the values are never copied or pickled:
+
+    from fixedint import parallel
+    with parallel.SharedArray(UInt32, data) as shared:
+        parallel.apply(shared, 'mul', 0x01000193)
+        digest = parallel.reduce(shared, 'xor')
+
+Reductions combine the per-chunk results modulo 2**width, in chunk order.
+Since every supported reduction is associative and commutative modulo 2**width,
+the result does not depend on the number of workers or the chunk size.
+'''
+
+import operator
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import reduce as _reduce
+from threading import Lock
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python 3.7
+    shared_memory = None
+
+from fixedint.arrays import FixedIntArray, _pack_into, _array_binfunc
+
+__all__ = ['SharedArray', 'map_chunks', 'apply', 'reduce', 'map_reduce']
+
+_reductions = {
+    'sum': (operator.add, 0),
+    'xor': (operator.xor, 0),
+    'and': (operator.and_, -1),
+    'or': (operator.or_, 0),
+}
+_apply_ops = dict((f.split(',')[0], getattr(operator, '__i%s__' % f.split(',')[0])) for f in _array_binfunc)
+
+
+class SharedArray(object):
+    ''' A FixedIntArray stored in a new shared memory block.
+
+    initializer is a length or an iterable of values, as for FixedIntArray.
+    Only types whose width is 8, 16, 32 or 64 bits are supported (see
+    FixedIntArray.frombuffer). The creating process owns the block: use the
+    SharedArray as a context manager, or call close() and unlink() when done.
+    '''
+
+    def __init__(self, dtype, initializer=0):
+        if isinstance(initializer, int):
+            values = None
+            count = initializer
+        else:
+            values = initializer if isinstance(initializer, FixedIntArray) else list(initializer)
+            count = len(values)
+        if shared_memory is None:
+            raise NotImplementedError("fixedint.parallel requires Python 3.8 or later")
+        if count < 0:
+            raise ValueError("negative array length")
+        if dtype.width not in (8, 16, 32, 64):
+            raise ValueError("cannot share a buffer of %d-bit values" % dtype.width)
+        self._shm = shared_memory.SharedMemory(create=True, size=max(count * dtype.width // 8, 1))
+        self.array = FixedIntArray.frombuffer(dtype, self._shm.buf, 0, count)
+        if values is not None:
+            _pack_into(dtype, self._shm.buf, 0, values, sys.byteorder)
+
+    @property
+    def name(self):
+        ''' Name of the shared memory block. '''
+        return self._shm.name
+
+    @property
+    def dtype(self):
+        return self.array.dtype
+
+    def __len__(self):
+        return len(self.array)
+
+    def __repr__(self):
+        return '<%s %s[%d] at %r>' % (type(self).__name__, self.dtype.__name__, len(self), self.name)
+
+    def close(self):
+        ''' Release this process's mapping of the block. The array becomes unusable. '''
+        self.array._data.release()
+        self._shm.close()
+
+    def unlink(self):
+        ''' Free the shared memory block once every process has closed it. '''
+        self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        self.unlink()
+
+
+## Worker side
+_register_lock = Lock()
+
+def _open(name):
+    ''' Attach to an existing shared memory block. '''
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, track=False)
+    # Before Python 3.13, attaching registers the block with the resource
+    # tracker, which unlinks it when the worker exits, while the owner still
+    # uses it. Registration is disabled for the duration of this call only,
+    # and the lock keeps other threads from attaching at the same time.
+    from multiprocessing import resource_tracker
+    with _register_lock:
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name)
+        finally:
+            resource_tracker.register = register
+
+@contextmanager
+def _attached(spec, start, stop):
+    name, dtype = spec
+    shm = _open(name)
+    try:
+        size = dtype.width // 8
+        chunk = FixedIntArray.frombuffer(dtype, shm.buf, start * size, stop - start)
+        try:
+            yield chunk
+        finally:
+            # Release the chunk even if the function kept a reference to it,
+            # so that the block can be closed.
+            chunk._data.release()
+    finally:
+        shm.close()
+
+def _run(task):
+    kind, spec, start, stop, arg = task
+    with _attached(spec, start, stop) as chunk:
+        if kind == 'map':
+            return arg(chunk)
+        if kind == 'reduce':
+            if arg == 'sum':
+                return sum(chunk._data)
+            func, identity = _reductions[arg]
+            return _reduce(func, chunk._data, identity)
+        if kind == 'map_reduce':
+            return int(arg(chunk))
+        op, other = arg
+        if isinstance(other, tuple):
+            with _attached(other, start, stop) as other_chunk:
+                op(chunk, other_chunk)
+        else:
+            op(chunk, other)
+
+
+## Parent side
+def _tasks(kind, shared, arg, workers, chunksize):
+    n = len(shared)
+    if chunksize is None:
+        chunksize = max(-(-n // (workers * 4)), 1)
+    spec = (shared.name, shared.dtype)
+    return [(kind, spec, start, min(start + chunksize, n), arg) for start in range(0, n, chunksize)]
+
+def _execute(kind, shared, arg, executor, workers, chunksize):
+    if not isinstance(shared, SharedArray):
+        raise TypeError("expected a SharedArray, not %s" % type(shared).__name__)
+    workers = workers or os.cpu_count() or 1
+    tasks = _tasks(kind, shared, arg, workers, chunksize)
+    if executor is None:
+        with ProcessPoolExecutor(min(workers, len(tasks)) or 1) as executor:
+            return list(executor.map(_run, tasks))
+    return list(executor.map(_run, tasks))
+
+def _combine(shared, results, op):
+    func, identity = _reductions[op]
+    return shared.dtype(_reduce(func, results, identity))
+
+def map_chunks(func, shared, executor=None, workers=None, chunksize=None):
+    ''' Call func on each chunk of a SharedArray in worker processes.
+
+    Each chunk is a FixedIntArray sharing memory with the SharedArray, so func
+    may also modify it in place. func must be picklable, and its results are
+    returned as a list in chunk order. The chunk itself is released when func
+    returns, so func must not return it.
+
+    If executor is None, a ProcessPoolExecutor with the given number of workers
+    (by default, one per CPU) is created for the call. Unless chunksize is
+    given, the array is split into about four chunks per worker.
+    '''
+    return _execute('map', shared, func, executor, workers, chunksize)
+
+def apply(shared, op, other, executor=None, workers=None, chunksize=None):
+    ''' Apply an in-place operator elementwise, in worker processes.
+
+    op is the name of a binary operator ('add', 'mul', 'xor', ...), and other is
+    a scalar or a SharedArray of the same length. Values wrap around as with
+    the in-place operators of FixedIntArray.
+    '''
+    try:
+        func = _apply_ops[op]
+    except KeyError:
+        raise ValueError("unknown operator %r" % (op,))
+    if isinstance(other, SharedArray):
+        if len(other) != len(shared):
+            raise ValueError("array length mismatch: %d != %d" % (len(shared), len(other)))
+        other = (other.name, other.dtype)
+    else:
+        other = int(other)
+    _execute('apply', shared, (func, other), executor, workers, chunksize)
+
+def reduce(shared, op='sum', executor=None, workers=None, chunksize=None):
+    ''' Reduce a SharedArray with 'sum', 'xor', 'and' or 'or', modulo 2**width.
+
+    Returns a value of the array's element type.
+    '''
+    if op not in _reductions:
+        raise ValueError("unknown reduction %r" % (op,))
+    return _combine(shared, _execute('reduce', shared, op, executor, workers, chunksize), op)
+
+def map_reduce(func, shared, op='sum', executor=None, workers=None, chunksize=None):
+    ''' Call func on each chunk as in map_chunks, and reduce the (integer)
+    results with 'sum', 'xor', 'and' or 'or' modulo 2**width of the array's
+    element type. '''
+    if op not in _reductions:
+        raise ValueError("unknown reduction %r" % (op,))
+    return _combine(shared, _execute('map_reduce', shared, func, executor, workers, chunksize), op)
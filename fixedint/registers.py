@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+import struct
+import sys
+from fixedint.base import FixedInt
+
+_struct_codes = {8: 'b', 16: 'h', 32: 'i', 64: 'q'}
+_view_classes = {}
+
+def _view_class(cls, byteorder, bit):
+    ''' Return a subclass of the mutable class cls whose value lives in a buffer. '''
+    key = (cls, byteorder, bit)
+    try:
+        return _view_classes[key]
+    except KeyError:
+        pass
+
+    width = cls.width
+    nbytes = (bit + width + 7) // 8
+    rect = cls._rectify
+
+    if bit == 0 and width in _struct_codes:
+        code = _struct_codes[width]
+        if not cls.signed:
+            code = code.upper()
+        st = struct.Struct(('<' if byteorder == 'little' else '>') + code)
+        unpack_from = st.unpack_from
+        pack_into = st.pack_into
+        def _get(self):
+            return unpack_from(self._buf, self._off)[0]
+        def _set(self, val):
+            pack_into(self._buf, self._off, rect(val))
+    else:
+        mask = (1 << width) - 1
+        from_bytes = int.from_bytes
+        def _get(self):
+            off = self._off
+            return rect((from_bytes(self._buf[off:off+nbytes], byteorder) >> bit) & mask)
+        def _set(self, val):
+            buf = self._buf
+            off = self._off
+            word = from_bytes(buf[off:off+nbytes], byteorder)
+            word = (word & ~(mask << bit)) | ((val & mask) << bit)
+            buf[off:off+nbytes] = word.to_bytes(nbytes, byteorder)
+
+    def _newfunc(viewcls, val=0, base=None):
+        # Results of arithmetic on a view are ordinary (unshared) instances.
+        return cls(val, base)
+
+    dict = {
+        '__slots__': ('_buf', '_off'),
+        '__new__': _newfunc,
+        '_val': property(_get, _set),
+        '_view_nbytes': nbytes,
+        '_internal_subclass': True,
+    }
+    viewcls = type(cls)(cls.__name__, (cls,), dict)
+    _view_classes[key] = viewcls
+    return viewcls
+
+def view(cls, buffer, offset=0, byteorder=sys.byteorder, bit=0):
+    ''' Create a mutable integer whose value is stored in a buffer.
+
+    The value occupies cls.width bits starting at bit position `bit` of the
+    integer formed by the bytes at `offset`, read in the given byte order. Reads
+    and writes go straight to the buffer, so several views may alias the same
+    bytes. If cls is immutable or lazily rectified, its ordinary mutable
+    counterpart is used.
+
+    Arithmetic on a view produces ordinary mutable instances; only in-place
+    operators and slice assignment modify the buffer.
+    '''
+    if not cls.mutable or cls.lazy:
+        cls = FixedInt(cls.width, signed=cls.signed, mutable=True)
+    if bit < 0 or offset < 0:
+        raise ValueError("negative offset")
+    viewcls = _view_class(cls, byteorder, bit)
+    mv = memoryview(buffer).cast('B')
+    if offset + viewcls._view_nbytes > len(mv):
+        raise ValueError("buffer too small for a %d-bit value at offset %d" % (cls.width, offset))
+    obj = object.__new__(viewcls)
+    obj._buf = mv
+    obj._off = offset
+    return obj
+
+
+class RegisterFile(object):
+    ''' A set of named, possibly overlapping integer registers sharing one buffer.
+
+    Each field is given as (name, cls, offset) or (name, cls, offset, bit); see
+    view() for the meaning of offset and bit. Registers are accessed as
+    attributes or by name, and support all MutableFixedInt operations:
+
+        regs = RegisterFile([('rax', UInt64, 0), ('eax', UInt32, 0),
+                             ('ax', UInt16, 0), ('al', UInt8, 0), ('ah', UInt8, 1)])
+        regs.eax = 0x12345678
+        regs.al += 1
+        print(hex(regs.rax))   # prints 0x12345679
+
+    If no buffer is given, a zeroed bytearray of the required size is allocated.
+    '''
+
+    def __init__(self, fields, buffer=None, byteorder=sys.byteorder):
+        fields = [tuple(f) + (0,) * (4 - len(f)) for f in fields]
+        size = 0
+        for name, cls, offset, bit in fields:
+            if name.startswith('_') or hasattr(type(self), name):
+                raise ValueError("invalid register name %r" % name)
+            size = max(size, offset + (bit + cls.width + 7) // 8)
+        if buffer is None:
+            buffer = bytearray(size)
+        mv = memoryview(buffer).cast('B')
+        if len(mv) < size:
+            raise ValueError("buffer too small: need %d bytes" % size)
+
+        views = {}
+        for name, cls, offset, bit in fields:
+            if name in views:
+                raise ValueError("duplicate register name %r" % name)
+            views[name] = view(cls, mv, offset, byteorder, bit)
+
+        object.__setattr__(self, '_fields', fields)
+        object.__setattr__(self, '_views', views)
+        object.__setattr__(self, '_buf', mv)
+        # Registers live in the instance dict so that reads are plain lookups.
+        self.__dict__.update(views)
+
+    def __setattr__(self, name, value):
+        try:
+            v = self._views[name]
+        except KeyError:
+            raise AttributeError("no register named %r" % name)
+        # x.reg += y updates the view in place and then assigns it back
+        if value is not v:
+            v._val = int(value)
+
+    def __getitem__(self, name):
+        return self._views[name]
+
+    def __setitem__(self, name, value):
+        v = self._views[name]
+        if value is not v:
+            v._val = int(value)
+
+    def __iter__(self):
+        return iter(self._views)
+
+    def __len__(self):
+        return len(self._views)
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, ', '.join('%s=%#x' % (name, int(v)) for name, v in self._views.items()))
+
+    @property
+    def fields(self):
+        ''' The field declarations as (name, cls, offset, bit) tuples. '''
+        return list(self._fields)
+
+    @property
+    def buffer(self):
+        ''' A memoryview of the underlying storage. '''
+        return self._buf
+
+    def snapshot(self):
+        ''' Return the complete register state as bytes. '''
+        return self._buf.tobytes()
+
+    def restore(self, data):
+        ''' Restore the register state from a snapshot. '''
+        if len(data) != len(self._buf):
+            raise ValueError("snapshot size mismatch: %d != %d" % (len(data), len(self._buf)))
+        self._buf[:] = data
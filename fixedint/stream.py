@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+''' Streaming input and output of fixed-width integer values.
+
+Values are stored as consecutive (width + 7) // 8 byte integers, as with
+unpack_from and pack_into. Files are processed in chunks of chunk_size
+values, so arbitrarily large files are read and written in bounded memory:
+
+    from fixedint import stream
+    with open('capture.bin', 'rb') as f:
+        for chunk in stream.iter_values(f, UInt32, 'big', arrays=True):
+            process(chunk)                  # a FixedIntArray of up to 65536 values
+
+    with open('out.bin', 'wb') as f:
+        stream.write_values(f, UInt16, values)
+'''
+
+import mmap
+import sys
+from fixedint.arrays import FixedIntArray, _decode, _pack_into
+
+__all__ = ['iter_values', 'write_values', 'aiter_values']
+
+def _emit(cls, data, arrays):
+    ''' Return the decoded storage data as a list of values or as an array. '''
+    if arrays:
+        return [FixedIntArray._fromdata(cls, data)]
+    if '_box' in cls.__dict__:
+        # The decoded values are already rectified.
+        return list(map(cls._box, data))
+    return list(map(cls, data))
+
+def _truncated(nbytes, size):
+    return ValueError("stream ends with a partial value (%d of %d bytes)" % (nbytes, size))
+
+def _nonblocking():
+    return ValueError("no data available from a non-blocking stream; use aiter_values")
+
+def iter_values(fileobj, cls, byteorder=sys.byteorder, chunk_size=65536, arrays=False):
+    ''' Iterate over the values of type cls stored in a binary file.
+
+    fileobj may be a file opened in binary mode (or any object with readinto or
+    read, e.g. a pipe or socket file), or an mmap or other buffer, which is
+    decoded in place. Files are read in chunks of chunk_size values into a
+    single reused buffer.
+
+    With arrays=True, FixedIntArrays of up to chunk_size values are produced
+    instead of individual values. A partial value at the end of the stream
+    raises ValueError.
+    '''
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be positive")
+    size = (cls.width + 7) // 8
+    if isinstance(fileobj, mmap.mmap) or not hasattr(fileobj, 'read'):
+        return _iter_buffer(fileobj, cls, byteorder, chunk_size, arrays, size)
+    if hasattr(fileobj, 'readinto'):
+        return _iter_readinto(fileobj, cls, byteorder, chunk_size, arrays, size)
+    return _iter_read(fileobj, cls, byteorder, chunk_size, arrays, size)
+
+def _iter_buffer(buffer, cls, byteorder, chunk_size, arrays, size):
+    with memoryview(buffer) as outer, outer.cast('B') as mv:
+        end = len(mv) - len(mv) % size
+        step = chunk_size * size
+        for start in range(0, end, step):
+            with mv[start:min(start + step, end)] as chunk:
+                data = _decode(cls, chunk, byteorder)
+            for item in _emit(cls, data, arrays):
+                yield item
+        if end != len(mv):
+            raise _truncated(len(mv) - end, size)
+
+def _iter_readinto(fileobj, cls, byteorder, chunk_size, arrays, size):
+    buf = bytearray(chunk_size * size)
+    with memoryview(buf) as mv:
+        filled = 0
+        while True:
+            n = fileobj.readinto(mv[filled:])
+            if n is None:
+                raise _nonblocking()
+            filled += n
+            # Pipes and sockets may return short reads; decode what is there.
+            end = filled - filled % size
+            if end:
+                with mv[:end] as chunk:
+                    data = _decode(cls, chunk, byteorder)
+                for item in _emit(cls, data, arrays):
+                    yield item
+                mv[:filled - end] = mv[end:filled]
+                filled -= end
+            if not n:
+                break
+    if filled:
+        raise _truncated(filled, size)
+
+def _iter_read(fileobj, cls, byteorder, chunk_size, arrays, size):
+    pending = b''
+    while True:
+        block = fileobj.read(chunk_size * size - len(pending))
+        if block is None:
+            raise _nonblocking()
+        if not block:
+            break
+        if pending:
+            block = pending + block
+        end = len(block) - len(block) % size
+        if end:
+            data = _decode(cls, memoryview(block)[:end], byteorder)
+            for item in _emit(cls, data, arrays):
+                yield item
+        pending = block[end:]
+    if pending:
+        raise _truncated(len(pending), size)
+
+def write_values(fileobj, cls, values, byteorder=sys.byteorder, chunk_size=65536):
+    ''' Write values of type cls to a binary file, returning the number written.
+
+    values is an iterable of integers, or of FixedIntArrays (such as the chunks
+    produced by iter_values with arrays=True), or a mix of both. Values are
+    converted to cls, and packed chunk_size values at a time into a single
+    reused buffer.
+    '''
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be positive")
+    size = (cls.width + 7) // 8
+    buf = bytearray(chunk_size * size)
+    count = 0
+    pending = []
+    with memoryview(buf) as mv:
+        def flush(vals):
+            for i in range(0, len(vals), chunk_size):
+                part = vals[i:i+chunk_size]
+                _pack_into(cls, buf, 0, part, byteorder)
+                fileobj.write(mv[:len(part) * size])
+        for v in values:
+            if isinstance(v, FixedIntArray):
+                flush(pending)
+                count += len(pending) + len(v)
+                pending = []
+                flush(v)
+            else:
+                pending.append(v)
+                if len(pending) == chunk_size:
+                    flush(pending)
+                    count += chunk_size
+                    pending = []
+        flush(pending)
+        count += len(pending)
+    return count
+
+async def aiter_values(reader, cls, byteorder=sys.byteorder, chunk_size=65536, arrays=False):
+    ''' Asynchronously iterate over the values of type cls read from an
+    asyncio.StreamReader, as for iter_values:
+
+        async for value in stream.aiter_values(reader, UInt32, 'big'):
+            ...
+    '''
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be positive")
+    size = (cls.width + 7) // 8
+    pending = b''
+    while True:
+        block = await reader.read(chunk_size * size - len(pending))
+        if not block:
+            break
+        if pending:
+            block = pending + block
+        end = len(block) - len(block) % size
+        if end:
+            data = _decode(cls, memoryview(block)[:end], byteorder)
+            for item in _emit(cls, data, arrays):
+                yield item
+        pending = block[end:]
+    if pending:
+        raise _truncated(len(pending), size)
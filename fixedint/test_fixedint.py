@@ -1,8 +1,6 @@
 import unittest
 import sys
 
-PY3K = sys.version_info[0] >= 3
-
 from fixedint import *
 
 tests = []  # type: list[type[unittest.TestCase]]
@@ -33,6 +31,21 @@ class ClassTests(unittest.TestCase):
             pass
         self.assertEqual(str(MyUInt32(32)), '0x00000020')
 
+    def test_mutable_slots(self):
+        import weakref
+        from fixedint.util import HexFormattingMixin
+        x = MutableUInt32(5)
+        self.assertFalse(hasattr(x, '__dict__'))
+        self.assertRaises(AttributeError, setattr, x, 'foo', 1)
+        self.assertTrue(weakref.ref(x)() is x)
+
+        class MyMutableUInt32(HexFormattingMixin, MutableUInt32):  # type: ignore[misc]
+            __slots__ = ()
+        y = MyMutableUInt32(32)
+        y += 1
+        self.assertEqual(str(y), '0x00000021')
+        self.assertFalse(hasattr(y, '__dict__'))
+
 tests.append(ClassTests)
 
 # ----------------------------------------------------------------------------
@@ -122,13 +135,9 @@ class BasicTests(unittest.TestCase):
             self.assertEqual(float(x), 42)
             self.assertEqual(complex(x), 42)
             self.assertEqual(round(x), 42)
-            if not PY3K:
-                self.assertEqual(long(x), 42)
             self.assertEqual(bool(x), True)
-            if sys.version_info[:2] >= (2,5):
-                self.assertEqual(list(range(100))[x], 42)
-            if sys.version_info[:2] >= (2,6):
-                self.assertEqual(math.trunc(x), 42)
+            self.assertEqual(list(range(100))[x], 42)
+            self.assertEqual(math.trunc(x), 42)
 
             x = f16(0)
             self.assertEqual(bool(x), False)
@@ -144,8 +153,6 @@ class BasicTests(unittest.TestCase):
             self.assertTrue(x >= 1000000)
             self.assertTrue(x < 1000001)
             self.assertTrue(x > 999999)
-            if not PY3K:
-                self.assertTrue(cmp(x, 999999) > 0)
 
     def test_implicit_conversion(self):
         f = FixedInt(72)
@@ -168,11 +175,56 @@ class BasicTests(unittest.TestCase):
         self.assertEqual(x.width, 72)
         x >>= 100
         self.assertEqual(x, 0)
+        x += 256
+        x >>= 4
+        self.assertEqual(y, 16)
+        x -= 16
         x += 2
         self.assertEqual(y, 2)
         x **= 70
         self.assertEqual(y, 2**70)
 
+    def test_pow(self):
+        for cls in (Int8, UInt8, Int64, UInt64, FixedInt(77), MutableInt64, MutableUInt8):
+            for a in (0, 1, -1, 3, -3, 0x1234567, -0x7654321):
+                for e in (0, 1, 2, 5, 64, 1000, 10**6 + 3):
+                    expected = cls(pow(a, e, 1 << cls.width))
+                    self.assertEqual(cls(a) ** e, expected)
+                    self.assertEqual(cls(a) ** Int8(e % 100), cls(pow(a, e % 100, 1 << cls.width)))
+                    self.assertEqual(pow(cls(a), e, 1000003), cls(pow(int(cls(a)), e, 1000003)))
+                    if cls.mutable:
+                        x = cls(a)
+                        x **= e
+                        self.assertEqual(x, expected)
+        self.assertEqual(UInt64(3) ** 10**18, UInt64(pow(3, 10**18, 1 << 64)))
+        self.assertEqual(type(Int8(3) ** UInt64(2)), Int8)
+        # A plain int raised to a FixedInt power is a plain int.
+        self.assertEqual(2 ** UInt8(100), 1 << 100)
+        self.assertEqual(type(2 ** UInt8(3)), int)
+        self.assertEqual(type(True ** UInt8(3)), int)
+        self.assertEqual(2 ** MutableUInt8(3), 8)
+
+    def test_result_types(self):
+        from fixedint.util import HexFormattingMixin
+        class MyUInt32(HexFormattingMixin, UInt32):  # type: ignore[misc]
+            pass
+        for _ in range(2):
+            # run twice so that the second pass hits the promotion table
+            self.assertEqual(type(UInt32(1) + 1), UInt32)
+            self.assertEqual(type(1 + UInt32(1)), UInt32)
+            self.assertEqual(type(UInt32(1) + Int64(1)), Int64)
+            self.assertEqual(type(Int64(1) - UInt32(1)), Int64)
+            self.assertEqual(type(UInt64(1) * Int64(1)), UInt64)
+            self.assertEqual(type(MutableUInt8(1) | UInt16(1)), UInt16)
+            self.assertEqual(type(MutableUInt8(1) & MutableUInt8(1)), MutableUInt8)
+            self.assertEqual(type(MyUInt32(1) + 1), MyUInt32)
+            self.assertEqual(type(UInt32(1) + MyUInt32(1)), UInt32)
+            self.assertEqual(MyUInt32(0x1234)[4:8], 3)
+            self.assertEqual(UInt32(3) - 5, (1 << 32) - 2)
+            self.assertEqual(Int8(-128) // -1, -128)
+            self.assertEqual(5 % Int8(3), 2)
+            self.assertEqual(UInt8(1) + 2.5, 3)
+
     def test_str(self):
         for ff in [FixedInt(12), MutableFixedInt(12), FixedInt(91), MutableFixedInt(91)]:
             self.assertEqual(str(ff(1)), '1')
@@ -187,13 +239,9 @@ class ExtraFunctionTests(unittest.TestCase):
     def test_bytes(self):
         for ff in [FixedInt(96), MutableFixedInt(96)]:
             val = ff(-1)
-            if PY3K:
-                byte = lambda c: bytes([c])
-            else:
-                byte = lambda c: chr(c)
-            self.assertEqual(val.to_bytes(), byte(255) * 12)
-            self.assertEqual(val.to_bytes(8), byte(255) * 8)
-            self.assertEqual(ff.from_bytes(byte(255) * 12), val)
+            self.assertEqual(val.to_bytes(), b'\xff' * 12)
+            self.assertEqual(val.to_bytes(8), b'\xff' * 8)
+            self.assertEqual(ff.from_bytes(b'\xff' * 12), val)
 
         for ff in [FixedInt(32), MutableFixedInt(32)]:
             for v in [0xdeadbeef, 0xfeedface, 0x0badf00d, 0x12345678, 0x87654321]:
@@ -217,6 +265,32 @@ class ExtraFunctionTests(unittest.TestCase):
         t = UInt32(32).to_bytes()
         self.assertRaises(ValueError, UInt32.from_bytes, t, signed=True)
 
+    def test_bulk_bytes(self):
+        import struct
+        data = bytes(range(1, 97))
+        for ff in [Int8, UInt16, Int32, UInt64, FixedInt(12), FixedInt(24, signed=False), FixedInt(72)]:
+            size = (ff.width + 7) // 8
+            for endian in ['big', 'little']:
+                expected = [ff.from_bytes(data[i:i+size], byteorder=endian) for i in range(8, 8 + 5 * size, size)]
+                vals = ff.unpack_from(memoryview(data), 8, 5, endian)
+                self.assertEqual(list(vals), expected)
+                buf = bytearray(100)
+                ff.pack_into(buf, 3, vals, endian)
+                packed = b''.join(v.to_bytes(size, byteorder=endian) for v in expected)
+                self.assertEqual(bytes(buf[3:3 + 5 * size]), packed)
+                buf2 = bytearray(100)
+                ff.pack_into(buf2, 3, [int(v) for v in vals], endian)
+                self.assertEqual(buf, buf2)
+
+        self.assertEqual(len(UInt32.unpack_from(data)), 24)
+        self.assertEqual(list(UInt32.unpack_from(data, 93)), [])
+        self.assertEqual(list(UInt32.unpack_from(data, count=2)), list(struct.unpack('=2I', data[:8])))
+        self.assertRaises(ValueError, UInt32.unpack_from, data, 90, 2)
+        self.assertRaises(ValueError, UInt32.pack_into, bytearray(7), 0, [1, 2])
+        buf = bytearray(4)
+        Int16.pack_into(buf, 0, [-1, 0x12345], 'big')
+        self.assertEqual(bytes(buf), b'\xff\xff\x23\x45')
+
     def test_slice_errors(self):
         ff = FixedInt(24)
         val = ff(1024)
@@ -305,6 +379,1461 @@ class ExtraFunctionTests(unittest.TestCase):
 
 tests.append(ExtraFunctionTests)
 
+# ----------------------------------------------------------------------------
+class ArrayTests(unittest.TestCase):
+    def test_storage(self):
+        a = FixedIntArray(UInt32, [1, 2, 3])
+        self.assertEqual(len(a), 3)
+        self.assertEqual(a.itemsize, 4)
+        self.assertEqual(FixedIntArray(FixedInt(12), 5).itemsize, 2)
+        self.assertEqual(FixedIntArray(FixedInt(100), 5).itemsize, None)
+        self.assertEqual(FixedIntArray(Int8, 4).tolist(), [0, 0, 0, 0])
+
+    def test_indexing(self):
+        a = FixedIntArray(Int8, [1, 200, -3])
+        self.assertEqual(a.tolist(), [1, -56, -3])
+        self.assertEqual(type(a[0]), Int8)
+        self.assertEqual(a[-1], -3)
+        self.assertEqual(a[1:], FixedIntArray(Int8, [-56, -3]))
+        a[0] = 255
+        self.assertEqual(a[0], -1)
+        a[1:] = [128, 127]
+        self.assertEqual(a.tolist(), [-1, -128, 127])
+        self.assertEqual(list(a), [Int8(-1), Int8(-128), Int8(127)])
+
+    def test_arith(self):
+        for ff in [FixedInt(12), FixedInt(12, signed=False), Int8, UInt64, FixedInt(80)]:
+            xs = [0, 1, -1, ff.maxval, ff.minval, 1234567]
+            ys = [5, ff.maxval, 3, 2, -7, 99]
+            a = FixedIntArray(ff, xs)
+            b = FixedIntArray(ff, ys)
+            for op in ['__add__', '__sub__', '__mul__', '__and__', '__or__', '__xor__', '__rsub__']:
+                expected = [getattr(ff(x), op)(ff(y)) for x, y in zip(xs, ys)]
+                self.assertEqual(list(getattr(a, op)(b)), expected)
+                expected = [getattr(ff(x), op)(3) for x in xs]
+                self.assertEqual(list(getattr(a, op)(3)), expected)
+            self.assertEqual(list(a << 3), [ff(x) << 3 for x in xs])
+            self.assertEqual(list(a >> 2), [ff(x) >> 2 for x in xs])
+            self.assertEqual(list(~a), [~ff(x) for x in xs])
+            self.assertEqual(list(-a), [-ff(x) for x in xs])
+
+    def test_promotion(self):
+        a = FixedIntArray(UInt8, [250])
+        self.assertEqual((a + FixedIntArray(Int16, [10])).dtype, Int16)
+        self.assertEqual((a + UInt32(10)).dtype, UInt32)
+        self.assertEqual((a + 10).dtype, UInt8)
+        self.assertEqual((a + 10)[0], 4)
+        self.assertRaises(ValueError, lambda: a + FixedIntArray(UInt8, [1, 2]))
+
+    def test_scalar_left(self):
+        a = FixedIntArray(UInt8, [1, 2, 250])
+        self.assertEqual(UInt8(3) + a, FixedIntArray(UInt8, [4, 5, 253]))
+        self.assertEqual((UInt16(3) - a).dtype, UInt16)
+        self.assertEqual(UInt16(3) - a, FixedIntArray(UInt16, [2, 1, 65289]))
+        self.assertEqual(MutableUInt8(2) * a, FixedIntArray(UInt8, [2, 4, 244]))
+        self.assertEqual(Int8(1) ^ a, 1 ^ a)
+        self.assertRaises(TypeError, lambda: UInt8(3) + object())
+        self.assertEqual(UInt8(3) + 2.5, UInt8(5))
+        # The generic operators, used by classes without generated methods
+        from fixedint.base import FixedInt as Base
+        self.assertTrue(Base.__add__(UInt8(3), a) is NotImplemented)
+        self.assertTrue(Base.__add__(UInt8(3), '5') is NotImplemented)
+        self.assertEqual(Base.__add__(UInt8(3), 2.5), UInt8(5))
+        # int() parses these, but they are not numbers.
+        for cls in (UInt8, Int64, MutableUInt8, FixedInt(77)):
+            for other in ('5', b'5', bytearray(b'5'), memoryview(b'5')):
+                self.assertRaises(TypeError, lambda: cls(3) + other)
+                self.assertRaises(TypeError, lambda: other - cls(3))
+        self.assertEqual(UInt16(3) * True, UInt16(3))
+
+    def test_inplace(self):
+        a = FixedIntArray(UInt8, [250, 3])
+        b = a
+        a += FixedIntArray(UInt32, [10, 1])
+        self.assertTrue(a is b)
+        self.assertEqual(a.dtype, UInt8)
+        self.assertEqual(a.tolist(), [4, 4])
+        a ^= 0xff
+        self.assertEqual(b.tolist(), [251, 251])
+
+    def test_frombuffer(self):
+        buf = bytearray(UInt16(0x1234).to_bytes() * 4)
+        a = FixedIntArray.frombuffer(UInt16, buf, 2, 2)
+        self.assertEqual(a.tolist(), [0x1234, 0x1234])
+        a[0] = 0x10000 + 7
+        a += 1
+        self.assertEqual(UInt16.from_bytes(bytes(buf[2:4])), 8)
+        b = a[:]
+        b[0] = 0
+        self.assertEqual(a[0], 8)
+        self.assertRaises(BufferError, a.append, 1)
+        self.assertRaises(ValueError, FixedIntArray.frombuffer, FixedInt(12), buf)
+        self.assertEqual(a.tobytes('big'), b'\x00\x08\x12\x35')
+
+tests.append(ArrayTests)
+
+# ----------------------------------------------------------------------------
+class RegisterTests(unittest.TestCase):
+    def make_regs(self, byteorder='little'):
+        from fixedint.registers import RegisterFile
+        return RegisterFile([
+            ('rax', UInt64, 0), ('eax', UInt32, 0), ('ax', Int16, 0),
+            ('al', UInt8, 0), ('ah', UInt8, 1),
+            ('cf', FixedInt(1, signed=False), 8), ('zf', FixedInt(1, signed=False), 8, 6),
+            ('field', FixedInt(5), 8, 1),
+        ], byteorder=byteorder)
+
+    def test_aliasing(self):
+        regs = self.make_regs()
+        regs.rax = 0x1122334455667788
+        self.assertEqual(regs.eax, 0x55667788)
+        self.assertEqual(regs.ax, 0x7788)
+        self.assertEqual(regs.ah, 0x77)
+        regs.al += 0x80
+        self.assertEqual(regs.rax, 0x1122334455667708)
+        self.assertEqual(regs.ax, 0x7708)
+        regs.ax -= 0x7709
+        self.assertEqual(regs.ax, -1)
+        self.assertEqual(regs.rax, 0x112233445566ffff)
+        regs['eax'] = -1
+        self.assertEqual(regs.rax, 0x11223344ffffffff)
+        regs.ah[0:4] = 0
+        self.assertEqual(regs.eax, 0xfffff0ff)
+        self.assertEqual(type(regs.eax + 1), MutableUInt32)
+
+        big = self.make_regs('big')
+        big.rax = 0x1122334455667788
+        self.assertEqual(big.eax, 0x11223344)
+        self.assertEqual(big.ah, 0x22)
+
+    def test_bitfields(self):
+        regs = self.make_regs()
+        regs.cf = 1
+        regs.zf = 3
+        regs.field = -2
+        self.assertEqual(regs.cf, 1)
+        self.assertEqual(regs.zf, 1)
+        self.assertEqual(regs.field, -2)
+        regs.field -= 15
+        self.assertEqual(regs.field, 15)
+        self.assertEqual(regs.snapshot()[8], 0x5f)
+
+    def test_snapshot(self):
+        regs = self.make_regs()
+        regs.rax = 12345
+        snap = regs.snapshot()
+        self.assertEqual(len(snap), 9)
+        regs.eax = 0
+        self.assertEqual(regs.rax, 0)
+        regs.restore(snap)
+        self.assertEqual(regs.rax, 12345)
+        self.assertRaises(ValueError, regs.restore, b'1234')
+        self.assertRaises(AttributeError, setattr, regs, 'rbx', 1)
+
+    def test_view(self):
+        from fixedint.registers import view
+        buf = bytearray(8)
+        x = view(MutableUInt32, buf, 2, 'big')
+        x += 0x01020304
+        x <<= 8
+        self.assertEqual(bytes(buf), b'\0\0\x02\x03\x04\0\0\0')
+        self.assertEqual(x, 0x02030400)
+        self.assertRaises(ValueError, view, UInt32, buf, 6)
+
+tests.append(RegisterTests)
+
+# ----------------------------------------------------------------------------
+class BitStructTests(unittest.TestCase):
+    def make_struct(self, byteorder='big'):
+        from fixedint.bitstruct import BitStruct
+        return BitStruct('Header', [
+            ('flags', 0, 4j), ('kind', 4, 8), ('length', 8, 16j),
+            ('offset', 24, 40, Int16), ('swapped', 40, 56, UInt16, 'little'),
+            ('reg', 56, 60, MutableUInt8),
+        ], byteorder=byteorder)
+
+    def test_decode(self):
+        data = bytes(bytearray([0x0a, 0x12, 0x34, 0xff, 0xfe, 0x56, 0x78, 0x9a]))
+        hdr = self.make_struct().decode(data)
+        x = UInt64.from_bytes(data, byteorder='big')
+        self.assertEqual(hdr.flags, x[0:4])
+        self.assertEqual(type(hdr.flags), FixedInt(4, signed=False))
+        self.assertEqual(hdr.kind, x[4:8])
+        self.assertEqual(hdr.length, x[8:24])
+        self.assertEqual(hdr.offset, Int16(x[24:40]))
+        self.assertEqual(type(hdr.offset), Int16)
+        self.assertEqual(hdr.swapped, 0x3412)
+        self.assertEqual(hdr.reg, 0xa)
+        self.assertEqual(type(hdr.reg), MutableUInt8)
+
+        hdr = self.make_struct('little').decode(data)
+        x = UInt64.from_bytes(data, byteorder='little')
+        self.assertEqual(hdr.length, x[8:24])
+        self.assertEqual(hdr.offset, Int16(x[24:40]))
+
+    def test_roundtrip(self):
+        st = self.make_struct()
+        self.assertEqual(st.size, 8)
+        data = bytes(bytearray(range(1, 25)))
+        records = st.decode_all(data)
+        self.assertEqual(len(records), 3)
+        self.assertEqual(records[1], st.decode(data, 8))
+        self.assertEqual(st.encode_all(records)[:7], data[:7])
+        self.assertEqual(st.encode(records[2])[1:7], data[17:23])
+        self.assertEqual(st.decode(st.encode(flags=1, kind=2, length=3, offset=-4, swapped=5, reg=6)),
+                         (1, 2, 3, -4, 5, 6))
+        buf = bytearray(10)
+        st.pack_into(buf, 2, 0xf, 0, 0, 0, 0, 0)
+        self.assertEqual(buf[9], 0xf)
+        self.assertRaises(ValueError, st.decode_all, data, 0, 4)
+        self.assertRaises(ValueError, st.decode, data[:7])
+        self.assertRaises(ValueError, st.decode, data, 20)
+        self.assertRaises(ValueError, st.decode, data, -8)
+        self.assertEqual(st.decode(memoryview(data), 16), records[2])
+
+    def test_errors(self):
+        from fixedint.bitstruct import BitStruct
+        self.assertRaises(ValueError, BitStruct, 'X', [('a', 4, 2)])
+        self.assertRaises(ValueError, BitStruct, 'X', [('a', 0, 12, None, 'little')])
+        self.assertRaises(ValueError, BitStruct, 'X', [('a', 0, 12)], size=1)
+
+tests.append(BitStructTests)
+
+# ----------------------------------------------------------------------------
+class BenchTests(unittest.TestCase):
+    def test_collect(self):
+        from fixedint import bench
+        names = [name for name, _, _ in bench.collect()]
+        self.assertEqual(len(names), len(set(names)))
+        for group in ['new', 'add', 'rsub', 'ixor', 'irshift', 'invert', 'getslice', 'setslice',
+                      'from_bytes', 'to_bytes']:
+            self.assertTrue('%s/int' % group in names, group)
+        self.assertTrue('add/MutableUInt64' in names)
+        self.assertTrue('class_create/UInt100' in names)
+        self.assertEqual([name for name, _, _ in bench.collect('add/UInt32')], ['add/int', 'add/UInt32'])
+
+    def test_run_and_compare(self):
+        from fixedint import bench
+        results = bench.run(bench.collect('getslice/Int8'), repeat=1, min_time=0.001)
+        self.assertEqual(sorted(results), ['getslice/Int8', 'getslice/int'])
+        baseline = dict(results)
+        baseline['getslice/Int8'] /= 2
+        rows, regressions = bench.compare(results, baseline, 0.5)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(regressions, ['getslice/Int8'])
+        rows, regressions = bench.compare(results, results, 0.0, normalize=True)
+        self.assertEqual(regressions, [])
+
+tests.append(BenchTests)
+
+# ----------------------------------------------------------------------------
+class InstrumentTests(unittest.TestCase):
+    def test_counters(self):
+        from fixedint import instrument
+        x = UInt8(200)
+        m = MutableInt16(0)
+        with instrument.instrumented() as report:
+            x + 1
+            x + 100
+            -x
+            m += 0x7fff
+            m += 1
+            MutableInt16(1 << 20)
+            x ** 2
+        self.assertFalse(instrument.is_enabled())
+        ops = report['ops']
+        self.assertEqual(ops['UInt8']['__add__'], {'calls': 2, 'truncations': 1})
+        self.assertEqual(ops['UInt8']['__neg__'], {'calls': 1, 'truncations': 1})
+        self.assertEqual(ops['UInt8']['__pow__'], {'calls': 1, 'truncations': 1})
+        self.assertEqual(ops['MutableInt16']['__iadd__'], {'calls': 2, 'truncations': 1})
+        self.assertEqual(ops['MutableInt16']['__init__'], {'calls': 1, 'truncations': 1})
+
+    def test_set_value_cache(self):
+        from fixedint import instrument
+        cls = FixedInt(40, signed=False)
+        try:
+            with instrument.instrumented() as report:
+                cls.set_value_cache(4)
+                cls(5) + 1
+                cls(5) + 1
+            self.assertEqual(report['ops']['UInt40']['__add__']['calls'], 2)
+            self.assertEqual(report['ops']['UInt40']['__new__']['calls'], 2)
+            # Disabling instrumentation keeps the value cache.
+            self.assertTrue(cls(5) is cls(5))
+            self.assertTrue(cls(5) + 1 is cls(6))
+            self.assertFalse('_fixedint_instrument_saved' in cls.__dict__)
+        finally:
+            cls.set_value_cache()
+        self.assertFalse(cls(5) is cls(5))
+
+    def test_class_cache(self):
+        from fixedint import instrument
+        from fixedint.base import _class_cache, _class_lru
+        for key in [(77, True, False), (78, True, False)]:
+            _class_cache.pop(key, None)
+            _class_lru.pop(key, None)
+            instrument._created_keys.discard(key)
+        with instrument.instrumented() as report:
+            FixedInt(77)
+            # simulate the class being garbage-collected
+            del _class_cache[(77, True, False)]
+            del _class_lru[(77, True, False)]
+            FixedInt(77)
+            FixedInt(78)
+            FixedInt(78)
+        cache = report['class_cache']
+        self.assertEqual(cache['misses'], 3)
+        self.assertEqual(cache['hits'], 1)
+        self.assertEqual(cache['rebuilds'], 1)
+        self.assertEqual(cache['created'], {'Int77': 2, 'Int78': 1})
+        self.assertTrue(cache['create_time'] > 0)
+
+    def test_restore(self):
+        from fixedint import instrument
+        orig_add = UInt32.__dict__['__add__']
+        orig_call = type(FixedInt).__dict__['__call__']
+        instrument.enable()
+        try:
+            self.assertFalse(UInt32.__dict__['__add__'] is orig_add)
+            self.assertEqual(UInt32(1) + 1, 2)
+        finally:
+            instrument.disable()
+        self.assertTrue(UInt32.__dict__['__add__'] is orig_add)
+        self.assertTrue(type(FixedInt).__dict__['__call__'] is orig_call)
+        instrument.reset()
+        self.assertEqual(instrument.snapshot()['ops'], {})
+
+tests.append(InstrumentTests)
+
+# ----------------------------------------------------------------------------
+def _fnv1a(data: bytes):
+    h: UInt32 = UInt32(0x811c9dc5)
+    for b in data:
+        h = (h ^ b) * 0x01000193
+    return h
+
+def _mixed(a: Int8, b: UInt16, c: Int32):
+    x = a * b + c
+    y: Int8 = Int8(x >> 3)
+    z = -y // Int8(-1) + a % Int8(7)
+    if z > 5 and not y:
+        return z
+    w = ~a & b ^ c
+    return (x, y, z, w, UInt8(w) << 3, int(w) + 1, w[0:4], x / 2)
+
+def _counter(n: int):
+    i = 0
+    total: UInt8 = UInt8(0)
+    while i < n:
+        total += i
+        i += 1
+    return total, i
+
+def _untyped(h: UInt16, v):
+    return h + v
+
+def _declared(a: UInt8, b: UInt8):
+    y: UInt8 = (b - a) >> 1
+    z: Int8 = Int8(y) * 3
+    return y, z
+
+def _annotated(a: UInt8, b: UInt8):
+    y: Int8 = (b - a) >> 1
+    return y
+
+def _closure_maker():
+    k = UInt32(3)
+    def f(x: UInt32):
+        return x * k
+    return f
+
+class KernelTests(unittest.TestCase):
+    def check(self, func, argsets):
+        from fixedint import kernel
+        compiled = kernel(func, strict=True)
+        self.assertTrue(compiled.__wrapped__ is func)
+        for args in argsets:
+            expected = func(*args)
+            result = compiled(*args)
+            self.assertEqual(result, expected)
+            self.assertEqual(type(result), type(expected))
+            if isinstance(expected, tuple):
+                self.assertEqual([type(x) for x in result], [type(x) for x in expected])
+
+    def test_fnv1a(self):
+        self.check(_fnv1a, [(b'',), (b'a',), (b'hello world',), (bytes(range(256)),)])
+
+    def test_mixed(self):
+        import random
+        rng = random.Random(1)
+        argsets = [(Int8(-128), UInt16(1), Int32(-1))]
+        for _ in range(500):
+            a = Int8(rng.randrange(-128, 128))
+            b = UInt16(rng.randrange(1, 1 << 16))
+            c = Int32(rng.getrandbits(32))
+            argsets.append((a, b, c))
+        self.check(_mixed, argsets)
+
+    def test_loops(self):
+        self.check(_counter, [(0,), (100,)])
+        from fixedint import kernel
+        self.assertEqual(kernel(_counter)(100), (UInt8(4950 & 0xff), 100))
+
+    def test_guards(self):
+        # arguments of unexpected types are passed to the original function
+        self.check(_fnv1a, [(bytearray(b'ab'),), ([UInt64(1) << 40, 2],)])
+        self.check(_untyped, [(UInt16(5), 1), (0x10000 + 5, 1), (UInt16(0xffff), UInt8(2)),
+            (UInt16(0xffff), UInt32(2)), (UInt16(1), 2.5), (UInt16(1), True)])
+        self.check(_counter, [(UInt8(3),), (True,)])
+
+    def test_annotations(self):
+        from fixedint import kernel
+        # annotations declare types; they do not convert values
+        argsets = [(UInt8(1), UInt8(0)), (UInt8(0), UInt8(1)), (UInt8(200), UInt8(7)),
+            (1, 0), (Int8(-3), Int8(5)), (UInt16(300), UInt8(1))]
+        self.check(_declared, argsets)
+        self.assertTrue(kernel(_annotated) is _annotated)
+        self.assertRaises(TypeError, kernel(strict=True), _annotated)
+
+    def test_fallback(self):
+        from fixedint import kernel
+        f = _closure_maker()
+        self.assertTrue(kernel(f) is f)
+        self.assertRaises(TypeError, kernel(strict=True), f)
+
+tests.append(KernelTests)
+
+
+# ----------------------------------------------------------------------------
+class LazyTests(unittest.TestCase):
+    def test_classes(self):
+        L = MutableFixedInt(32, lazy=True)
+        self.assertTrue(L.lazy)
+        self.assertTrue(L.mutable)
+        self.assertTrue(issubclass(L, MutableInt32))
+        self.assertTrue(FixedInt(32, lazy=True) is L)
+        self.assertFalse(MutableInt32.lazy)
+        self.assertFalse(Int32.lazy)
+        self.assertRaises(ValueError, FixedInt, 32, mutable=False, lazy=True)
+        # unsigned classes are always rectified eagerly
+        self.assertTrue(MutableFixedInt(32, signed=False, lazy=True) is MutableUInt32)
+        self.assertFalse(hasattr(L(1), '__dict__'))
+
+    def test_same_results(self):
+        import random
+        import operator
+        rng = random.Random(2)
+        ops = 'iadd isub imul iand ior ixor ilshift irshift ifloordiv imod'.split()
+        for width in (8, 32, 64, 100):
+            L = MutableFixedInt(width, lazy=True)
+            E = MutableFixedInt(width)
+            for _ in range(20):
+                init = rng.getrandbits(width + 4) - (1 << width)
+                lazy, eager = L(init), E(init)
+                for _ in range(30):
+                    op = rng.choice(ops)
+                    if op in ('ilshift', 'irshift'):
+                        other = rng.randrange(width + 3)
+                    else:
+                        other = rng.getrandbits(width + 2) - (1 << width) or 1
+                    lazy = getattr(operator, op)(lazy, other)
+                    eager = getattr(operator, op)(eager, other)
+                    if rng.random() < 0.3:
+                        self.assertEqual(lazy, eager)
+                self.assertEqual(int(lazy), int(eager))
+                self.assertEqual(str(lazy), str(eager))
+                self.assertEqual(lazy[0:4], eager[0:4])
+                self.assertEqual(type(lazy + 1), L)
+                self.assertEqual(lazy + 1, eager + 1)
+
+    def test_bounded(self):
+        x = MutableFixedInt(16, lazy=True)(3)
+        for _ in range(1000):
+            x *= 3
+            self.assertTrue(x._raw.bit_length() <= 64 + 2)
+        self.assertEqual(x, Int16(pow(3, 1001, 1 << 16)))
+
+    def test_view(self):
+        from fixedint.registers import view
+        buf = bytearray(4)
+        v = view(MutableFixedInt(32, lazy=True), buf)
+        v += -1
+        self.assertEqual(buf, b'\xff' * 4)
+
+tests.append(LazyTests)
+
+
+# ----------------------------------------------------------------------------
+def _ref_bits(v, width):
+    return [(v >> i) & 1 for i in range(width)]
+
+def _ref_value(cls, bits):
+    return cls(sum(b << i for i, b in enumerate(bits)))
+
+class BitOpsTests(unittest.TestCase):
+    widths = (8, 12, 16, 24, 32, 64, 100)
+
+    def values(self, cls):
+        import random
+        rng = random.Random(cls.width)
+        return [cls(0), cls(1), cls(-1), cls(cls.minval), cls(cls.maxval)] + \
+            [cls(rng.getrandbits(cls.width)) for _ in range(20)]
+
+    def test_scalar(self):
+        for width in self.widths:
+            for signed in (True, False):
+                for mutable in (False, True):
+                    cls = FixedInt(width, signed=signed, mutable=mutable)
+                    for x in self.values(cls):
+                        bits = _ref_bits(int(x), width)
+                        for n in (0, 1, 5, width - 1, width, width + 3, -2):
+                            k = n % width
+                            self.assertEqual(x.rotl(n), _ref_value(cls, bits[-k:] + bits[:-k] if k else bits))
+                            self.assertEqual(x.rotr(n), _ref_value(cls, bits[k:] + bits[:k]))
+                            self.assertEqual(type(x.rotl(n)), cls)
+                        self.assertEqual(x.popcount(), sum(bits))
+                        self.assertEqual(x.clz(), (bits[::-1] + [1]).index(1))
+                        self.assertEqual(x.ctz(), (bits + [1]).index(1))
+                        self.assertEqual(x.bit_reverse(), _ref_value(cls, bits[::-1]))
+                        if width % 8 == 0:
+                            swapped = cls.from_bytes(x.to_bytes(byteorder='big'))
+                            self.assertEqual(x.bswap(), swapped)
+                            self.assertEqual(type(x.bswap()), cls)
+                        else:
+                            self.assertRaises(ValueError, x.bswap)
+
+    def test_examples(self):
+        self.assertEqual(UInt32(0x12345678).rotl(8), 0x34567812)
+        self.assertEqual(UInt32(0x12345678).rotr(4), 0x81234567)
+        self.assertEqual(UInt32(0x12345678).bswap(), 0x78563412)
+        self.assertEqual(UInt32(1).bit_reverse(), 0x80000000)
+        self.assertEqual(Int8(-2).rotl(1), -3)
+        self.assertEqual(Int8(-1).popcount(), 8)
+        self.assertEqual(UInt16(0).clz(), 16)
+        self.assertEqual(Int16(-32768).ctz(), 15)
+        self.assertEqual(MutableFixedInt(32, lazy=True)(-1).rotl(3), -1)
+
+    def test_arrays(self):
+        for width in self.widths:
+            for signed in (True, False):
+                cls = FixedInt(width, signed=signed)
+                vals = self.values(cls)
+                a = FixedIntArray(cls, vals)
+                for name, args in [('rotl', (3,)), ('rotr', (width + 1,)), ('bit_reverse', ()), ('bswap', ())]:
+                    if name == 'bswap' and width % 8:
+                        self.assertRaises(ValueError, a.bswap)
+                        continue
+                    res = getattr(a, name)(*args)
+                    self.assertEqual(res.dtype, cls)
+                    self.assertEqual(res.tolist(), [getattr(v, name)(*args) for v in vals])
+                for name in ('popcount', 'clz', 'ctz'):
+                    res = getattr(a, name)()
+                    self.assertEqual(res.dtype, UInt8)
+                    self.assertEqual(res.tolist(), [getattr(v, name)() for v in vals])
+        # arrays sharing memory with a buffer
+        buf = bytearray(b'\x01\x02\x03\x04\x05\x06\x07\x08')
+        a = FixedIntArray.frombuffer(UInt32, buf)
+        self.assertEqual(a.bswap().tolist(), [v.bswap() for v in a])
+        self.assertEqual(a.bit_reverse().tolist(), [v.bit_reverse() for v in a])
+        self.assertEqual(buf, b'\x01\x02\x03\x04\x05\x06\x07\x08')
+        self.assertEqual(FixedIntArray(FixedInt(300), [1]).clz().dtype, UInt16)
+
+tests.append(BitOpsTests)
+
+
+# ----------------------------------------------------------------------------
+class FlagsTests(unittest.TestCase):
+    def reference(self, cls, op, a, b, c):
+        w = cls.width
+        ua, ub = a % (1 << w), b % (1 << w)
+        sa, sb = ua - (ua >> (w - 1) << w), ub - (ub >> (w - 1) << w)
+        lo, hi = -(1 << (w - 1)), 1 << (w - 1)
+        if op == 'add':
+            u, s = ua + ub + c, sa + sb + c
+        elif op == 'sub':
+            u, s = ua - ub - c, sa - sb - c
+        elif op == 'neg':
+            u, s = -ua, -sa
+        elif op == 'mul':
+            u, s = ua * ub, sa * sb
+        if op in ('add', 'sub', 'neg', 'mul'):
+            carry = not 0 <= u < (1 << w)
+            overflow = not lo <= s < hi
+        elif op == 'shl':
+            u, s = ua << b, sa << b
+            carry = 0 < b <= w and (ua >> (w - b)) & 1 == 1
+            overflow = not lo <= s < hi
+        elif op == 'shr':
+            v = sa if cls.signed else ua
+            u = v >> b
+            carry = b > 0 and (v >> (b - 1)) & 1 == 1
+            overflow = False
+        r = u % (1 << w)
+        return cls(r), (carry, overflow, r == 0, r >> (w - 1) == 1)
+
+    def test_flags(self):
+        import random
+        rng = random.Random(13)
+        for width in (8, 16, 33, 64):
+            for signed in (True, False):
+                for mutable in (False, True):
+                    cls = FixedInt(width, signed=signed, mutable=mutable)
+                    special = [0, 1, cls.maxval, cls.minval, (1 << width) - 1]
+                    for _ in range(50):
+                        a = rng.choice(special + [rng.getrandbits(width)])
+                        b = rng.choice(special + [rng.getrandbits(width)])
+                        n = rng.randrange(width + 3)
+                        c = rng.randrange(2)
+                        cases = [('add', (a, b, c), b, c), ('sub', (a, b, c), b, c), ('neg', (a,), 0, 0),
+                                 ('mul', (a, b), b, 0), ('shl', (a, n), n, 0), ('shr', (a, n), n, 0)]
+                        for op, args, b2, c2 in cases:
+                            exp, expflags = self.reference(cls, op, a, b2, c2)
+                            res, flags = getattr(cls, op + '_with_flags')(*args)
+                            self.assertEqual(type(res), cls)
+                            self.assertEqual(res, exp)
+                            self.assertEqual(tuple(flags), expflags)
+                            if mutable:
+                                x = cls(a)
+                                flags = getattr(x, 'i%s_with_flags' % op)(*args[1:])
+                                self.assertEqual(x, exp)
+                                self.assertEqual(tuple(flags), expflags)
+
+    def test_examples(self):
+        self.assertEqual(UInt8.add_with_flags(0xff, 1), (0, Flags(carry=True, overflow=False, zero=True, sign=False)))
+        self.assertEqual(Int8.add_with_flags(127, 1), (-128, Flags(False, True, False, True)))
+        self.assertEqual(UInt8.sub_with_flags(0, 1), (255, Flags(True, False, False, True)))
+        self.assertEqual(UInt8.sub_with_flags(5, 2, borrow_in=True), (2, Flags(False, False, False, False)))
+        self.assertTrue(Int32.neg_with_flags(Int32.minval)[1].overflow)
+        self.assertEqual(UInt16.mul_with_flags(0xffff, 0xffff), (1, Flags(True, False, False, False)))
+        self.assertEqual(UInt8.shl_with_flags(0x81, 1), (2, Flags(True, True, False, False)))
+        self.assertEqual(Int8.shr_with_flags(-3, 1), (-2, Flags(True, False, False, True)))
+        self.assertRaises(ValueError, UInt8.shl_with_flags, 1, -1)
+        x = MutableFixedInt(32, lazy=True)(0x7fffffff)
+        self.assertEqual(x.iadd_with_flags(1), Flags(False, True, False, True))
+        self.assertEqual(x, -0x80000000)
+
+tests.append(FlagsTests)
+
+
+# ----------------------------------------------------------------------------
+from fixedint.util import HexFormattingMixin
+
+# User subclasses must be defined at module level to be picklable.
+class PickledHexUInt32(HexFormattingMixin, UInt32):  # type: ignore[misc]
+    pass
+
+class PickledHexMutableUInt16(HexFormattingMixin, MutableUInt16):  # type: ignore[misc]
+    pass
+
+class PickleTests(unittest.TestCase):
+    def test_values(self):
+        import pickle
+        from fixedint.registers import view
+        buf = bytearray(4)
+        v = view(MutableUInt32, buf)
+        v += 9
+        values = [UInt32(5), Int8(-3), FixedInt(13)(5), FixedInt(100, signed=False)(1 << 99),
+                  MutableUInt32(7), MutableFixedInt(77)(-1), MutableFixedInt(32, lazy=True)(3)]
+        for proto in range(pickle.HIGHEST_PROTOCOL + 1):
+            for x in values:
+                y = pickle.loads(pickle.dumps(x, proto))
+                self.assertTrue(type(y) is type(x))
+                self.assertEqual(y, x)
+            # views are pickled as their value
+            y = pickle.loads(pickle.dumps(v, proto))
+            self.assertTrue(type(y) is MutableUInt32)
+            self.assertEqual(y, 9)
+            y += 1
+            self.assertEqual(v, 9)
+
+    def test_classes(self):
+        import pickle
+        for cls in (FixedInt(13), UInt32, FixedInt(300, signed=False), MutableFixedInt(5), MutableFixedInt(64, lazy=True)):
+            self.assertTrue(pickle.loads(pickle.dumps(cls)) is cls)
+
+    def test_subclasses(self):
+        import pickle
+        from fixedint import trace
+        for proto in range(pickle.HIGHEST_PROTOCOL + 1):
+            for cls in (PickledHexUInt32, PickledHexMutableUInt16):
+                self.assertTrue(pickle.loads(pickle.dumps(cls, proto)) is cls)
+                y = pickle.loads(pickle.dumps(cls(32), proto))
+                self.assertTrue(type(y) is cls)
+                self.assertEqual(str(y), str(cls(32)))
+            # traced instances are pickled as their ordinary class
+            x = trace.trace(MutableUInt16(5), trace.TraceBuffer(4))
+            self.assertTrue(type(pickle.loads(pickle.dumps(x, proto))) is MutableUInt16)
+            self.assertTrue(pickle.loads(pickle.dumps(type(x), proto)) is MutableUInt16)
+
+    def test_compact(self):
+        import pickle
+        values = [FixedInt(24)(i) for i in range(1000)]
+        # The size bound assumes protocol 4 (the default since Python 3.8),
+        # whose one-byte MEMOIZE opcodes replace the up to five-byte memo
+        # indices of earlier protocols.
+        data = pickle.dumps(values, protocol=4)
+        self.assertEqual(pickle.loads(data), values)
+        self.assertTrue(len(data) < 10 * len(values))
+
+    def test_arrays(self):
+        import pickle
+        for dtype in (UInt8, FixedInt(13), Int64, FixedInt(100)):
+            a = FixedIntArray(dtype, [0, 1, -1, dtype.minval, dtype.maxval])
+            b = pickle.loads(pickle.dumps(a))
+            self.assertEqual(b.dtype, dtype)
+            self.assertEqual(b, a)
+        a = FixedIntArray.frombuffer(UInt16, bytearray(b'\x01\x00\x02\x00'))
+        b = pickle.loads(pickle.dumps(a))
+        b.append(3)
+        self.assertEqual(b.tolist(), [1, 2, 3])
+        self.assertTrue(len(pickle.dumps(FixedIntArray(UInt32, 1000))) < 4100)
+
+    def test_serialize(self):
+        from fixedint import serialize
+        for dtype in (UInt8, FixedInt(13), UInt32, FixedInt(100), MutableInt16, MutableFixedInt(32, lazy=True)):
+            values = [dtype(v) for v in (0, 1, -1, dtype.minval, dtype.maxval, 12345)]
+            data = serialize.dumps(values)
+            self.assertEqual(len(data), 16 + len(values) * ((dtype.width + 7) // 8))
+            out = serialize.loads(data)
+            self.assertTrue(isinstance(out, list))
+            self.assertEqual([type(x) for x in out], [dtype] * len(values))
+            self.assertEqual(out, values)
+            a = FixedIntArray(dtype, values)
+            out = serialize.loads(serialize.dumps(a))
+            self.assertTrue(isinstance(out, FixedIntArray))
+            self.assertEqual(out, a)
+        self.assertEqual(serialize.loads(serialize.dumps([1, 2, 300], dtype=UInt8)), [1, 2, 44])
+        self.assertEqual(serialize.loads(serialize.dumps((), dtype=UInt8)), [])
+        self.assertRaises(ValueError, serialize.dumps, [])
+        self.assertRaises(ValueError, serialize.loads, b'FXI')
+        self.assertRaises(ValueError, serialize.loads, b'XXX' + bytes(13))
+
+tests.append(PickleTests)
+
+
+# ----------------------------------------------------------------------------
+def _chunk_checksum(chunk):
+    h = UInt32(0)
+    for v in chunk:
+        h = (h ^ v) * 0x01000193
+    return h
+
+def _chunk_negate(chunk):
+    chunk *= -1
+    return len(chunk)
+
+@unittest.skipUnless(sys.version_info >= (3, 8), "requires multiprocessing.shared_memory")
+class ParallelTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from concurrent.futures import ProcessPoolExecutor
+        cls.executor = ProcessPoolExecutor(2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.executor.shutdown()
+
+    def test_reduce(self):
+        import random
+        from functools import reduce
+        from fixedint import parallel
+        rng = random.Random(15)
+        for dtype in (UInt8, Int16, UInt32, Int64):
+            values = [rng.getrandbits(dtype.width) for _ in range(300)]
+            with parallel.SharedArray(dtype, values) as shared:
+                for op, func in [('sum', lambda a, b: a + b), ('xor', lambda a, b: a ^ b),
+                                 ('and', lambda a, b: a & b), ('or', lambda a, b: a | b)]:
+                    expected = dtype(reduce(func, shared.array._data))
+                    for chunksize in (None, 1, 13, 300):
+                        res = parallel.reduce(shared, op, executor=self.executor, chunksize=chunksize)
+                        self.assertTrue(type(res) is dtype)
+                        self.assertEqual(res, expected)
+        with parallel.SharedArray(UInt16, 0) as shared:
+            self.assertEqual(parallel.reduce(shared, 'and', executor=self.executor), 0xffff)
+            self.assertRaises(ValueError, parallel.reduce, shared, 'mul')
+
+    def test_map(self):
+        from fixedint import parallel
+        values = list(range(0, 3000, 7))
+        with parallel.SharedArray(UInt32, values) as shared:
+            res = parallel.map_chunks(_chunk_checksum, shared, executor=self.executor, chunksize=100)
+            self.assertEqual(res, [_chunk_checksum(FixedIntArray(UInt32, values[i:i+100]))
+                                   for i in range(0, len(values), 100)])
+            self.assertEqual(parallel.map_reduce(_chunk_negate, shared, 'sum', executor=self.executor), len(values))
+            self.assertEqual(shared.array, FixedIntArray(UInt32, values) * -1)
+
+    def test_apply(self):
+        from fixedint import parallel
+        with parallel.SharedArray(Int8, range(-100, 100)) as a, parallel.SharedArray(Int8, [3] * 200) as b:
+            expected = FixedIntArray(Int8, range(-100, 100))
+            parallel.apply(a, 'mul', 5, executor=self.executor, chunksize=30)
+            expected *= 5
+            self.assertEqual(a.array, expected)
+            parallel.apply(a, 'xor', b, executor=self.executor)
+            expected ^= 3
+            self.assertEqual(a.array, expected)
+            self.assertRaises(ValueError, parallel.apply, a, 'pow', 2)
+        self.assertRaises(ValueError, parallel.SharedArray, FixedInt(12), 4)
+        self.assertRaises(TypeError, parallel.reduce, FixedIntArray(UInt8, 4))
+
+tests.append(ParallelTests)
+
+
+# ----------------------------------------------------------------------------
+class _Trickle(object):
+    ''' A file returning at most a few bytes per read, like a pipe. '''
+    def __init__(self, data, step, readinto=True):
+        self.data = data
+        self.pos = 0
+        self.step = step
+        if readinto:
+            self.readinto = self._readinto
+
+    def read(self, n=-1):
+        n = min(n, self.step)
+        res = self.data[self.pos:self.pos+n]
+        self.pos += len(res)
+        return res
+
+    def _readinto(self, buf):
+        res = self.read(len(buf))
+        buf[:len(res)] = res
+        return len(res)
+
+class StreamTests(unittest.TestCase):
+    def test_roundtrip(self):
+        import io
+        from fixedint import stream
+        for cls in (UInt8, FixedInt(13), UInt32, MutableInt16, FixedInt(100, signed=False)):
+            values = [cls(v) for v in range(-50, 1000, 3)] + [cls(cls.minval), cls(cls.maxval)]
+            for byteorder in ('little', 'big'):
+                f = io.BytesIO()
+                self.assertEqual(stream.write_values(f, cls, values, byteorder, chunk_size=7), len(values))
+                data = f.getvalue()
+                self.assertEqual(data, b''.join(v.to_bytes(byteorder=byteorder) for v in values))
+                size = (cls.width + 7) // 8
+                sources = [io.BytesIO(data), data, bytearray(data),
+                           _Trickle(data, size + 1), _Trickle(data, 1, readinto=False)]
+                for src in sources:
+                    out = list(stream.iter_values(src, cls, byteorder, chunk_size=5))
+                    self.assertEqual([type(v) for v in out], [cls] * len(values))
+                    self.assertEqual(out, values)
+                chunks = list(stream.iter_values(io.BytesIO(data), cls, byteorder, chunk_size=50, arrays=True))
+                self.assertTrue(all(isinstance(c, FixedIntArray) and len(c) <= 50 for c in chunks))
+                self.assertEqual(sum((c.tolist() for c in chunks), []), values)
+                # arrays and single values may be mixed when writing
+                f = io.BytesIO()
+                self.assertEqual(stream.write_values(f, cls, chunks[:1] + values[50:], byteorder), len(values))
+                self.assertEqual(f.getvalue(), data)
+
+    def test_mmap(self):
+        import mmap
+        import tempfile
+        from fixedint import stream
+        with tempfile.TemporaryFile() as f:
+            stream.write_values(f, UInt32, range(10000), 'big')
+            f.flush()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                out = list(stream.iter_values(m, UInt32, 'big', chunk_size=999, arrays=True))
+                self.assertEqual(sum(len(c) for c in out), 10000)
+                self.assertEqual(out[-1][-1], 9999)
+
+    def test_truncated(self):
+        import io
+        from fixedint import stream
+        for src in (io.BytesIO(b'\x01\x02\x03'), b'\x01\x02\x03', _Trickle(b'\x01\x02\x03', 2, readinto=False)):
+            it = stream.iter_values(src, UInt16)
+            self.assertEqual(next(it), 0x0201)
+            self.assertRaises(ValueError, next, it)
+
+    def test_async(self):
+        import asyncio
+        from fixedint import stream
+        async def collect(chunks, **kwargs):
+            reader = asyncio.StreamReader()
+            for chunk in chunks:
+                reader.feed_data(chunk)
+            reader.feed_eof()
+            return [v async for v in stream.aiter_values(reader, Int16, 'big', **kwargs)]
+        data = b''.join(Int16(v).to_bytes(byteorder='big') for v in range(-500, 500))
+        out = asyncio.run(collect([data[:3], data[3:1001], data[1001:]], chunk_size=64))
+        self.assertEqual(out, list(range(-500, 500)))
+        self.assertTrue(type(out[0]) is Int16)
+        out = asyncio.run(collect([data], arrays=True, chunk_size=300))
+        self.assertEqual([len(c) for c in out], [300, 300, 300, 100])
+        self.assertRaises(ValueError, asyncio.run, collect([b'\x00']))
+
+tests.append(StreamTests)
+
+
+# ----------------------------------------------------------------------------
+class InternTests(unittest.TestCase):
+    def test_no_attributes(self):
+        a = UInt8(3)
+        self.assertRaises(AttributeError, setattr, a, 'tag', 'x')
+        self.assertFalse(hasattr(UInt8(1) + 2, 'tag'))
+        for cls in (UInt8, Int16, UInt32, FixedInt(77)):
+            self.assertFalse(hasattr(cls(1), '__dict__'))
+
+    def test_lazy_table(self):
+        cls = FixedInt(7, signed=False)
+        cls.set_value_cache()
+        # Values are interned on first use, not when the class is created.
+        self.assertEqual(len(cls._box.__self__), 0)
+        self.assertTrue(cls(5) is cls(5))
+        self.assertEqual(len(cls._box.__self__), 1)
+
+    def test_small_widths(self):
+        import operator
+        for cls in (UInt8, Int8, FixedInt(3), UInt16, Int16):
+            x = cls(-5)
+            self.assertTrue(cls(-5) is x)
+            self.assertTrue(cls(int(x) + (1 << cls.width)) is x)
+            for op in (operator.add, operator.mul, operator.xor, operator.lshift):
+                self.assertTrue(op(x, 3) is cls(op(int(x), 3)))
+            self.assertTrue(-x is cls(-int(x)))
+            self.assertTrue(x.rotl(1) is cls(int(x) << 1 | int(x) >> (cls.width - 1) & 1))
+            self.assertTrue(cls.add_with_flags(x, 1)[0] is cls(int(x) + 1))
+            self.assertTrue(cls.from_bytes(x.to_bytes()) is x)
+        self.assertFalse(MutableUInt8(5) is MutableUInt8(5))
+
+    def test_other_paths(self):
+        import pickle
+        from fixedint import serialize
+        from fixedint.bitstruct import BitStruct
+        x = UInt8(77)
+        self.assertTrue(pickle.loads(pickle.dumps(x)) is x)
+        self.assertTrue(serialize.loads(serialize.dumps([x]))[0] is x)
+        self.assertTrue(FixedIntArray(UInt8, [77])[0] is x)
+        rec = BitStruct('R', [('a', 0, 8, UInt8), ('b', 8, 16, Int8)], byteorder='little').decode(b'\x4d\xff')
+        self.assertTrue(rec.a is x)
+        self.assertTrue(rec.b is Int8(-1))
+        @kernel(strict=True)
+        def f(a: UInt8) -> UInt8:
+            return a * 7 + 1
+        self.assertTrue(f(UInt8(11)) is UInt8(78))
+
+    def test_set_value_cache(self):
+        cls = FixedInt(40, signed=False)
+        try:
+            self.assertFalse(cls(5) is cls(5))
+            cls.set_value_cache(2)
+            self.assertTrue(cls(5) is cls(5))
+            self.assertTrue(cls(2) + 3 is cls(5))
+            cls(6), cls(7), cls(8)
+            self.assertEqual(cls._box.cache_info().currsize, 2)
+            self.assertEqual(cls(-1), cls.maxval)
+            cls.set_value_cache(0)
+            self.assertFalse(cls(5) is cls(5))
+            self.assertEqual(cls(5) + 3, 8)
+            cls.set_value_cache()
+            self.assertFalse(cls(5) is cls(5))
+        finally:
+            cls.set_value_cache()
+        try:
+            UInt8.set_value_cache(0)
+            self.assertFalse(UInt8(5) + 1 is UInt8(6))
+        finally:
+            UInt8.set_value_cache()
+        self.assertTrue(UInt8(5) + 1 is UInt8(6))
+        self.assertRaises(TypeError, MutableUInt8.set_value_cache, 10)
+        self.assertRaises(ValueError, UInt32.set_value_cache, -1)
+
+    def test_subclassing(self):
+        from fixedint.util import HexFormattingMixin
+        class MyUInt8(HexFormattingMixin, UInt8):  # type: ignore[misc]
+            pass
+        self.assertEqual(type(MyUInt8(5)), MyUInt8)
+        self.assertEqual(str(MyUInt8(32)), '0x20')
+        self.assertTrue(UInt8(5) is UInt8(5))
+        class MyUInt32(HexFormattingMixin, UInt32):  # type: ignore[misc]
+            pass
+        try:
+            UInt32.set_value_cache(10)
+            self.assertEqual(type(MyUInt32(5)), MyUInt32)
+            self.assertEqual(str(MyUInt32(32)), '0x00000020')
+            self.assertTrue(UInt32(5) is UInt32(5))
+        finally:
+            UInt32.set_value_cache()
+
+tests.append(InternTests)
+
+
+# ----------------------------------------------------------------------------
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class InteropTests(unittest.TestCase):
+    def test_types(self):
+        import ctypes
+        from fixedint import interop
+        self.assertTrue(interop.ctypes_type(UInt8) is ctypes.c_uint8)
+        self.assertTrue(interop.ctypes_type(FixedInt(12)) is ctypes.c_int16)
+        self.assertTrue(interop.ctypes_type(FixedInt(33, signed=False)) is ctypes.c_uint64)
+        self.assertTrue(interop.fixedint_type(ctypes.c_int32) is Int32)
+        self.assertTrue(interop.fixedint_type(ctypes.c_ulonglong) is UInt64)
+        self.assertRaises(TypeError, interop.ctypes_type, FixedInt(65))
+        self.assertRaises(TypeError, interop.fixedint_type, ctypes.c_double)
+
+    def test_ctypes(self):
+        import ctypes
+        from fixedint import interop
+        a = FixedIntArray(FixedInt(12), [1, -1, 2047])
+        c = interop.to_ctypes(a)
+        self.assertEqual(list(c), [1, -1, 2047])
+        c[0] = 5
+        self.assertEqual(a[0], 5)
+        c = (ctypes.c_uint16 * 3)(1, 2, 3)
+        b = interop.from_ctypes(c)
+        self.assertTrue(b.dtype is UInt16)
+        b[1] -= 3
+        self.assertEqual(list(c), [1, 0xffff, 3])
+        self.assertEqual(interop.from_ctypes(c, FixedInt(16, signed=False)).tolist(), [1, 0xffff, 3])
+        self.assertRaises(ValueError, interop.from_ctypes, (ctypes.c_int16 * 2)(1, 5000), FixedInt(12))
+        self.assertRaises(TypeError, interop.from_ctypes, c, Int16)
+        self.assertRaises(TypeError, interop.to_ctypes, FixedIntArray(FixedInt(100), 2))
+
+    def test_memoryview(self):
+        from fixedint import interop
+        a = FixedIntArray(UInt32, [1, 2, 3])
+        mv = interop.as_memoryview(a)
+        # Arrays don't export the buffer protocol themselves: on Python 3.12+,
+        # int() would parse the buffer as text.
+        self.assertRaises(TypeError, int, FixedIntArray(UInt8, [0x31, 0x32]))
+        self.assertEqual(mv.tolist(), [1, 2, 3])
+        mv[0] = 7
+        self.assertEqual(a[0], 7)
+
+    @unittest.skipUnless(numpy, "requires numpy")
+    def test_numpy(self):
+        from fixedint import interop
+        self.assertEqual(interop.numpy_dtype(UInt8), numpy.uint8)
+        self.assertEqual(interop.numpy_dtype(FixedInt(24)), numpy.int32)
+        self.assertTrue(interop.fixedint_type('uint16') is UInt16)
+        a = FixedIntArray(UInt32, [1, 2, 0xffffffff])
+        n = interop.to_numpy(a)
+        self.assertEqual(n.dtype, numpy.uint32)
+        n[0] = 9
+        self.assertEqual(a[0], 9)
+        self.assertEqual(interop.to_numpy(a, copy=True).tolist(), [9, 2, 0xffffffff])
+        self.assertEqual(numpy.asarray(a).tolist(), [9, 2, 0xffffffff])
+        b = interop.from_numpy(n[1:])
+        self.assertTrue(b.dtype is UInt32)
+        b[0] += 1
+        self.assertEqual(n[1], 3)
+
+    @unittest.skipUnless(numpy, "requires numpy")
+    def test_numpy_conversion(self):
+        from fixedint import interop
+        n = numpy.array([-1, 0, 2047, 4096, 5000], dtype=numpy.int64)
+        for cls in (FixedInt(12), FixedInt(12, signed=False), UInt8, Int64, FixedInt(33)):
+            self.assertEqual(interop.from_numpy(n, cls).tolist(), FixedIntArray(cls, n.tolist()).tolist())
+        n16 = numpy.array([1, -5, 2047], dtype=numpy.int16)
+        b = interop.from_numpy(n16, FixedInt(12))
+        b[0] = 3
+        self.assertEqual(n16[0], 3)
+        b = interop.from_numpy(n16, FixedInt(12), copy=True)
+        b[0] = 4
+        self.assertEqual(n16[0], 3)
+        self.assertRaises(ValueError, interop.from_numpy, numpy.zeros((2, 2), dtype=numpy.int8))
+        self.assertRaises(TypeError, interop.from_numpy, numpy.zeros(2))
+
+tests.append(InteropTests)
+
+
+# ----------------------------------------------------------------------------
+class PackedTests(unittest.TestCase):
+    def test_roundtrip(self):
+        import random
+        rnd = random.Random(19)
+        for width in (1, 5, 12, 24, 48, 64, 70):
+            for signed in (False, True):
+                cls = FixedInt(width, signed)
+                vals = [rnd.randrange(cls.minval, cls.maxval + 1) for _ in range(301)]
+                a = PackedArray(cls, vals)
+                self.assertEqual(len(a), 301)
+                self.assertEqual(a.nbytes, (301 * width + 7) // 8)
+                self.assertEqual(a.tolist(), vals)
+                self.assertEqual(a.decode(), FixedIntArray(cls, vals))
+                for i in (0, 1, 7, 8, 150, 299, 300, -1):
+                    self.assertEqual(a[i], vals[i])
+                    self.assertEqual(type(a[i]), cls)
+                self.assertEqual(PackedArray.frombytes(cls, a.tobytes(), 301), a)
+
+    def test_set(self):
+        cls = FixedInt(12)
+        a = PackedArray(cls, 20)
+        a[3] = 0x7ff
+        a[4] = -1
+        a[5] = 0x1234
+        a[-1] += 5
+        self.assertEqual(a.tolist()[2:7], [0, 0x7ff, -1, 0x234, 0])
+        self.assertEqual(a[19], 5)
+        self.assertEqual(a.tobytes()[4:9], b'\xf0\x7f\xff\x4f\x23')
+        self.assertRaises(IndexError, a.__getitem__, 20)
+        self.assertRaises(IndexError, a.__setitem__, -21, 0)
+
+    def test_views(self):
+        cls = FixedInt(5, signed=False)
+        vals = list(range(32)) * 3
+        a = PackedArray(cls, vals)
+        v = a[3:90]
+        self.assertEqual(v.tolist(), vals[3:90])
+        v[0] = 31
+        self.assertEqual(a[3], 31)
+        w = v[10::7]
+        self.assertEqual(w.tolist(), vals[13:90:7])
+        w.encode([0] * len(w))
+        self.assertEqual(a[20], 0)
+        a[::-1] = vals
+        self.assertEqual(a.tolist(), vals[::-1])
+        a[9:50] = range(41)
+        self.assertEqual(a[9:50].tolist(), list(range(32)) + list(range(9)))
+        self.assertEqual(a[9:50].tobytes(), PackedArray(cls, a[9:50].decode()).tobytes())
+        self.assertRaises(ValueError, a.__setitem__, slice(0, 5), [1, 2])
+        self.assertRaises(ValueError, v.encode, [0] * 10, 80)
+
+tests.append(PackedTests)
+
+
+# ----------------------------------------------------------------------------
+class MemoryTests(unittest.TestCase):
+    def test_odd_width(self):
+        from fixedint.memory import Memory
+        UInt12 = FixedInt(12, signed=False)
+        Int12 = FixedInt(12)
+        mem = Memory(page_size=16, byteorder='little')
+        for addr in (0, 15):        # within a page and across a page boundary
+            mem.store(addr, 0x1fff, cls=UInt12)
+            self.assertEqual(mem.read(addr, 2), b'\xff\x0f')
+            self.assertEqual(mem.load(addr, UInt12), 0xfff)
+            mem.store(addr, 0x1800, cls=Int12)
+            self.assertEqual(mem.read(addr, 2), Int12(0x1800).to_bytes())
+            self.assertEqual(mem.load(addr, Int12), -0x800)
+            mem.store(addr, UInt12(0xabc))
+            self.assertEqual(mem.load(addr, UInt12), 0xabc)
+
+    def test_typed(self):
+        from fixedint.memory import Memory
+        mem = Memory(page_size=16, byteorder='little')
+        self.assertEqual(mem.load(0x1234, UInt64), 0)
+        self.assertEqual(mem.allocated, 0)
+        mem.store(0x1000, UInt32(0xdeadbeef))
+        x = mem.load(0x1002, UInt16)
+        self.assertEqual(x, 0xdead)
+        self.assertEqual(type(x), UInt16)
+        self.assertEqual(mem.load(0x1000, UInt32, 'big'), 0xefbeadde)
+        self.assertEqual(mem.load(0x1003, Int8), -34)
+        mem.store(0x2000, -2, cls=FixedInt(24))
+        self.assertEqual(mem.read(0x2000, 3), b'\xfe\xff\xff')
+        self.assertEqual(mem.load(0x2000, FixedInt(24)), -2)
+        self.assertEqual(mem.load(0x2000, FixedInt(12, signed=False)), 0xffe)
+        x = MutableUInt16(7)
+        mem.store(0x3000, x, 'big')
+        self.assertEqual(mem.read(0x3000, 2), b'\x00\x07')
+        self.assertEqual(mem.pages(), [0x1000, 0x2000, 0x3000])
+        self.assertRaises(TypeError, mem.store, 0, 5)
+        self.assertRaises(IndexError, mem.load, -1, UInt8)
+        self.assertRaises(IndexError, mem.store, (1 << 64) - 2, UInt32(1))
+
+    def test_page_crossing(self):
+        from fixedint.memory import Memory
+        mem = Memory(page_size=16, byteorder='big', cache_size=2)
+        mem.store(13, UInt64(0x0102030405060708))
+        self.assertEqual(mem.read(13, 8), bytes(range(1, 9)))
+        self.assertEqual(mem.load(13, UInt64), 0x0102030405060708)
+        self.assertEqual(mem.load(14, FixedInt(24)), 0x020304)
+        self.assertEqual(mem.pages(), [0, 16])
+        data = bytes(range(100))
+        self.assertEqual(mem.write(0x105, data), 100)
+        buf = bytearray(120)
+        with memoryview(buf) as mv:
+            mem.readinto(0x100, mv[10:])
+        self.assertEqual(buf, bytes(15) + data + bytes(5))
+        # Reads through the page cache see later writes to the same page.
+        for addr in range(0, 64, 4):
+            mem.load(addr, UInt32)
+        for addr in range(0, 64, 4):
+            mem.store(addr, UInt32(addr))
+        for addr in range(0, 64, 4):
+            self.assertEqual(mem.load(addr, UInt32), addr)
+        mem.clear()
+        self.assertEqual(mem.load(8, UInt32), 0)
+        self.assertEqual(mem.allocated, 0)
+
+    def test_arrays(self):
+        from fixedint.memory import Memory
+        mem = Memory(page_size=64)
+        a = FixedIntArray(Int16, range(-50, 50))
+        mem.store_array(0x30, a, byteorder='big')
+        self.assertEqual(mem.load_array(0x30, Int16, 100, 'big'), a)
+        self.assertEqual(mem.load(0x32, Int16, 'big'), -49)
+        mem.store_array(0, [1, 2, 0x1ff], cls=UInt8)
+        self.assertEqual(mem.load_array(0, UInt8, 4).tolist(), [1, 2, 0xff, 0])
+
+tests.append(MemoryTests)
+
+
+# ----------------------------------------------------------------------------
+class AtomicTests(unittest.TestCase):
+    def test_methods(self):
+        x = MutableUInt8(250)
+        old = x.fetch_add(10)
+        self.assertEqual((old, x), (250, 4))
+        self.assertEqual(type(old), MutableUInt8)
+        self.assertFalse(old is x)
+        self.assertEqual((x.fetch_sub(5), x), (4, 255))
+        self.assertEqual((x.fetch_and(0x0f), x), (255, 0x0f))
+        self.assertEqual((x.fetch_or(0x30), x), (0x0f, 0x3f))
+        self.assertEqual((x.fetch_xor(UInt8(1)), x), (0x3f, 0x3e))
+        self.assertEqual((x.exchange(300), x), (0x3e, 44))
+        self.assertFalse(x.compare_exchange(45, 1))
+        self.assertEqual(x, 44)
+        self.assertTrue(x.compare_exchange(300, -1))
+        self.assertEqual(x, 255)
+        y = MutableInt8(127)
+        self.assertEqual((y.fetch_add(1), y), (127, -128))
+        self.assertTrue(y.compare_exchange(128, 0))
+        z = MutableFixedInt(32, lazy=True)(5)
+        self.assertEqual((z.fetch_add(1 << 32), z), (5, 5))
+        self.assertEqual((z.fetch_sub(6), z), (5, -1))
+        self.assertFalse(hasattr(UInt8, 'fetch_add'))
+
+    def test_views(self):
+        from fixedint.registers import view
+        buf = bytearray(4)
+        v = view(UInt16, buf, 1, 'little')
+        self.assertEqual(v.fetch_add(0x1234), 0)
+        self.assertEqual(buf, b'\x00\x34\x12\x00')
+        old = v.exchange(1)
+        self.assertEqual(type(old), MutableUInt16)
+        self.assertEqual(buf, b'\x00\x01\x00\x00')
+
+    def test_threads(self):
+        import threading
+        counter = MutableUInt32(0)
+        bits = MutableUInt64(0)
+        def worker(i):
+            for _ in range(2000):
+                counter.fetch_add(1)
+                counter.fetch_sub(0x100000001)
+            bits.fetch_or(1 << i)
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        # Switch threads often, so that updates would interleave if they weren't atomic.
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            sys.setswitchinterval(interval)
+        self.assertEqual(counter, 0)
+        self.assertEqual(bits, 0xff)
+
+tests.append(AtomicTests)
+
+
+# ----------------------------------------------------------------------------
+class TraceTests(unittest.TestCase):
+    def test_instance(self):
+        import pickle
+        from fixedint import trace
+        buf = trace.TraceBuffer(8)
+        x = MutableUInt8(250)
+        y = MutableUInt8(1)
+        trace.trace(x, buf, 'x')
+        x += 10
+        y += 1
+        x[0] = 1
+        x.fetch_add(3)
+        x.iadd_with_flags(1)
+        R = trace.TraceRecord
+        self.assertEqual(buf.records(), [R('__iadd__', 'x', 250, 4), R('__setitem__', 'x', 4, 5),
+                                         R('fetch_add', 'x', 5, 8), R('iadd_with_flags', 'x', 8, 9)])
+        self.assertTrue(isinstance(x, MutableUInt8))
+        self.assertEqual(repr(x), 'MutableUInt8(9)')
+        self.assertEqual(type(pickle.loads(pickle.dumps(x))), MutableUInt8)
+        self.assertEqual(type(x + 1), MutableUInt8)
+        trace.untrace(x)
+        self.assertEqual(type(x), MutableUInt8)
+        x += 1
+        self.assertEqual(len(buf), 4)
+        self.assertRaises(TypeError, trace.trace, UInt8(1), buf)
+
+    def test_class(self):
+        from fixedint import trace
+        from fixedint.registers import RegisterFile
+        cls = MutableFixedInt(20)
+        buf = trace.TraceBuffer(3)
+        z = cls(-1)
+        trace.trace_class(cls, buf)
+        z -= 0x80000
+        z <<= 1
+        cls(5).fetch_or(2)
+        z += 1
+        trace.untrace_class(cls)
+        z += 1
+        R = trace.TraceRecord
+        self.assertEqual(buf.records(), [R('__ilshift__', 'MutableInt20', 0x7ffff, -2),
+                                         R('fetch_or', 'MutableInt20', 5, 7),
+                                         R('__iadd__', 'MutableInt20', -2, -1)])
+        self.assertEqual((buf.total, buf.dropped), (4, 1))
+        regs = RegisterFile([('eax', UInt32, 0), ('al', UInt8, 0)])
+        trace.trace(regs.al, buf, 'al')
+        regs.al += 5
+        self.assertEqual(buf.records()[-1], R('__iadd__', 'al', 0, 5))
+        self.assertEqual(regs.eax, 5)
+
+    def test_dump(self):
+        import io
+        from fixedint import trace
+        buf = trace.TraceBuffer(4)
+        a = trace.trace(MutableUInt64(0), buf, 'a')
+        b = trace.trace(MutableFixedInt(100)(0), buf, 'b')
+        a -= 1
+        b -= 1
+        a.exchange(1 << 63)
+        f = io.BytesIO()
+        buf.dump(f)
+        f.seek(0)
+        records = trace.load(f)
+        self.assertEqual(records, buf.records())
+        self.assertEqual([r.new for r in records], [(1 << 64) - 1, -1, 1 << 63])
+        self.assertRaises(ValueError, trace.load, io.BytesIO(b'XXX' + bytes(21)))
+
+tests.append(TraceTests)
+
+
+# ----------------------------------------------------------------------------
+class ExprTests(unittest.TestCase):
+    def test_matches_eager(self):
+        import random
+        from fixedint import expr
+        rnd = random.Random(23)
+        xs = FixedIntArray(Int16, [rnd.randrange(-32768, 32768) for _ in range(300)])
+        ys = FixedIntArray(UInt8, [rnd.randrange(256) for _ in range(300)])
+        zs = FixedIntArray(FixedInt(70), [rnd.randrange(-1 << 69, 1 << 69) for _ in range(300)])
+        a, b, c = expr.defer(xs), expr.defer(ys), expr.defer(zs)
+        s = a + b
+        deferred = [s * 3, (s ^ (s >> 2)) & 0x1ffff, -(a + b) + UInt32(7), ~b, 5 - b | 0x100,
+                    (c * s) >> 3, s // 7 % 5, +a << 4]
+        S = xs + ys
+        eager = [S * 3, (S ^ (S >> 2)) & 0x1ffff, -(xs + ys) + UInt32(7), ~ys, 5 - ys | 0x100,
+                 (zs * S) >> 3, S // 7 % 5, +xs << 4]
+        for block_size in (7, 300, 65536):
+            results = expr.evaluate(*deferred, block_size=block_size)
+            for res, ref in zip(results, eager):
+                self.assertEqual(res.dtype, ref.dtype)
+                self.assertEqual(res, ref)
+        self.assertEqual(s.evaluate(), S)
+
+    def test_scalars(self):
+        from fixedint import expr
+        x = MutableInt8(100)
+        e = expr.defer(x) + 100
+        x += 1
+        self.assertEqual(expr.evaluate(e, expr.defer(UInt8(3)) * 5), [Int8(-56), UInt8(15)])
+        self.assertEqual(type(e.evaluate()), Int8)
+        self.assertRaises(TypeError, lambda: expr.defer(1) + 2)
+        self.assertRaises(TypeError, expr.evaluate, 1)
+        self.assertRaises(TypeError, expr.defer, 1.5)
+
+    def test_sharing(self):
+        from fixedint import expr
+        from fixedint.expr import _compile
+        a = expr.defer(FixedIntArray(UInt32, range(10)))
+        b = expr.defer(FixedIntArray(UInt32, range(10)))
+        # Structurally equal subexpressions are computed once.
+        kernel, arrays, scalars = _compile([(a + b) * (a + b), (a + b) ^ 1])
+        self.assertEqual(len(arrays), 2)
+        self.assertEqual(kernel.__code__.co_varnames.count('t0'), 1)
+        self.assertFalse('t3' in kernel.__code__.co_varnames)
+        self.assertRaises(ValueError, lambda: a + expr.defer(FixedIntArray(UInt32, 3)))
+        self.assertEqual(len(a * 2), 10)
+
+    def test_scalar_left(self):
+        from fixedint import expr
+        a = expr.defer(FixedIntArray(UInt8, [1, 2, 250]))
+        r1, r2 = expr.evaluate(UInt16(3) * a, MutableUInt8(2) - a)
+        self.assertEqual(r1, FixedIntArray(UInt16, [3, 6, 750]))
+        self.assertEqual(r2, FixedIntArray(UInt8, [1, 0, 8]))
+        self.assertEqual(expr.evaluate(UInt8(7) & a)[0], FixedIntArray(UInt8, [1, 2, 2]))
+
+tests.append(ExprTests)
+
+
+# ----------------------------------------------------------------------------
+class ClassCacheTests(unittest.TestCase):
+    def tearDown(self):
+        set_class_cache()
+
+    def test_lru(self):
+        import gc
+        from fixedint import base
+        set_class_cache(2)
+        info = class_cache_info()
+        self.assertEqual(info.maxsize, 2)
+        self.assertTrue(info.currsize <= 2)
+        keys = [(w, False, False) for w in (201, 202, 203)]
+        for key in keys:
+            base._class_cache.pop(key, None)
+        set_class_cache(0)
+        set_class_cache(2)
+        before = class_cache_info().evictions
+        FixedInt(201, signed=False)
+        FixedInt(202, signed=False)
+        FixedInt(201, signed=False)     # 201 is now more recent than 202
+        FixedInt(203, signed=False)     # evicts 202
+        self.assertEqual(list(base._class_lru), [keys[0], keys[2]])
+        self.assertEqual(class_cache_info().evictions - before, 1)
+        gc.collect()
+        self.assertFalse(keys[1] in base._class_cache)
+        self.assertTrue(keys[0] in base._class_cache)
+        set_class_cache(1)
+        self.assertEqual(class_cache_info().evictions - before, 2)
+
+    def test_limits(self):
+        set_class_cache(0)
+        self.assertEqual(class_cache_info().currsize, 0)
+        # Classes are still shared while they are referenced.
+        self.assertTrue(FixedInt(204) is FixedInt(204))
+        self.assertEqual(class_cache_info().currsize, 0)
+        set_class_cache()
+        FixedInt(204)
+        self.assertEqual(class_cache_info().maxsize, 128)
+        self.assertEqual(class_cache_info().currsize, 1)
+        self.assertRaises(ValueError, set_class_cache, -1)
+
+    def test_promotions_weak(self):
+        import gc
+        import weakref
+        from fixedint import trace
+        set_class_cache(0)
+        cls = FixedInt(91)
+        self.assertEqual(type(UInt32(5) + cls(1)), cls)
+        self.assertEqual(type(MutableUInt32(5) + cls(1)), cls)
+        r = weakref.ref(cls)
+        del cls
+        gc.collect()
+        self.assertTrue(r() is None)
+        self.assertEqual(type(UInt32(5) + FixedInt(91)(1)), FixedInt(91))
+
+        # Mixing with traced instances doesn't keep the trace buffer alive.
+        buf = trace.TraceBuffer(16)
+        x = trace.trace(MutableUInt16(3), buf)
+        self.assertEqual(UInt32(1) + x, 4)
+        r = weakref.ref(buf)
+        del buf, x
+        gc.collect()
+        self.assertTrue(r() is None)
+
+tests.append(ClassCacheTests)
+
+
 # ----------------------------------------------------------------------------
 def run(verbosity=1, repeat=1):
     suite = unittest.TestSuite()
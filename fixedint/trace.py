@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+''' Recording writes to mutable integers in a ring buffer.
+
+trace() starts recording every write to one mutable instance, and
+trace_class() every write to all instances of a mutable class. Each write by an
+in-place operator, slice assignment, i*_with_flags or atomic method is stored
+in a TraceBuffer as (operator, tag, old value, new value), where the tag is a
+label given when tracing started:
+
+    from fixedint import trace
+    buf = trace.TraceBuffer(1 << 16)
+    trace.trace(regs.pc, buf, 'pc')
+    trace.trace_class(MutableUInt8, buf)
+    run_emulator()
+    buf.dump('run.trace')                   # or buf.records()
+    for rec in trace.load('run.trace'):
+        print(rec.op, rec.tag, rec.old, rec.new)
+
+Tracing an instance changes its class to a traced subclass, and tracing a class
+replaces its methods, so instances and classes which are not traced run at full
+speed. A TraceBuffer keeps the latest `capacity` records in a preallocated
+array; older records are overwritten.
+'''
+
+import struct
+import sys
+from array import array
+from collections import namedtuple
+from weakref import WeakKeyDictionary
+from fixedint import base
+from fixedint.base import MutableFixedInt
+
+__all__ = ['TraceBuffer', 'TraceRecord', 'trace', 'untrace', 'trace_class', 'untrace_class', 'load']
+
+TraceRecord = namedtuple('TraceRecord', 'op tag old new')
+
+# Methods which write to an instance. A record's operator is its index here.
+_write_names = (['__i%s__' % f.split(',')[0] for f in base._inplace_func] + ['__ipow__', '__setitem__'] +
+                ['i%s_with_flags' % op[0] for op in base._flag_ops] +
+                ['fetch_%s' % fn for fn, op in base._atomic_ops] + ['exchange', 'compare_exchange'])
+_M64 = (1 << 64) - 1
+
+_magic = b'FXT'
+_version = 1
+# magic, version, number of operator names, number of tags, number of records, total writes
+_header = struct.Struct('<3sBIIIQ')
+# width, signed, label length
+_tag_header = struct.Struct('<H?H')
+
+
+class TraceBuffer(object):
+    ''' A ring buffer holding the latest capacity trace records.
+
+    Each record takes three 64-bit words. Values wider than 64 bits are
+    recorded modulo 2**64.
+    '''
+
+    def __init__(self, capacity=65536):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self._data = array('Q', bytes(24 * capacity))
+        self._next = 0
+        self.total = 0
+        # (label, width, signed) of each tag, and the index of each
+        self._tags = []
+        self._tag_index = {}
+        # Traced subclasses used by trace(), by (class, tag)
+        self._subclasses = {}
+
+    def _tag(self, label, cls):
+        key = (str(label), min(cls.width, 64), cls.signed)
+        try:
+            return self._tag_index[key]
+        except KeyError:
+            idx = self._tag_index[key] = len(self._tags)
+            self._tags.append(key)
+            return idx
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    @property
+    def dropped(self):
+        ''' Number of records overwritten by newer ones. '''
+        return self.total - len(self)
+
+    def clear(self):
+        ''' Discard all records. Tags are kept. '''
+        self._next = 0
+        self.total = 0
+
+    def _ordered(self):
+        ''' Return the raw records, oldest first, as an array of 3n words. '''
+        if self.total <= self.capacity:
+            return self._data[:self._next]
+        return self._data[self._next:] + self._data[:self._next]
+
+    def records(self):
+        ''' Return the records, oldest first, as a list of TraceRecords. '''
+        return _decode(_write_names, self._tags, self._ordered())
+
+    def dump(self, file):
+        ''' Write the records, oldest first, to a binary file object or path. '''
+        if isinstance(file, str):
+            with open(file, 'wb') as f:
+                return self.dump(f)
+        data = self._ordered()
+        parts = [_header.pack(_magic, _version, len(_write_names), len(self._tags), len(data) // 3, self.total)]
+        for name in _write_names:
+            parts.append(struct.pack('<B', len(name)) + name.encode('ascii'))
+        for label, width, signed in self._tags:
+            label = label.encode('utf-8')
+            parts.append(_tag_header.pack(width, signed, len(label)) + label)
+        if sys.byteorder != 'little':
+            data.byteswap()
+        parts.append(data.tobytes())
+        file.write(b''.join(parts))
+
+def _decode(names, tags, data):
+    conv = []
+    for label, width, signed in tags:
+        m = (1 << width) - 1
+        h = (1 << (width - 1)) if signed else 0
+        conv.append((label, m, h))
+    res = []
+    for i in range(0, len(data), 3):
+        word = data[i]
+        label, m, h = conv[word & 0xffffffff]
+        res.append(TraceRecord(names[word >> 32], label, ((data[i+1] & m) ^ h) - h, ((data[i+2] & m) ^ h) - h))
+    return res
+
+def load(file):
+    ''' Read the records written by TraceBuffer.dump from a binary file object
+    or path, as a list of TraceRecords. '''
+    if isinstance(file, str):
+        with open(file, 'rb') as f:
+            return load(f)
+    raw = file.read()
+    magic, version, nops, ntags, count, total = _header.unpack_from(raw, 0)
+    if magic != _magic:
+        raise ValueError("not a fixedint trace")
+    if version != _version:
+        raise ValueError("unsupported trace version %d" % version)
+    pos = _header.size
+    names = []
+    for _ in range(nops):
+        n = raw[pos]
+        names.append(raw[pos+1:pos+1+n].decode('ascii'))
+        pos += 1 + n
+    tags = []
+    for _ in range(ntags):
+        width, signed, n = _tag_header.unpack_from(raw, pos)
+        pos += _tag_header.size
+        tags.append((raw[pos:pos+n].decode('utf-8'), width, signed))
+        pos += n
+    data = array('Q')
+    data.frombytes(raw[pos:pos + 24 * count])
+    if len(data) != 3 * count:
+        raise ValueError("truncated trace")
+    if sys.byteorder != 'little':
+        data.byteswap()
+    return _decode(names, tags, data)
+
+
+## Method wrappers
+def _wrap(orig, buffer, op, tag):
+    data = buffer._data
+    end = len(data)
+    word = op << 32 | tag
+    def _f(self, *args):
+        old = self._val
+        res = orig(self, *args)
+        i = buffer._next
+        data[i] = word
+        data[i+1] = old & _M64
+        data[i+2] = self._val & _M64
+        i += 3
+        buffer._next = 0 if i == end else i
+        buffer.total += 1
+        return res
+    _f.__name__ = orig.__name__
+    _f.__doc__ = orig.__doc__
+    return _f
+
+# Originals of the methods replaced by trace_class, by class
+_saved = WeakKeyDictionary()
+
+def _original(cls, name):
+    ''' Look up a method of cls, bypassing any replaced by trace_class. '''
+    for klass in cls.__mro__:
+        saved = _saved.get(klass)
+        if saved is not None and name in saved:
+            if saved[name] is not None:
+                return saved[name]
+        elif name in klass.__dict__:
+            return klass.__dict__[name]
+    return None
+
+def _methods(cls, buffer, label):
+    if not (isinstance(cls, type) and issubclass(cls, MutableFixedInt)):
+        raise TypeError("only mutable FixedInt classes can be traced")
+    tag = buffer._tag(cls.__name__ if label is None else label, cls)
+    methods = {}
+    for op, name in enumerate(_write_names):
+        orig = _original(cls, name)
+        if orig is not None:
+            methods[name] = _wrap(orig, buffer, op, tag)
+    return methods
+
+def _base_class(cls):
+    return cls.__dict__.get('_trace_base', cls)
+
+def trace(obj, buffer, tag=None):
+    ''' Record the writes to the mutable instance obj in buffer, labelled with
+    tag (by default, the class name). Replaces any previous trace of obj. '''
+    cls = _base_class(type(obj))
+    key = (cls, tag)
+    try:
+        sub = buffer._subclasses[key]
+    except KeyError:
+        dict = _methods(cls, buffer, tag)
+        dict['__slots__'] = ()
+        dict['__module__'] = cls.__module__
+        # Results of arithmetic on a traced instance are not traced.
+        dict['__new__'] = lambda sub, val=0, base=None: cls(val, base)
+        dict['_trace_base'] = cls
+        dict['_internal_subclass'] = True
+        sub = buffer._subclasses[key] = type(cls)(cls.__name__, (cls,), dict)
+    obj.__class__ = sub
+    return obj
+
+def untrace(obj):
+    ''' Stop recording the writes to obj. '''
+    obj.__class__ = _base_class(type(obj))
+    return obj
+
+def trace_class(cls, buffer, tag=None):
+    ''' Record the writes to every instance of the mutable class cls in buffer,
+    labelled with tag (by default, the class name). Instances traced with
+    trace() are recorded only in their own buffer. '''
+    untrace_class(cls)
+    saved = {}
+    for name, f in _methods(cls, buffer, tag).items():
+        saved[name] = cls.__dict__.get(name)
+        setattr(cls, name, f)
+    _saved[cls] = saved
+
+def untrace_class(cls):
+    ''' Stop recording the writes to instances of cls. '''
+    saved = _saved.pop(cls, None)
+    if saved is None:
+        return
+    for name, orig in saved.items():
+        if orig is None:
+            delattr(cls, name)
+        else:
+            setattr(cls, name, orig)
@@ -1,4 +1,6 @@
 class HexFormattingMixin(object):
+    __slots__ = ()
+
     def __str__(self):
         n = int(self)
         width = (self.width + 3) // 4